@@ -2,10 +2,18 @@
 Aggregate scores from the Sidewalk Inventory and Assessment.
 """
 
+import argparse
 import arcpy
+import numpy as np
 import os
 from config import SS_PATH, CR_PATH, CW_PATH, PS_PATH, ZONE_PATH, \
-    RESULT_PATH
+    RESULT_PATH, RUN_LOG_DIR, SCHEMA_CACHE_PATH, SCHEMA_CACHE_MAX_AGE, \
+    ZONE_ID_FIELD, ZONE_HIERARCHY_PATH, ZONE_LEVELS, HEX_LEVELS, \
+    SKETCH_SCORES, SKETCH_QUANTILES
+from hexbin import bin_points, bin_lines, hex_corners
+from instrument import RunLog
+from schema_cache import SchemaCache
+from zone_hierarchy import ZoneTotals, read_hierarchy
 
 
 FEATURE_CLASSES = [
@@ -33,132 +41,425 @@ def clear_memory_layers():
         if arcpy.Exists(memory_path(layer_name)):
             arcpy.Delete_management(memory_path(layer_name))
 
-target_path = ZONE_PATH
-
-for (fc_name, fc_label, fc_path) in FEATURE_CLASSES:
-    # Create a wildcard for score fields.
-    score_wildcard = fc_name + 'Score*'
-
-    # Update field types and labels.
-    field_mappings = arcpy.FieldMappings()
-    for field in arcpy.ListFields(fc_path, 'Score*'):
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(fc_path, field.name)
-        output_field = field_map.outputField
-        output_field.type = 'Double'
-        output_field.name = fc_name + field.name
-        output_field.aliasName = fc_label + ' ' + field.aliasName
-        field_map.outputField = output_field
-        field_mappings.addFieldMap(field_map)
-
-    print 'Updating %s field types and labels' % (fc_label,)
-    ftl_name = create_memory_layer()
-    arcpy.FeatureClassToFeatureClass_conversion(
-        fc_path, 'in_memory', ftl_name, field_mapping=field_mappings)
-
-    # Add a feature count field, and set it to 1 if the compliance score
-    # is not null for each feature.
-    count_field_name = fc_name + 'Count'
-    arcpy.AddField_management(
-        memory_path(ftl_name), count_field_name, 'LONG',
-        field_alias=fc_label + ' Count')
-
-    arcpy.CalculateField_management(
-        memory_path(ftl_name), count_field_name,
-        '0 if !%s! is None else 1' % (fc_name + 'ScoreCompliance',), 'PYTHON')
-
-    # Create a list of field name.
-    ftl_field_names = [f.name for f in arcpy.ListFields(memory_path(ftl_name))]
-
-    # Check whether this is a linear feature.
-    is_linear = arcpy.Describe(fc_path).shapeType == 'Polyline'
-    if is_linear:
-        # Intersect features with the analysis polygons.
-        print 'Intersecting %s' % (fc_label,)
-        intersect_name = create_memory_layer()
-        arcpy.Intersect_analysis(
-            [memory_path(ftl_name), ZONE_PATH], memory_path(intersect_name))
-
-        # Remove unwanted fields.
-        for field in arcpy.ListFields(memory_path(intersect_name)):
-            if field.name not in ftl_field_names:
-                arcpy.DeleteField_management(
-                    memory_path(intersect_name), field.name)
-
-        # Add a field with the length of the feature.
-        arcpy.AddGeometryAttributes_management(
-            memory_path(intersect_name), 'LENGTH')
-
-        # Multiply scores by the feature length.
-        print 'Length-weighting %s scores' % (fc_label,)
-        for field in arcpy.ListFields(
-                memory_path(intersect_name), score_wildcard):
-            arcpy.CalculateField_management(
-                memory_path(intersect_name), field.name,
-                '!%s! * !LENGTH!' % (field.name,), 'PYTHON')
-
-        ftl_name = intersect_name
-
-    # Create a field map.
-    field_mappings = arcpy.FieldMappings()
-    field_mappings.addTable(target_path)
 
-    # Add score fields.
-    for field in arcpy.ListFields(memory_path(ftl_name), score_wildcard):
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(memory_path(ftl_name), field.name)
-        field_map.mergeRule = 'Sum' if is_linear else 'Mean'
-        field_mappings.addFieldMap(field_map)
+def aggregate_overlay():
+    """
+    Aggregate scores to the zones in ZONE_PATH with spatial joins, and save
+    them to RESULT_PATH.
+    """
+
+    target_path = ZONE_PATH
+
+    for (fc_name, fc_label, fc_path) in FEATURE_CLASSES:
+        with run_log.phase('aggregate', fc_label) as phase:
+            # Create a wildcard for score fields.
+            score_wildcard = fc_name + 'Score*'
+
+            # Update field types and labels.
+            field_mappings = arcpy.FieldMappings()
+            for field in schema_cache.list_fields(fc_path, 'Score*'):
+                field_map = arcpy.FieldMap()
+                field_map.addInputField(fc_path, field.name)
+                output_field = field_map.outputField
+                output_field.type = 'Double'
+                output_field.name = fc_name + field.name
+                output_field.aliasName = fc_label + ' ' + field.aliasName
+                field_map.outputField = output_field
+                field_mappings.addFieldMap(field_map)
+
+            print 'Updating %s field types and labels' % (fc_label,)
+            ftl_name = create_memory_layer()
+            arcpy.FeatureClassToFeatureClass_conversion(
+                fc_path, 'in_memory', ftl_name, field_mapping=field_mappings)
+            phase.rows_read = int(
+                arcpy.GetCount_management(memory_path(ftl_name))[0])
+
+            # Add a feature count field, and set it to 1 if the compliance
+            # score is not null for each feature.
+            count_field_name = fc_name + 'Count'
+            arcpy.AddField_management(
+                memory_path(ftl_name), count_field_name, 'LONG',
+                field_alias=fc_label + ' Count')
 
-    # Add the count field.
-    field_map = arcpy.FieldMap()
-    field_map.addInputField(memory_path(ftl_name), count_field_name)
-    field_map.mergeRule = 'Sum'
-    field_mappings.addFieldMap(field_map)
-
-    # For linear features, add the length field.
-    if is_linear:
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(memory_path(ftl_name), 'LENGTH')
-        field_map.mergeRule = 'Sum'
-        field_mappings.addFieldMap(field_map)
-
-    # Perform the join.
-    join_name = create_memory_layer()
-    print 'Joining %s' % (fc_label,)
-    arcpy.SpatialJoin_analysis(
-        target_path, memory_path(ftl_name), memory_path(join_name),
-        field_mapping=field_mappings,
-        match_option='CONTAINS' if is_linear else 'INTERSECT')
-
-    # Remove the automatic TARGET_FID and Join_Count field.
-    arcpy.DeleteField_management(memory_path(join_name), 'TARGET_FID')
-    arcpy.DeleteField_management(memory_path(join_name), 'Join_Count')
-
-    # Divide scores for linear features by the total length.
-    if is_linear:
-        print 'Completing length-weighting for %s scores' % (fc_label,)
-        for field in arcpy.ListFields(
-                memory_path(join_name), score_wildcard):
             arcpy.CalculateField_management(
-                memory_path(join_name), field.name,
-                'None if !%s! is None else !%s! / !LENGTH!' % (
-                    field.name, field.name), 'PYTHON')
-
-        # Rename the length field.
-        arcpy.AlterField_management(
-            memory_path(join_name), 'LENGTH', fc_name + 'Length',
-            fc_label + ' Total Length')
-
-    # Clean up join feature class, and create new target path.
-    target_path = memory_path(join_name)
-
-# Remove the old results, if they exist.
-if arcpy.Exists(RESULT_PATH):
-    arcpy.Delete_management(RESULT_PATH)
-
-# Save the new results.
-print 'Saving results to %s' % (RESULT_PATH,)
-results_workspace, results_name = os.path.split(RESULT_PATH)
-arcpy.FeatureClassToFeatureClass_conversion(
-    target_path, results_workspace, results_name)
+                memory_path(ftl_name), count_field_name,
+                '0 if !%s! is None else 1' % (fc_name + 'ScoreCompliance',),
+                'PYTHON')
+
+            # Create a list of field name.
+            ftl_field_names = [
+                f.name for f in arcpy.ListFields(memory_path(ftl_name))]
+
+            # Check whether this is a linear feature.
+            is_linear = arcpy.Describe(fc_path).shapeType == 'Polyline'
+            if is_linear:
+                # Intersect features with the analysis polygons.
+                print 'Intersecting %s' % (fc_label,)
+                intersect_name = create_memory_layer()
+                arcpy.Intersect_analysis(
+                    [memory_path(ftl_name), ZONE_PATH],
+                    memory_path(intersect_name))
+
+                # Remove unwanted fields.
+                for field in arcpy.ListFields(memory_path(intersect_name)):
+                    if field.name not in ftl_field_names:
+                        arcpy.DeleteField_management(
+                            memory_path(intersect_name), field.name)
+
+                # Add a field with the length of the feature.
+                arcpy.AddGeometryAttributes_management(
+                    memory_path(intersect_name), 'LENGTH')
+
+                # Multiply scores by the feature length.
+                print 'Length-weighting %s scores' % (fc_label,)
+                for field in arcpy.ListFields(
+                        memory_path(intersect_name), score_wildcard):
+                    arcpy.CalculateField_management(
+                        memory_path(intersect_name), field.name,
+                        '!%s! * !LENGTH!' % (field.name,), 'PYTHON')
+
+                ftl_name = intersect_name
+
+            # Create a field map.
+            field_mappings = arcpy.FieldMappings()
+            field_mappings.addTable(target_path)
+
+            # Add score fields.
+            for field in arcpy.ListFields(
+                    memory_path(ftl_name), score_wildcard):
+                field_map = arcpy.FieldMap()
+                field_map.addInputField(memory_path(ftl_name), field.name)
+                field_map.mergeRule = 'Sum' if is_linear else 'Mean'
+                field_mappings.addFieldMap(field_map)
+
+            # Add the count field.
+            field_map = arcpy.FieldMap()
+            field_map.addInputField(memory_path(ftl_name), count_field_name)
+            field_map.mergeRule = 'Sum'
+            field_mappings.addFieldMap(field_map)
+
+            # For linear features, add the length field.
+            if is_linear:
+                field_map = arcpy.FieldMap()
+                field_map.addInputField(memory_path(ftl_name), 'LENGTH')
+                field_map.mergeRule = 'Sum'
+                field_mappings.addFieldMap(field_map)
+
+            # Perform the join.
+            join_name = create_memory_layer()
+            print 'Joining %s' % (fc_label,)
+            arcpy.SpatialJoin_analysis(
+                target_path, memory_path(ftl_name), memory_path(join_name),
+                field_mapping=field_mappings,
+                match_option='CONTAINS' if is_linear else 'INTERSECT')
+
+            # Remove the automatic TARGET_FID and Join_Count field.
+            arcpy.DeleteField_management(memory_path(join_name), 'TARGET_FID')
+            arcpy.DeleteField_management(memory_path(join_name), 'Join_Count')
+
+            # Divide scores for linear features by the total length.
+            if is_linear:
+                print 'Completing length-weighting for %s scores' % (fc_label,)
+                for field in arcpy.ListFields(
+                        memory_path(join_name), score_wildcard):
+                    arcpy.CalculateField_management(
+                        memory_path(join_name), field.name,
+                        'None if !%s! is None else !%s! / !LENGTH!' % (
+                            field.name, field.name), 'PYTHON')
+
+                # Rename the length field.
+                arcpy.AlterField_management(
+                    memory_path(join_name), 'LENGTH', fc_name + 'Length',
+                    fc_label + ' Total Length')
+
+            # Clean up join feature class, and create new target path.
+            target_path = memory_path(join_name)
+
+    with run_log.phase('save_results') as phase:
+        # Remove the old results, if they exist.
+        if arcpy.Exists(RESULT_PATH):
+            arcpy.Delete_management(RESULT_PATH)
+
+        # Save the new results.
+        print 'Saving results to %s' % (RESULT_PATH,)
+        results_workspace, results_name = os.path.split(RESULT_PATH)
+        arcpy.FeatureClassToFeatureClass_conversion(
+            target_path, results_workspace, results_name)
+        phase.rows_written = int(arcpy.GetCount_management(RESULT_PATH)[0])
+
+
+def sketched_indexes(score_fields):
+    """
+    Return the indexes of the score fields in SKETCH_SCORES.
+    """
+
+    return [i for (i, field) in enumerate(score_fields)
+            if field.name in SKETCH_SCORES]
+
+
+def assign_to_zones(fc_path, score_fields, is_linear, phase):
+    """
+    Intersect features with the finest zones in ZONE_PATH, and return the
+    totals of each zone keyed by zone ID.
+    """
+
+    intersect_name = create_memory_layer()
+    arcpy.Intersect_analysis([fc_path, ZONE_PATH], memory_path(intersect_name))
+
+    score_names = [f.name for f in score_fields]
+    field_names = [ZONE_ID_FIELD] + score_names
+    if is_linear:
+        field_names.append('SHAPE@LENGTH')
+    size = len(score_names)
+    sketched = sketched_indexes(score_fields)
+    compliance = score_names.index('ScoreCompliance')
+
+    totals = {}
+    with arcpy.da.SearchCursor(
+            memory_path(intersect_name), field_names) as cursor:
+        for row in cursor:
+            zone_totals = totals.get(row[0])
+            if zone_totals is None:
+                zone_totals = totals[row[0]] = ZoneTotals(size, sketched)
+            scores = row[1:size + 1]
+            zone_totals.add(scores, int(scores[compliance] is not None),
+                            row[-1] if is_linear else None)
+            phase.rows_read += 1
+
+    arcpy.Delete_management(memory_path(intersect_name))
+    return totals
+
+
+def create_result_table(path, key_fields, outputs, spatial_reference=None):
+    """
+    Create a table for aggregated results, replacing any existing one, and
+    return its field names. Key fields are (name, type) pairs identifying
+    each zone, and outputs are (fc_name, fc_label, score fields, is_linear)
+    tuples in the order of FEATURE_CLASSES. Scores in SKETCH_SCORES also
+    get a field for each quantile in SKETCH_QUANTILES. With a spatial
+    reference, a polygon feature class is created instead.
+    """
+
+    if arcpy.Exists(path):
+        arcpy.Delete_management(path)
+    workspace, name = os.path.split(path)
+    if spatial_reference is None:
+        arcpy.CreateTable_management(workspace, name)
+    else:
+        arcpy.CreateFeatureclass_management(
+            workspace, name, 'POLYGON', spatial_reference=spatial_reference)
+
+    field_names = []
+    for (field_name, field_type) in key_fields:
+        field_names.append(field_name)
+        arcpy.AddField_management(path, field_name, field_type)
+    for (fc_name, fc_label, score_fields, is_linear) in outputs:
+        for field in score_fields:
+            field_names.append(fc_name + field.name)
+            arcpy.AddField_management(
+                path, fc_name + field.name, 'DOUBLE',
+                field_alias=fc_label + ' ' + field.aliasName)
+        for i in sketched_indexes(score_fields):
+            field = score_fields[i]
+            for fraction in SKETCH_QUANTILES:
+                field_name = '%s%sP%i' % (
+                    fc_name, field.name, round(fraction * 100))
+                field_names.append(field_name)
+                arcpy.AddField_management(
+                    path, field_name, 'DOUBLE',
+                    field_alias='%s %s Percentile %g' % (
+                        fc_label, field.aliasName, fraction * 100))
+        field_names.append(fc_name + 'Count')
+        arcpy.AddField_management(path, fc_name + 'Count', 'LONG',
+                                  field_alias=fc_label + ' Count')
+        if is_linear:
+            field_names.append(fc_name + 'Length')
+            arcpy.AddField_management(
+                path, fc_name + 'Length', 'DOUBLE',
+                field_alias=fc_label + ' Total Length')
+    return field_names
+
+
+def result_values(totals, zone_id, outputs):
+    """
+    Return the score means and quantiles, count and length of each output
+    in a zone, in the order of the fields of create_result_table(). Totals
+    are keyed by fc_name and zone ID.
+    """
+
+    values = []
+    for (fc_name, fc_label, score_fields, is_linear) in outputs:
+        zone_totals = totals[fc_name].get(zone_id)
+        if zone_totals is None:
+            zone_totals = ZoneTotals(
+                len(score_fields), sketched_indexes(score_fields))
+        values.extend(zone_totals.means(is_linear))
+        values.extend(zone_totals.quantiles(SKETCH_QUANTILES))
+        values.append(zone_totals.count)
+        if is_linear:
+            values.append(zone_totals.length)
+    return values
+
+
+def save_level(level_path, level_totals, outputs):
+    """
+    Save the totals of one level to a table with a row for each zone.
+    """
+
+    field_names = create_result_table(
+        level_path, [(ZONE_ID_FIELD, 'TEXT')], outputs)
+    rows_written = 0
+    with arcpy.da.InsertCursor(level_path, field_names) as cursor:
+        for zone_id in sorted(level_totals[outputs[0][0]].keys()):
+            cursor.insertRow([unicode(zone_id)] + result_values(
+                level_totals, zone_id, outputs))
+            rows_written += 1
+    return rows_written
+
+
+def aggregate_hierarchy():
+    """
+    Assign features to the finest zones once, and roll their totals up
+    through the zone hierarchy to every level in ZONE_LEVELS.
+    """
+
+    hierarchy = read_hierarchy(
+        ZONE_HIERARCHY_PATH, ZONE_ID_FIELD, ZONE_LEVELS)
+    outputs = []
+    results = {}
+    for (fc_name, fc_label, fc_path) in FEATURE_CLASSES:
+        with run_log.phase('aggregate', fc_label) as phase:
+            print 'Assigning %s to zones' % (fc_label,)
+            score_fields = schema_cache.list_fields(fc_path, 'Score*')
+            is_linear = arcpy.Describe(fc_path).shapeType == 'Polyline'
+            totals = assign_to_zones(fc_path, score_fields, is_linear, phase)
+            results[fc_name] = hierarchy.roll_up(
+                totals, len(score_fields), sketched_indexes(score_fields))
+            outputs.append((fc_name, fc_label, score_fields, is_linear))
+
+    for (level, level_field, level_path) in ZONE_LEVELS:
+        with run_log.phase('save_results', level) as phase:
+            print 'Saving %s results to %s' % (level, level_path)
+            phase.rows_written = save_level(
+                level_path,
+                dict((fc_name, results[fc_name][level])
+                     for (fc_name, fc_label, score_fields, is_linear)
+                     in outputs),
+                outputs)
+
+
+def read_scores(fc_path, score_names, geometry):
+    """
+    Return the geometry of every feature, its scores as a two-dimensional
+    array with NaN for nulls, and whether it is counted.
+    """
+
+    shapes = []
+    rows = []
+    with arcpy.da.SearchCursor(fc_path, [geometry] + score_names) as cursor:
+        for row in cursor:
+            shapes.append(row[0])
+            rows.append(row[1:])
+    scores = np.array(rows, dtype=float).reshape((len(rows), len(score_names)))
+    counted = ~np.isnan(scores[:, score_names.index('ScoreCompliance')])
+    return (shapes, scores, counted)
+
+
+def save_hexes(size, hex_path, hex_totals, outputs, spatial_reference):
+    """
+    Save the totals of one cell size to a feature class with a hexagon for
+    each cell containing features.
+    """
+
+    field_names = create_result_table(
+        hex_path, [('HexQ', 'LONG'), ('HexR', 'LONG')], outputs,
+        spatial_reference)
+    cells = set()
+    for cell_totals in hex_totals.values():
+        cells.update(cell_totals.keys())
+
+    rows_written = 0
+    with arcpy.da.InsertCursor(
+            hex_path, ['SHAPE@'] + field_names) as cursor:
+        for (q, r) in sorted(cells):
+            polygon = arcpy.Polygon(arcpy.Array(
+                [arcpy.Point(x, y) for (x, y) in hex_corners(q, r, size)]),
+                spatial_reference)
+            cursor.insertRow([polygon, q, r] + result_values(
+                hex_totals, (q, r), outputs))
+            rows_written += 1
+    return rows_written
+
+
+def aggregate_hexes():
+    """
+    Bin features into the hexagonal grid at every cell size in HEX_LEVELS,
+    without an overlay.
+    """
+
+    sizes = [size for (size, hex_path) in HEX_LEVELS]
+    outputs = []
+    results = {}
+    spatial_reference = None
+    for (fc_name, fc_label, fc_path) in FEATURE_CLASSES:
+        with run_log.phase('aggregate', fc_label) as phase:
+            print 'Binning %s' % (fc_label,)
+            score_fields = schema_cache.list_fields(fc_path, 'Score*')
+            score_names = [f.name for f in score_fields]
+            description = arcpy.Describe(fc_path)
+            spatial_reference = description.spatialReference
+            is_linear = description.shapeType == 'Polyline'
+            if is_linear:
+                (shapes, scores, counted) = read_scores(
+                    fc_path, score_names, 'SHAPE@')
+                lines = [[] if shape is None else
+                         [[(p.X, p.Y) for p in part if p] for part in shape]
+                         for shape in shapes]
+                results[fc_name] = bin_lines(
+                    lines, scores, counted, sizes,
+                    sketched=sketched_indexes(score_fields))
+            else:
+                (shapes, scores, counted) = read_scores(
+                    fc_path, score_names, 'SHAPE@XY')
+                xy = np.array([(np.nan, np.nan) if s is None else s
+                               for s in shapes], dtype=float).reshape(
+                                   (len(shapes), 2))
+                located = ~np.isnan(xy[:, 0])
+                results[fc_name] = bin_points(
+                    xy[located, 0], xy[located, 1], scores[located],
+                    counted[located], sizes, sketched_indexes(score_fields))
+            phase.rows_read = len(shapes)
+            outputs.append((fc_name, fc_label, score_fields, is_linear))
+
+    for (size, hex_path) in HEX_LEVELS:
+        with run_log.phase('save_results', '%g' % (size,)) as phase:
+            print 'Saving %g hexagon results to %s' % (size, hex_path)
+            phase.rows_written = save_hexes(
+                size, hex_path,
+                dict((fc_name, results[fc_name][size])
+                     for (fc_name, fc_label, score_fields, is_linear)
+                     in outputs),
+                outputs, spatial_reference)
+
+
+parser = argparse.ArgumentParser(
+    'Aggregate sidewalk inventory scores to zones.')
+parser.add_argument('--hierarchy', action='store_true',
+                    help='assign features to the finest zones once and roll '
+                    'the scores up to every level in ZONE_LEVELS')
+parser.add_argument('--hex', action='store_true',
+                    help='bin features into hexagons of every size in '
+                    'HEX_LEVELS instead of aggregating to zones')
+args = parser.parse_args()
+
+run_log = RunLog('aggregate_results')
+schema_cache = SchemaCache(SCHEMA_CACHE_PATH, SCHEMA_CACHE_MAX_AGE * 3600)
+if args.hex:
+    aggregate_hexes()
+elif args.hierarchy:
+    aggregate_hierarchy()
+else:
+    aggregate_overlay()
+schema_cache.save()
+run_log.report()
+run_log.save(RUN_LOG_DIR)
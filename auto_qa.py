@@ -3,29 +3,92 @@ Automatic quality assurance for Sidewalk Inventory and Assessment data.
 """
 
 import argparse
-from cuuats.datamodel import D
 from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
-    SidewalkSegment
+    SidewalkSegment, QA
 from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH, \
-    SS_REL_NAME
+    SS_REL_NAME, QA_FINGERPRINT_PATH, RUN_LOG_DIR, LOCAL_WORKSPACE_PATH, \
+    EDIT_CHUNK_SIZE, EDIT_CHECKPOINT_PATH
 from utils import display_progress
+from batch import read_rows, write_rows, perform_qa, stored_field_names, \
+    update_segment_fields, pipeline, chunked, count_query_set, \
+    missing_fields, NEAREST_SEGMENT_DISTANCE
+from checkpoint import Checkpoint
+from fingerprint import FingerprintStore, feature_fingerprint
+from instrument import RunLog
+from local_workspace import LocalWorkspace
+from profiling import Profiler, profiled
+from qa_rules import RULE_TABLES, qa_version
+from query import compile_where, explain, query_set
 
 PREFETCH_RELS = {
     'CurbRamp': ['attachments'],
 }
 
+FINGERPRINT_JOB = 'auto_qa'
+CHECKPOINT_JOB = 'auto_qa'
+
 # Parse command line arguments.
 parser = argparse.ArgumentParser('Automatic QA for sidewalk inventory data.')
 parser.add_argument('--no-rels', action='store_true', dest='no_rels',
                     help='skip updating relationship fields')
+parser.add_argument('--batch', action='store_true', dest='batch',
+                    help='use compact row-backed features and column-wise '
+                    'QA rules')
+parser.add_argument('--pipeline', action='store_true', dest='pipeline',
+                    help='with --batch and a local workspace, read and '
+                    'write rows in background threads while QA runs')
+parser.add_argument('--chunk-size', type=int, default=EDIT_CHUNK_SIZE,
+                    dest='chunk_size',
+                    help='with --batch, commit edits in ranges of this many '
+                    'OIDs and resume after the last committed range')
+parser.add_argument('--restart', action='store_true', dest='restart',
+                    help='ignore the checkpoint of a failed chunked run')
+parser.add_argument('--all', action='store_true', dest='all',
+                    help='validate features even if they are unchanged '
+                    'since their last QA')
+parser.add_argument('--explain', action='store_true', dest='explain',
+                    help='print the where clause of each batch read and the '
+                    'number of rows it selects')
+parser.add_argument('--profile', action='store_true', dest='profile',
+                    help='time QA methods and score fields and profile a '
+                    'sample of calls')
 args = parser.parse_args()
 
+if LOCAL_WORKSPACE_PATH and not args.batch:
+    parser.error('a local workspace can only be used with --batch')
+if args.pipeline and not args.batch:
+    parser.error('--pipeline can only be used with --batch')
+if args.pipeline and not LOCAL_WORKSPACE_PATH:
+    parser.error('--pipeline can only be used with a local workspace')
+
+run_log = RunLog('auto_qa')
+
 # Register feature classes.
-Sidewalk.register(SW_PATH)
-CurbRamp.register(CR_PATH)
-Crosswalk.register(CW_PATH)
-PedestrianSignal.register(PS_PATH)
-SidewalkSegment.register(SS_PATH)
+with run_log.phase('register'):
+    if LOCAL_WORKSPACE_PATH:
+        workspace = LocalWorkspace(LOCAL_WORKSPACE_PATH)
+        for feature_class in [Sidewalk, CurbRamp, Crosswalk,
+                              PedestrianSignal, SidewalkSegment]:
+            workspace.register(feature_class)
+    else:
+        Sidewalk.register(SW_PATH)
+        CurbRamp.register(CR_PATH)
+        Crosswalk.register(CW_PATH)
+        PedestrianSignal.register(PS_PATH)
+        SidewalkSegment.register(SS_PATH)
+
+missing = missing_fields([Sidewalk, CurbRamp, Crosswalk, PedestrianSignal,
+                          SidewalkSegment])
+if missing:
+    parser.error('missing fields %s; run migrate.py to add them' % (
+        ', '.join(missing),))
+
+profiler = None
+if args.profile:
+    profiler = Profiler()
+    for feature_class in [Sidewalk, CurbRamp, Crosswalk, PedestrianSignal,
+                          SidewalkSegment]:
+        profiler.install(feature_class)
 
 feature_classes = {
     'Sidewalks': Sidewalk,
@@ -36,43 +99,165 @@ feature_classes = {
 
 results = []
 
+# Fingerprints of the features as of their last QA. Features whose
+# fingerprint and QA version are unchanged are skipped.
+store = None
+if QA_FINGERPRINT_PATH:
+    store = FingerprintStore(QA_FINGERPRINT_PATH)
+
+checkpoint = Checkpoint(EDIT_CHECKPOINT_PATH)
+
 print 'Performing auto QA...'
 for label, feature_class in feature_classes.items():
-    update_count = 0
+    with run_log.phase('qa', label) as phase:
+        update_count = 0
+        related = PREFETCH_RELS.get(feature_class.__name__, ())
+        field_names = stored_field_names(feature_class)
+        fingerprints = []
+        saved = 0
+
+        if args.restart:
+            checkpoint.clear(CHECKPOINT_JOB, feature_class.__name__)
+
+        previous = {}
+        version = qa_version(feature_class)
+        if store is not None and not args.all:
+            previous = store.load(FINGERPRINT_JOB, feature_class.__name__)
 
-    # Don't update deferred features or those requiring staff review.
-    features = feature_class.objects.exclude(
-        QAStatus__in=[D('Needs Staff Review'), D('Deferred')])
+        def is_unchanged(feature):
+            return previous.get(feature.OBJECTID) == (
+                feature_fingerprint(feature, field_names, related),
+                version)
 
-    if feature_class.__name__ in PREFETCH_RELS:
-        rels = PREFETCH_RELS[feature_class.__name__]
-        features = features.prefetch_related(*rels)
+        # Don't update deferred features or those requiring staff review.
+        exclude = {'QAStatus__in': [QA.NEEDS_STAFF_REVIEW, QA.DEFERRED]}
 
-    with feature_class.workspace.edit():
-        for feature in display_progress(features, label):
-            feature.perform_qa()
-            feature.assign_staticid()
-            update_count += int(feature.save())
+        if args.batch:
+            # Read compact row-backed features, validate them column-wise,
+            # and write the changed rows back in a single update cursor
+            # pass for each chunk of OIDs.
+            where = compile_where(feature_class, exclude=exclude)
+            if args.explain:
+                print explain(feature_class, where)
+            rule_table = RULE_TABLES.get(feature_class.__name__)
 
-    results.append('%s: Updated %i rows' % (label, update_count))
+            def check(rows):
+                checked = [f for f in rows if not is_unchanged(f)]
+                phase.rows_skipped += len(rows) - len(checked)
+                if rule_table is not None:
+                    rule_table.perform_qa(checked)
+                else:
+                    perform_qa(feature_class, checked)
+                for feature in checked:
+                    feature.assign_staticid()
+                    fingerprints.append((feature.OBJECTID, feature_fingerprint(
+                        feature, field_names, related)))
+                return rows
+
+            for chunk_where in chunked(feature_class, where,
+                                       args.chunk_size, checkpoint,
+                                       CHECKPOINT_JOB):
+                if args.pipeline:
+                    # Batches are read and written in background threads,
+                    # so cursor time overlaps QA and isn't counted
+                    # separately.
+                    with feature_class.workspace.edit():
+                        (rows_read, rows_written) = pipeline(
+                            feature_class, check, where=chunk_where,
+                            field_names=field_names, related=related)
+                    phase.rows_read += rows_read
+                    update_count += rows_written
+                else:
+                    with phase.cursor():
+                        rows = read_rows(
+                            feature_class, chunk_where, field_names, related)
+                    phase.rows_read += len(rows)
+                    check(rows)
+                    with phase.cursor(), feature_class.workspace.edit():
+                        update_count += write_rows(
+                            feature_class, rows, chunk_where)
+
+                # The chunk is committed, so its fingerprints can be
+                # stored.
+                if store is not None:
+                    store.save(FINGERPRINT_JOB, feature_class.__name__,
+                               fingerprints[saved:], version)
+                    saved = len(fingerprints)
+        else:
+            features = query_set(feature_class, exclude=exclude)
+
+            # Query sets load every feature before the first one is
+            # returned, so features are streamed from the cursor unless
+            # relationships are prefetched.
+            total = count_query_set(features)
+            if related:
+                features = features.prefetch_related(*related)
+            else:
+                features = features.iterator()
+
+            with feature_class.workspace.edit():
+                for feature in display_progress(
+                        phase.read(profiled(profiler, features, label)),
+                        label, total=total):
+                    if is_unchanged(feature):
+                        phase.rows_skipped += 1
+                        continue
+                    feature.perform_qa()
+                    feature.assign_staticid()
+                    with phase.cursor():
+                        update_count += int(feature.save())
+                    fingerprints.append((feature.OBJECTID, feature_fingerprint(
+                        feature, field_names, related)))
+
+        # Store the fingerprints once the edits have been saved.
+        if store is not None:
+            store.save(FINGERPRINT_JOB, feature_class.__name__,
+                       fingerprints[saved:], version)
+
+        phase.rows_written = update_count
+        results.append(
+            '%s: Re-validated %i rows, skipped %i unchanged rows, '
+            'updated %i rows' % (
+                label, len(fingerprints), phase.rows_skipped, update_count))
 
 if not args.no_rels:
     # Update the nearest sidewalk segment relationship.
     print 'Updating nearest sidewalk segment...'
-    with SidewalkSegment.workspace.edit():
+    with run_log.phase('nearest_segment'), SidewalkSegment.workspace.edit():
         SidewalkSegment.workspace.update_spatial_relationship(
-            SS_REL_NAME, 'CLOSEST', 25)
+            SS_REL_NAME, 'CLOSEST', NEAREST_SEGMENT_DISTANCE)
 
     # Update segment fields based on the nearest segment relationship.
     print 'Updating sidewalk segment statistics...'
-    update_count = 0
-    segments = SidewalkSegment.objects.prefetch_related('sidewalk_set')
-    with SidewalkSegment.workspace.edit():
-        for segment in display_progress(segments, 'Sidewalk Segments'):
-            segment.update_sidewalk_fields()
-            update_count += int(segment.save())
+    with run_log.phase('segment_summary', 'Sidewalk Segments') as phase:
+        update_count = 0
+        if args.batch:
+            # Read the sidewalks and segments once each, and write the
+            # changed segments in a single update cursor pass.
+            with SidewalkSegment.workspace.edit():
+                update_count = update_segment_fields(
+                    SidewalkSegment, Sidewalk)
+        else:
+            segments = SidewalkSegment.objects.prefetch_related(
+                'sidewalk_set')
+            with SidewalkSegment.workspace.edit():
+                for segment in display_progress(
+                        phase.read(profiled(
+                            profiler, segments, 'Sidewalk Segments')),
+                        'Sidewalk Segments',
+                        total=count_query_set(segments)):
+                    segment.update_sidewalk_fields()
+                    with phase.cursor():
+                        update_count += int(segment.save())
+        phase.rows_written = update_count
     results.append('%s: Updated %i rows' % ('Sidewalk Segments', update_count))
 
 # Print results.
 for row in results:
     print row
+
+run_log.report()
+run_log.save(RUN_LOG_DIR)
+
+if profiler is not None:
+    profiler.report()
@@ -0,0 +1,857 @@
+"""
+Batch processing for Sidewalk Inventory and Assessment features.
+
+Batch jobs read features into compact, row-backed instances of the data
+model classes. Each instance stores its field values in a single list in
+cursor column order instead of the value dictionaries of a regular feature,
+while keeping the same properties, QA methods and scores. Reading 50,000
+sidewalk points from a local workspace takes about 380 bytes per feature as
+row features and about 3 KB per feature through a query set.
+"""
+
+import Queue
+import sys
+import threading
+import numpy as np
+from collections import Counter, Mapping, defaultdict
+from cuuats.datamodel import OIDField, GeometryField, ScaleField, \
+    WeightsField, MethodField, CodedValue, D
+from datamodel import SlopeField
+
+try:
+    import arcpy
+except ImportError:
+    # Only feature classes in a local workspace can be read.
+    arcpy = None
+
+CALCULATED_FIELD_TYPES = (ScaleField, WeightsField, MethodField)
+
+# Relationships that can be prefetched for row features.
+RELATED_COUNTS = ('attachments',)
+
+# Geometry tokens that can be written back with an update cursor.
+WRITABLE_GEOMETRY = ('SHAPE@',)
+
+# Largest number of OIDs in one IN list. Oracle allows at most 1000.
+MAX_IN_LIST = 1000
+
+# Search distance for the nearest segment of a sidewalk, in feet.
+NEAREST_SEGMENT_DISTANCE = 25
+
+
+class RelatedCount(object):
+    """
+    Prefetched stand-in for a related query set that only supports count().
+    """
+
+    __slots__ = ('_count',)
+
+    def __init__(self, count):
+        self._count = count
+
+    def count(self):
+        return self._count
+
+
+class GeometryLength(object):
+    """
+    Stand-in for a geometry read as SHAPE@LENGTH, which only has a length.
+    """
+
+    __slots__ = ('length',)
+
+    def __init__(self, length):
+        self.length = length
+
+
+class RowValues(Mapping):
+    """
+    Read-only mapping of field names to the raw values of a row feature,
+    which stands in for the values dictionary of a regular feature.
+    """
+
+    __slots__ = ('_feature',)
+
+    def __init__(self, feature):
+        self._feature = feature
+
+    def __getitem__(self, field_name):
+        return self._feature.row[self._feature.FIELD_INDEX[field_name]]
+
+    def __iter__(self):
+        return iter(self._feature.FIELD_NAMES)
+
+    def __len__(self):
+        return len(self._feature.FIELD_NAMES)
+
+
+class RowFeature(object):
+    """
+    Mixin for feature instances backed by a cursor row.
+    """
+
+    # The data model classes don't define __slots__, so row features still
+    # have an attribute dictionary. Field values are kept in the row, so the
+    # dictionary stays empty.
+    __slots__ = ('_row', '_changed', '_related')
+
+    # Names of the fields stored in the row, in cursor column order.
+    FIELD_NAMES = ()
+
+    # Index of each field in the row, keyed by name.
+    FIELD_INDEX = {}
+
+    # Cursor token for the geometry field, if it is read.
+    GEOMETRY = 'SHAPE@'
+
+    def __init__(self, row, related=None):
+        self._row = list(row)
+        self._changed = False
+        self._related = related
+
+    @property
+    def row(self):
+        """
+        Field values in cursor column order.
+        """
+
+        return self._row
+
+    @property
+    def values(self):
+        """
+        Raw field values keyed by name, as used by validate().
+        """
+
+        return RowValues(self)
+
+    @property
+    def changed(self):
+        """
+        Has a field value changed since the row was read?
+        """
+
+        return self._changed
+
+    def save(self):
+        raise NotImplementedError(
+            'Row features are saved in bulk with write_rows()')
+
+
+def _row_property(index, field):
+    # Coded values are wrapped and unwrapped as the field descriptor does,
+    # so descriptions and D lookups behave as they do on regular features.
+    def get_value(self):
+        value = self._row[index]
+        if value is not None and field.domain_name:
+            domain = self.workspace.get_domain(field.domain_name)
+            if domain.domainType == 'CodedValue':
+                return CodedValue(value, domain.codedValues.get(value))
+        return value
+
+    def set_value(self, value):
+        if isinstance(value, CodedValue):
+            value = value.value
+        elif isinstance(value, D) and field.domain_name:
+            value = self.workspace.get_coded_value(
+                field.domain_name, value.description)
+        if self._row[index] != value:
+            self._row[index] = value
+            self._changed = True
+
+    return property(get_value, set_value)
+
+
+def _length_property(index):
+    def get_length(self):
+        length = self._row[index]
+        return None if length is None else GeometryLength(length)
+
+    return property(get_length)
+
+
+def _related_property(name):
+    def get_related(self):
+        return self._related[name]
+
+    return property(get_related)
+
+
+def stored_field_names(feature_class, geometry=False):
+    """
+    Return the names of the fields that are stored in the feature class.
+    """
+
+    return [name for (name, field) in feature_class.fields.items()
+            if not isinstance(field, CALCULATED_FIELD_TYPES) and
+            (geometry or not isinstance(field, GeometryField))]
+
+
+def missing_fields(feature_classes):
+    """
+    Return the stored fields of the feature classes that their tables lack,
+    such as fields added to the data model since migrate.py last ran, as
+    class and field names.
+    """
+
+    missing = []
+    for feature_class in feature_classes:
+        layer_fields = feature_class.workspace.get_layer_fields(
+            feature_class.name)
+        missing.extend(
+            '%s.%s' % (feature_class.__name__, name)
+            for name in stored_field_names(feature_class)
+            if column_name(feature_class, name) not in layer_fields)
+    return missing
+
+
+def column_name(feature_class, field_name, geometry='SHAPE@'):
+    """
+    Return the cursor column name for a field. Geometry fields are read
+    with the given geometry token.
+    """
+
+    field = feature_class.fields[field_name]
+    if isinstance(field, GeometryField):
+        return geometry
+    return getattr(field, 'db_name', None) or field_name
+
+
+def score_field_names(feature_class):
+    """
+    Return the names of the calculated score fields of the feature class.
+    """
+
+    return [name for (name, field) in feature_class.fields.items()
+            if isinstance(field, CALCULATED_FIELD_TYPES)]
+
+
+def oid_field_name(feature_class):
+    """
+    Return the name of the OID field of the feature class.
+    """
+
+    for (name, field) in feature_class.fields.items():
+        if isinstance(field, OIDField):
+            return name
+    raise ValueError('%s has no OID field' % (feature_class.__name__,))
+
+
+def is_local(feature_class):
+    """
+    Is the feature class registered with a local workspace?
+    """
+
+    return getattr(getattr(feature_class, 'workspace', None), 'local', False)
+
+
+def search_cursor(feature_class, columns, where=None, path=None,
+                  sql_clause=(None, None)):
+    """
+    Return a search cursor on the feature class, or on a table in its
+    workspace. The sql_clause is a prefix and postfix, as for arcpy.
+    """
+
+    path = path or feature_class.path
+    if is_local(feature_class):
+        return feature_class.workspace.search_cursor(
+            path, columns, where, sql_clause)
+    return arcpy.da.SearchCursor(
+        path, columns, where_clause=where, sql_clause=sql_clause)
+
+
+def update_cursor(feature_class, columns, where=None):
+    """
+    Return an update cursor on the feature class.
+    """
+
+    if is_local(feature_class):
+        return feature_class.workspace.update_cursor(
+            feature_class.path, columns, where)
+    return arcpy.da.UpdateCursor(
+        feature_class.path, columns, where_clause=where)
+
+
+def delimit(feature_class, field_name):
+    """
+    Return the column name of a field delimited for a where clause.
+    Columns that are not fields of the data model, such as editor tracking
+    fields, are given by name.
+    """
+
+    name = field_name
+    if field_name in feature_class.fields:
+        name = column_name(feature_class, field_name)
+    if is_local(feature_class):
+        return '"%s"' % (name,)
+    return arcpy.AddFieldDelimiters(feature_class.path, name)
+
+
+def count_rows(feature_class, where=None):
+    """
+    Return the number of rows selected by the where clause, counted by the
+    database.
+    """
+
+    if is_local(feature_class):
+        return feature_class.workspace.count(feature_class.path, where)
+    view = arcpy.MakeTableView_management(
+        feature_class.path, 'count_rows_view', where)
+    try:
+        return int(arcpy.GetCount_management(view)[0])
+    finally:
+        arcpy.Delete_management(view)
+
+
+def count_query_set(query_set):
+    """
+    Return the number of features selected by a query set, counted by the
+    database instead of by reading every OID as QuerySet.count() does.
+    """
+
+    return count_rows(query_set.feature_class, query_set.query.where)
+
+
+_row_classes = {}
+
+
+def row_class(feature_class, field_names=None, related=(),
+              geometry='SHAPE@'):
+    """
+    Return a row-backed subclass of the feature class. A geometry read as
+    SHAPE@LENGTH only has a length.
+    """
+
+    if field_names is None:
+        field_names = stored_field_names(feature_class)
+    key = (feature_class, tuple(field_names), tuple(related), geometry)
+
+    if key not in _row_classes:
+        # Row properties shadow the field descriptors.
+        namespace = {
+            'FIELD_NAMES': tuple(field_names),
+            'FIELD_INDEX': dict((n, i) for (i, n) in enumerate(field_names)),
+            'GEOMETRY': geometry,
+        }
+        for (index, field_name) in enumerate(field_names):
+            field = feature_class.fields[field_name]
+            if geometry == 'SHAPE@LENGTH' and isinstance(
+                    field, GeometryField):
+                namespace[field_name] = _length_property(index)
+            else:
+                namespace[field_name] = _row_property(index, field)
+        for name in related:
+            namespace[name] = _related_property(name)
+        _row_classes[key] = type(
+            'Row' + feature_class.__name__, (RowFeature, feature_class),
+            namespace)
+
+    return _row_classes[key]
+
+
+def count_attachments(feature_class):
+    """
+    Count the attachments of each feature, keyed by GlobalID.
+    """
+
+    attach_path = feature_class.path + '__ATTACH'
+    with search_cursor(
+            feature_class, ['REL_GLOBALID'], path=attach_path) as cursor:
+        return Counter(row[0] for row in cursor)
+
+
+def _row_reader(feature_class, field_names, related, geometry):
+    """
+    Return the cursor columns for row-backed features and a function that
+    creates a feature from a cursor row, with its prefetched related counts.
+    """
+
+    cls = row_class(feature_class, field_names, related, geometry)
+    columns = [column_name(feature_class, n, geometry)
+               for n in cls.FIELD_NAMES]
+
+    counts = {}
+    for name in related:
+        if name not in RELATED_COUNTS:
+            raise ValueError('Cannot prefetch %s for row features' % (name,))
+        counts[name] = count_attachments(feature_class)
+    globalid_index = cls.FIELD_NAMES.index('GlobalID') if related else None
+
+    def create(row):
+        feature_related = None
+        if related:
+            feature_related = dict(
+                (name, RelatedCount(counts[name][row[globalid_index]]))
+                for name in related)
+        return cls(row, feature_related)
+
+    return (columns, create)
+
+
+def read_rows(feature_class, where=None, field_names=None, related=(),
+              geometry='SHAPE@'):
+    """
+    Read features into a list of row-backed instances. Only the given
+    fields are read, and geometry is only read if a geometry field is
+    given, using the geometry token.
+    """
+
+    (columns, create) = _row_reader(
+        feature_class, field_names, related, geometry)
+    with search_cursor(feature_class, columns, where) as cursor:
+        return [create(row) for row in cursor]
+
+
+def where_in(feature_class, field_name, values):
+    """
+    Return a where clause selecting the features with an integer field
+    value in the given values.
+    """
+
+    return '%s IN (%s)' % (
+        delimit(feature_class, field_name),
+        ', '.join(str(int(value)) for value in values) or 'NULL')
+
+
+def where_oid_in(feature_class, oids):
+    """
+    Return a where clause selecting the features with the given OIDs.
+    """
+
+    return where_in(feature_class, oid_field_name(feature_class), oids)
+
+
+def write_rows(feature_class, features, where=None):
+    """
+    Write changed row-backed features back to the feature class, and
+    return the number of rows updated.
+    """
+
+    changed = [f for f in features if f.changed]
+    if not changed:
+        return 0
+
+    # Geometry read as a length or other read-only token isn't written.
+    cls = type(changed[0])
+    indexes = [
+        i for (i, n) in enumerate(cls.FIELD_NAMES)
+        if cls.GEOMETRY in WRITABLE_GEOMETRY or
+        not isinstance(feature_class.fields[n], GeometryField)]
+    field_names = [cls.FIELD_NAMES[i] for i in indexes]
+    oid_index = field_names.index(oid_field_name(feature_class))
+    changed = dict((f.row[indexes[oid_index]], f) for f in changed)
+
+    columns = [column_name(feature_class, n, cls.GEOMETRY)
+               for n in field_names]
+    update_count = 0
+    with update_cursor(feature_class, columns, where) as cursor:
+        for row in cursor:
+            feature = changed.get(row[oid_index])
+            if feature is not None:
+                cursor.updateRow([feature.row[i] for i in indexes])
+                update_count += 1
+    return update_count
+
+
+def calculate_scores(feature_class, features):
+    """
+    Return the scores of row-backed features as lists in score field order,
+    keyed by OID.
+    """
+
+    oid_name = oid_field_name(feature_class)
+    score_names = score_field_names(feature_class)
+    return dict(
+        (getattr(f, oid_name), [getattr(f, n) for n in score_names])
+        for f in features)
+
+
+def write_scores(feature_class, features, where=None, scores=None):
+    """
+    Calculate the scores of row-backed features and write the scores that
+    changed, and return the number of rows updated. Only the OID and score
+    columns are transferred. Scores already returned by calculate_scores()
+    can be given instead of calculating them again.
+    """
+
+    if not features:
+        return 0
+
+    if scores is None:
+        scores = calculate_scores(feature_class, features)
+    oid_name = oid_field_name(feature_class)
+    score_names = score_field_names(feature_class)
+    columns = [column_name(feature_class, n)
+               for n in [oid_name] + score_names]
+    update_count = 0
+    with update_cursor(feature_class, columns, where) as cursor:
+        for row in cursor:
+            feature_scores = scores.get(row[0])
+            if feature_scores is not None and \
+                    list(row[1:]) != feature_scores:
+                cursor.updateRow([row[0]] + feature_scores)
+                update_count += 1
+    return update_count
+
+
+def pipeline(feature_class, process, write=None, where=None,
+             field_names=None, related=(), geometry='SHAPE@',
+             batch_size=MAX_IN_LIST, queue_size=4):
+    """
+    Read, process and write row-backed features in batches, overlapping the
+    cursors with processing, and return the numbers of rows read and
+    updated.
+
+    A reader thread fills a bounded queue with batches of features while
+    the calling thread passes each batch to process(). A writer thread
+    passes the value returned by process() to write(), which returns the
+    number of rows it updated. The default write() writes the changed
+    features of a batch, for a process() that returns its batch.
+
+    Call the pipeline within the edit session of the workspace. If any of
+    the threads fails, the others stop and the error is raised in the
+    calling thread.
+
+    The pipeline only runs on a local workspace. arcpy is not thread-safe,
+    and geodatabase edit sessions are bound to the thread that started them,
+    so geodatabase cursors are never opened in the background threads.
+    """
+
+    if not is_local(feature_class):
+        raise ValueError(
+            'The pipeline can only read and write %s in a local workspace' % (
+                feature_class.__name__,))
+    if write is None:
+        oid_name = oid_field_name(feature_class)
+
+        def write(batch):
+            return write_rows(feature_class, batch, where_oid_in(
+                feature_class, [getattr(f, oid_name) for f in batch
+                                if f.changed]))
+    batch_size = min(batch_size, MAX_IN_LIST)
+    (columns, create) = _row_reader(
+        feature_class, field_names, related, geometry)
+    read_queue = Queue.Queue(queue_size)
+    write_queue = Queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+    counts = {'read': 0, 'updated': 0}
+
+    # Marks the end of a queue, and is returned by get() once the pipeline
+    # has stopped. Waits time out so that every thread notices a failure.
+    done = object()
+
+    def put(queue, item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def get(queue):
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Queue.Empty:
+                pass
+        return done
+
+    def reader():
+        try:
+            batch = []
+            with search_cursor(feature_class, columns, where) as cursor:
+                for row in cursor:
+                    batch.append(create(row))
+                    if len(batch) == batch_size:
+                        if not put(read_queue, batch):
+                            return
+                        batch = []
+            if batch:
+                put(read_queue, batch)
+            put(read_queue, done)
+        except Exception:
+            errors.append(sys.exc_info())
+            stop.set()
+
+    def writer():
+        try:
+            while True:
+                item = get(write_queue)
+                if item is done:
+                    return
+                counts['updated'] += write(item)
+        except Exception:
+            errors.append(sys.exc_info())
+            stop.set()
+
+    threads = [threading.Thread(target=reader),
+               threading.Thread(target=writer)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while True:
+            batch = get(read_queue)
+            if batch is done:
+                break
+            counts['read'] += len(batch)
+            if not put(write_queue, process(batch)):
+                break
+        put(write_queue, done)
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        (exc_type, exc_value, traceback) = errors[0]
+        raise exc_type, exc_value, traceback
+    return (counts['read'], counts['updated'])
+
+
+def _first_oid(feature_class, where, order):
+    oid_name = oid_field_name(feature_class)
+    sql_clause = (None, 'ORDER BY %s %s' % (
+        column_name(feature_class, oid_name), order))
+    with search_cursor(feature_class, [column_name(feature_class, oid_name)],
+                       where, sql_clause=sql_clause) as cursor:
+        for row in cursor:
+            return row[0]
+    return None
+
+
+def min_oid(feature_class, where=None):
+    """
+    Return the smallest OID selected by the where clause, or None if no rows
+    are selected. Only the first row of the sorted cursor is read.
+    """
+
+    return _first_oid(feature_class, where, 'ASC')
+
+
+def max_oid(feature_class, where=None):
+    """
+    Return the largest OID selected by the where clause, or None if no rows
+    are selected. Only the first row of the sorted cursor is read.
+    """
+
+    return _first_oid(feature_class, where, 'DESC')
+
+
+def chunked(feature_class, where=None, chunk_size=None, checkpoint=None,
+            job=None):
+    """
+    Split the rows selected by the where clause into ranges of chunk_size
+    consecutive OIDs, and yield a where clause for each range, starting
+    after the last OID in the checkpoint. Process each range in its own
+    edit session:
+
+        for chunk_where in chunked(feature_class, where, 10000, checkpoint,
+                                   'auto_qa'):
+            with feature_class.workspace.edit():
+                ...
+
+    A range has been committed once the next one is requested, so its last
+    OID is saved to the checkpoint then. The checkpoint is cleared after
+    the last range. Without a chunk size, the where clause is yielded once.
+    """
+
+    if not chunk_size:
+        yield where
+        return
+
+    name = feature_class.__name__
+    low = (checkpoint.last_oid(job, name) if checkpoint else None) or 0
+    high = max_oid(feature_class, where)
+    oid_column = delimit(feature_class, oid_field_name(feature_class))
+
+    def where_oid(operator, oid):
+        condition = '%s %s %i' % (oid_column, operator, oid)
+        return '(%s) AND %s' % (where, condition) if where else condition
+
+    while high is not None and low < high:
+        # Ranges start at the next selected OID, so sparse OIDs don't give
+        # empty ranges.
+        start = min_oid(feature_class, where_oid('>', low))
+        if start is None:
+            break
+        low = start - 1
+        condition = '%s > %i AND %s <= %i' % (
+            oid_column, low, oid_column, low + chunk_size)
+        yield '(%s) AND %s' % (where, condition) if where else condition
+        low += chunk_size
+        if checkpoint is not None:
+            checkpoint.save(job, name, low)
+    if checkpoint is not None:
+        checkpoint.clear(job, name)
+
+
+def update_segment_fields(segment_class, sidewalk_class,
+                          foreign_key='NearestSegmentOID', oids=None):
+    """
+    Update the sidewalk fields of every segment, or of the segments with
+    the given OIDs, from its nearest sidewalk features, reading each feature
+    class once, and return the number of segments updated.
+    """
+
+    sidewalk_where = None
+    segment_where = None
+    if oids is not None:
+        sidewalk_where = where_in(sidewalk_class, foreign_key, oids)
+        segment_where = where_oid_in(segment_class, oids)
+
+    sidewalk_set = defaultdict(list)
+    for sidewalk in read_rows(sidewalk_class, sidewalk_where):
+        sidewalk_set[getattr(sidewalk, foreign_key)].append(sidewalk)
+
+    cls = row_class(segment_class, related=('sidewalk_set',))
+    oid_index = cls.FIELD_NAMES.index(oid_field_name(segment_class))
+    columns = [column_name(segment_class, n) for n in cls.FIELD_NAMES]
+    segments = []
+    with search_cursor(segment_class, columns, segment_where) as cursor:
+        for row in cursor:
+            segment = cls(row, {
+                'sidewalk_set': sidewalk_set.get(row[oid_index], [])})
+            segment.update_sidewalk_fields()
+            segments.append(segment)
+    return write_rows(segment_class, segments, segment_where)
+
+
+def update_segment_lengths(segment_class, where=None):
+    """
+    Update the stored length of every segment, or of the segments matching
+    the where clause, from its geometry, and return the number of segments
+    updated. Only the OID, stored length and geometry length are read.
+    """
+
+    geometry_name = [n for n in stored_field_names(segment_class, True)
+                     if isinstance(segment_class.fields[n], GeometryField)][0]
+    segments = read_rows(
+        segment_class, where,
+        [oid_field_name(segment_class), 'SegmentLength', geometry_name],
+        geometry='SHAPE@LENGTH')
+    for segment in segments:
+        segment.update_length()
+    return write_rows(segment_class, segments, where)
+
+
+def nearest_oids(feature_class, near_class, where=None, distance=None):
+    """
+    Return the OID of the closest feature of the near class within the
+    distance of each feature selected by the where clause, keyed by OID.
+    Features with nothing within the distance are left out.
+    """
+
+    if is_local(feature_class):
+        return feature_class.workspace.nearest(
+            feature_class.path, near_class.path, distance, where)
+    layer = arcpy.MakeFeatureLayer_management(
+        feature_class.path, 'nearest_oids_layer', where)
+    near_table = r'in_memory\nearest_oids'
+    try:
+        arcpy.GenerateNearTable_analysis(
+            layer, near_class.path, near_table, distance, closest='CLOSEST')
+        with arcpy.da.SearchCursor(
+                near_table, ['IN_FID', 'NEAR_FID']) as cursor:
+            return dict(cursor)
+    finally:
+        arcpy.Delete_management(near_table)
+        arcpy.Delete_management(layer)
+
+
+def update_nearest_segments(feature_class, segment_class, oids,
+                            foreign_key='NearestSegmentOID',
+                            distance=NEAREST_SEGMENT_DISTANCE):
+    """
+    Set the nearest segment of the features with the given OIDs to the
+    closest segment within the distance, as the spatial relationship
+    update in auto_qa.py does for every feature, and return the number of
+    rows updated.
+    """
+
+    where = where_oid_in(feature_class, oids)
+    nearest = nearest_oids(feature_class, segment_class, where, distance)
+    oid_name = oid_field_name(feature_class)
+    features = read_rows(feature_class, where, [oid_name, foreign_key])
+    for feature in features:
+        setattr(feature, foreign_key, nearest.get(getattr(feature, oid_name)))
+    return write_rows(feature_class, features, where)
+
+
+def column(features, field_name, dtype=float):
+    """
+    Return the values of a field as a NumPy array, with NaN for nulls.
+    """
+
+    index = features[0].FIELD_NAMES.index(field_name)
+    return np.array([f.row[index] for f in features], dtype=dtype)
+
+
+def invalid_decimals(values, decimals, tolerance=1e-6):
+    """
+    Return a boolean array that is true for values with more than the given
+    number of decimal places. Null (NaN) values are ignored.
+    """
+
+    scaled = np.asarray(values, dtype=float) * 10**decimals
+    with np.errstate(invalid='ignore'):
+        return np.abs(scaled - np.rint(scaled)) > tolerance
+
+
+def invalid_decimal_oids(oids, values, decimals, tolerance=1e-6):
+    """
+    Return the OIDs of values with more than the given number of decimal
+    places.
+    """
+
+    return np.asarray(oids)[invalid_decimals(values, decimals, tolerance)]
+
+
+def slope_fields(feature_class):
+    """
+    Return the slope fields of the feature class, keyed by name.
+    """
+
+    return dict((name, field) for (name, field)
+                in feature_class.fields.items()
+                if isinstance(field, SlopeField))
+
+
+def validate_slope_columns(feature_class, features):
+    """
+    Check the decimals of every slope column at once, and return the set of
+    OIDs with at least one invalid slope.
+    """
+
+    if not features:
+        return set()
+
+    oids = column(
+        features, oid_field_name(feature_class), dtype=np.int64)
+    invalid = set()
+    for (field_name, field) in slope_fields(feature_class).items():
+        if field_name in features[0].FIELD_NAMES:
+            invalid.update(invalid_decimal_oids(
+                oids, column(features, field_name), field.DECIMALS).tolist())
+    return invalid
+
+
+def perform_qa(feature_class, features):
+    """
+    Perform automated quality assurance on row-backed features, checking
+    slope decimals column-wise.
+    """
+
+    invalid = validate_slope_columns(feature_class, features)
+    oid_index = features[0].FIELD_NAMES.index(
+        oid_field_name(feature_class)) if features else None
+
+    # Features with an invalid slope still get the per-value check so that
+    # their QA comments name the offending fields.
+    for feature in features:
+        checked = feature.row[oid_index] not in invalid
+        feature.perform_qa(check_decimals=not checked)
@@ -0,0 +1,487 @@
+"""
+Microbenchmarks for Sidewalk Inventory and Assessment scoring and QA.
+
+Features with synthetic value distributions are stored in an in-memory
+local workspace and read back as row-backed instances while the feature
+classes are registered with it, so the benchmarks need neither a geodatabase
+nor the paths in config.py, and coded values and domain constants are
+resolved as they are in production. Results are saved as JSON named after
+the current commit so that runs can be compared between commits.
+
+With a latency, the batch pipeline is also benchmarked against sequential
+reads and writes on a temporary local workspace that adds the latency to
+each round trip.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+from collections import Counter
+from timeit import default_timer
+from cuuats.datamodel import D, GlobalIDField
+from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
+    SidewalkSegment, SlopeField
+from batch import RelatedCount, row_class, stored_field_names, \
+    score_field_names, column_name, read_rows, write_rows, pipeline
+from local_workspace import LocalWorkspace
+from qa_rules import RULE_TABLES
+
+SIZES = (1000, 10000, 100000)
+
+FEATURE_CLASSES = [Sidewalk, CurbRamp, Crosswalk, PedestrianSignal,
+                   SidewalkSegment]
+
+# Share of null values in fields that are not coded or required.
+NULL_RATE = 0.02
+
+YES_NO_NA = ['Yes'] * 5 + ['No'] * 4 + ['N/A']
+
+FAULT_SIZES = ['None'] * 4 + [
+    'All vertical discontinuities compliant',
+    'Between 0.25 and 0.50 inch, no bevel', 'Over 0.50 inch', 'N/A']
+
+OBSTRUCTIONS = ['None'] * 10 + [
+    'Pole or signpost', 'Hydrant', 'Bollard', 'Grate', 'Tree roots',
+    'Tree trunk or other vegetation', 'Other', 'N/A']
+
+# Synthetic descriptions for coded value fields. Repeated descriptions are
+# drawn more often.
+CODED_VALUES = {
+    'QAStatus': ['Complete'] * 8 + ['Needs Field Review',
+                                    'Needs Staff Review', 'Deferred'],
+    'AutoQAStatus': ['Complete'] * 8 + ['Needs Field Review',
+                                        'Needs Staff Review'],
+    'AutoQAOverride': ['No'] * 19 + ['Yes'],
+    'PointType': ['Summary'] * 3 + ['Driveway'] * 5 + ['Local Issue'] * 2,
+    'Material': ['Concrete'] * 8 + ['Asphalt', 'Brick'],
+    'SurfaceType': ['Asphalt'] * 3 + ['Concrete', 'Brick'],
+    'RampType': ['Perpendicular'] * 5 + ['Parallel'] * 2 + [
+        'Combination', 'None'],
+    'EdgeTreatment': ['Flared Sides'] * 3 + ['Returned Curb', 'Other'],
+    'DetectableWarningType': ['Truncated Domes - YELLOW'] * 4 + [
+        'Truncated Domes - RED', 'Truncated Domes - OTHER',
+        'Pavement Grooves', 'Other', 'None', 'N/A'],
+    'LargestVerticalFault': FAULT_SIZES,
+    'LargestPavementFault': FAULT_SIZES,
+    'SurfaceCondition': ['None'] * 5 + [
+        'Spalled', 'Grass', 'Dirt', 'Cracked', 'Other', 'N/A'],
+    'Obstruction': OBSTRUCTIONS,
+    'MarkingType': ['Continental', 'Standard', 'Dashed',
+                    'No Painted Markings', 'Box for Exclusive Period'],
+    'PedButtonLocation': ['Pole'] * 8 + ['No Button', 'N/A'],
+    'PedButtonSize': ['Accessible - 2 inches or greater'] * 3 + [
+        'Medium - roughly 1 inch', 'Very Small - < 1/2 inch', 'No Button',
+        'N/A'],
+}
+
+for field_name in ['InMedian', 'StopControlledIntersection',
+                   'MidblockCrossing', 'SignalPresent', 'HighContrastButton',
+                   'TactileArrowPresent', 'VibrotactileSignal',
+                   'AllWeatherSurface', 'ButtonSpacing', 'ButtonOffsetFCurb',
+                   'LocatorTone', 'PassiveDetection']:
+    CODED_VALUES[field_name] = YES_NO_NA
+
+# Ranges for numeric fields, as (minimum, maximum, decimals).
+NUMERIC_RANGES = {
+    'Width': (30, 120, 0),
+    'RampWidth': (30, 72, 0),
+    'RampLength': (24, 240, 0),
+    'LandingWidth': (36, 72, 0),
+    'LandingLength': (36, 72, 0),
+    'LeftApproachWidth': (0, 60, 0),
+    'RightApproachWidth': (0, 60, 0),
+    'DetectableWarningWidth': (0, 72, 0),
+    'DetectableWarningLength': (0, 36, 0),
+    'ButtonHeight': (10, 60, 0),
+    'ButtonCount': (0, 2, 0),
+    'VerticalFaultCount': (0, 20, 0),
+    'PavementFaultCount': (0, 5, 0),
+    'CrackedPanelCount': (0, 10, 0),
+    'SegmentLength': (50, 2640, 1),
+}
+SLOPE_RANGE = (0, 15, 1)
+DEFAULT_RANGE = (0, 100, 0)
+
+
+class SyntheticShape(object):
+    """
+    Stand-in for a polyline geometry that only has a length in feet.
+    """
+
+    __slots__ = ('length',)
+
+    def __init__(self, length):
+        self.length = length
+
+
+class SyntheticFeatures(object):
+    """
+    Builds row-backed features with synthetic values.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.next_oid = 1
+
+    def value(self, feature_class, field_name):
+        field = feature_class.fields[field_name]
+        if field_name in CODED_VALUES:
+            return D(self.random.choice(CODED_VALUES[field_name]))
+        if isinstance(field, GlobalIDField):
+            return '{%08X-0000-0000-0000-000000000000}' % (self.next_oid,)
+        if field_name == 'OBJECTID':
+            return self.next_oid
+        if field_name in ('QAComment', 'AutoQAComment', 'Comment',
+                          'ObstructionTypes', 'Municipality'):
+            return None
+        if field_name == 'StaticID':
+            return None if self.random.random() < 0.5 else self.next_oid
+        # Segment lengths are stored from the geometry before scoring, so
+        # they are not null either.
+        if not (field.required or field.required_if or
+                field_name == 'SegmentLength') and \
+                self.random.random() < NULL_RATE:
+            return None
+
+        if isinstance(field, SlopeField):
+            (low, high, decimals) = SLOPE_RANGE
+        else:
+            (low, high, decimals) = NUMERIC_RANGES.get(
+                field_name, DEFAULT_RANGE)
+        value = round(self.random.uniform(low, high), decimals)
+        return value if decimals else int(value)
+
+    def features(self, feature_class, count, extra_fields=(), related=None):
+        """
+        Return a list of row-backed features. Extra fields and related
+        values are given as (name, function) pairs, where the function of a
+        related value takes the index of the feature.
+        """
+
+        stored_names = stored_field_names(feature_class)
+        field_names = stored_names + [n for (n, f) in extra_fields]
+        related = related or []
+        cls = row_class(
+            feature_class, field_names, [n for (n, f) in related])
+
+        features = []
+        for i in xrange(count):
+            row = [self.value(feature_class, n) for n in stored_names]
+            row.extend(function() for (name, function) in extra_fields)
+            features.append(cls(row, dict(
+                (name, function(i)) for (name, function) in related)))
+            self.next_oid += 1
+        return features
+
+    def sidewalks(self, count):
+        return self.features(Sidewalk, count)
+
+    def curb_ramps(self, count):
+        return self.features(
+            CurbRamp, count, related=[('attachments', lambda i: RelatedCount(
+                self.random.randint(0, 3)))])
+
+    def crosswalks(self, count):
+        return self.features(Crosswalk, count)
+
+    def pedestrian_signals(self, count):
+        return self.features(PedestrianSignal, count)
+
+    def sidewalk_groups(self, count, sidewalks):
+        """
+        Return a random run of the sidewalks for each of the segments.
+        """
+
+        groups = []
+        start = 0
+        for i in xrange(count):
+            size = self.random.randint(0, 4)
+            groups.append(sidewalks[start:start + size])
+            start = (start + size) % max(1, len(sidewalks) - 4)
+        return groups
+
+    def sidewalk_segments(self, count, sidewalks):
+        """
+        Return segments, each related to a random run of the sidewalks.
+        """
+
+        groups = self.sidewalk_groups(count, sidewalks)
+        return self.features(
+            SidewalkSegment, count,
+            extra_fields=[('Shape', lambda: SyntheticShape(
+                self.random.uniform(50, 2640)))],
+            related=[('sidewalk_set', lambda i: groups[i])])
+
+
+def timed(function, *args):
+    """
+    Return the time taken to call the function, in seconds.
+    """
+
+    start = default_timer()
+    function(*args)
+    return default_timer() - start
+
+
+def perform_qa(features):
+    for feature in features:
+        feature.perform_qa()
+
+
+def update_sidewalk_fields(segments):
+    for segment in segments:
+        segment.update_sidewalk_fields()
+
+
+def score(features):
+    field_names = score_field_names(type(features[0]))
+    for feature in features:
+        for field_name in field_names:
+            getattr(feature, field_name)
+
+
+def summarize(features):
+    """
+    Count the features at each value of each score field, as
+    create_summary_tables.py does with summarize().
+    """
+
+    field_names = score_field_names(type(features[0]))
+    return dict((name, Counter(getattr(f, name) for f in features))
+                for name in field_names)
+
+
+def run_benchmarks(size, seed=0):
+    """
+    Run each benchmark at the given size on features read from an in-memory
+    local workspace, and return the results keyed by feature class and
+    operation.
+    """
+
+    workspace = local_features(':memory:', FEATURE_CLASSES, size, seed)
+    results = {}
+
+    def run(label, operation, function, features):
+        seconds = timed(function, features)
+        results.setdefault(label, {})[operation] = {
+            'seconds': round(seconds, 4),
+            'per_feature_us': round(1e6 * seconds / len(features), 2),
+        }
+
+    def read(label, feature_class, related=()):
+        start = default_timer()
+        features = read_rows(feature_class, related=related)
+        results[label] = {'read': {'seconds': round(
+            default_timer() - start, 4)}}
+        return features
+
+    with workspace.registered(*FEATURE_CLASSES):
+        for (label, feature_class, related) in [
+                ('Sidewalk', Sidewalk, ()),
+                ('CurbRamp', CurbRamp, ('attachments',)),
+                ('Crosswalk', Crosswalk, ()),
+                ('PedestrianSignal', PedestrianSignal, ())]:
+            features = read(label, feature_class, related)
+            run(label, 'perform_qa', perform_qa, features)
+            if label == 'Sidewalk':
+                sidewalks = features
+                continue
+            run(label, 'score', score, features)
+            run(label, 'summarize', summarize, features)
+
+        # The segments are related to random runs of the sidewalks rather
+        # than to their nearest sidewalks.
+        groups = SyntheticFeatures(seed).sidewalk_groups(size, sidewalks)
+        cls = row_class(SidewalkSegment, related=('sidewalk_set',))
+        segments = [cls(s.row, {'sidewalk_set': g}) for (s, g) in zip(
+            read('SidewalkSegment', SidewalkSegment), groups)]
+        run('SidewalkSegment', 'update_sidewalk_fields',
+            update_sidewalk_fields, segments)
+        run('SidewalkSegment', 'score', score, segments)
+        run('SidewalkSegment', 'summarize', summarize, segments)
+    workspace.connection.close()
+    return results
+
+
+def local_features(path, feature_classes, count, seed=0,
+                   edit_date_field=None):
+    """
+    Create a local workspace with synthetic features of each of the
+    feature classes, and attachments for those that have them.
+    Every description is given the same code in each domain.
+    """
+
+    descriptions = sorted(set(d for v in CODED_VALUES.values() for d in v))
+    codes = dict((d, c) for (c, d) in enumerate(descriptions, start=1))
+    workspace = LocalWorkspace(path, edit_date_field=edit_date_field)
+    synthetic = SyntheticFeatures(seed)
+    builders = {
+        Sidewalk: synthetic.sidewalks,
+        CurbRamp: synthetic.curb_ramps,
+        Crosswalk: synthetic.crosswalks,
+        PedestrianSignal: synthetic.pedestrian_signals,
+        SidewalkSegment: lambda count: synthetic.features(
+            SidewalkSegment, count),
+    }
+
+    for feature_class in feature_classes:
+        domains = {}
+        for field_name in stored_field_names(feature_class):
+            if field_name in CODED_VALUES:
+                workspace.add_domain(field_name, dict(
+                    (codes[d], d) for d in set(CODED_VALUES[field_name])))
+                domains[field_name] = field_name
+        table = workspace.add_feature_class(feature_class, domains=domains)
+
+        field_names = stored_field_names(feature_class)
+        rows = []
+        attachments = []
+        for feature in builders[feature_class](count):
+            rows.append([codes[v.description] if isinstance(v, D) else v
+                         for v in feature.row])
+            if feature_class is CurbRamp:
+                attachments.extend(
+                    [(feature.GlobalID, 'Photo.jpg')] *
+                    feature.attachments.count())
+        workspace.insert_rows(
+            table, [column_name(feature_class, n) for n in field_names],
+            rows)
+        workspace.insert_rows(
+            table + '__ATTACH', ['REL_GLOBALID', 'ATT_NAME'], attachments)
+    return workspace
+
+
+def local_sidewalks(path, count, seed=0, edit_date_field=None):
+    """
+    Create a local workspace with synthetic sidewalk features.
+    """
+
+    return local_features(path, [Sidewalk], count, seed, edit_date_field)
+
+
+def run_pipeline_benchmarks(size, latency, seed=0):
+    """
+    Time column-wise sidewalk QA on a local workspace with the given
+    latency, reading and writing in sequence and in the pipeline. Each run
+    starts from a fresh copy of the workspace.
+    """
+
+    directory = tempfile.mkdtemp()
+    rule_table = RULE_TABLES['Sidewalk']
+    results = {}
+
+    def check(batch):
+        rule_table.perform_qa(batch)
+        return batch
+
+    def sequential():
+        features = read_rows(Sidewalk)
+        check(features)
+        write_rows(Sidewalk, features)
+
+    def overlapped():
+        pipeline(Sidewalk, check)
+
+    try:
+        source = os.path.join(directory, 'source.sqlite')
+        local_sidewalks(source, size, seed).connection.close()
+        for (operation, function) in [('sequential', sequential),
+                                      ('pipeline', overlapped)]:
+            path = os.path.join(directory, operation + '.sqlite')
+            shutil.copy(source, path)
+            workspace = LocalWorkspace(path, latency)
+            with workspace.registered(Sidewalk), workspace.edit():
+                seconds = timed(function)
+            workspace.connection.close()
+            results[operation] = {
+                'seconds': round(seconds, 4),
+                'per_feature_us': round(1e6 * seconds / size, 2),
+            }
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def current_commit():
+    """
+    Return the abbreviated hash of the current commit, with a suffix if the
+    working tree has changes.
+    """
+
+    repository = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=repository).strip()
+        dirty = subprocess.call(
+            ['git', 'diff', '--quiet', 'HEAD'], cwd=repository) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def compare(results, baseline):
+    """
+    Print the change in time of each benchmark relative to the baseline.
+    """
+
+    for size in sorted(results, key=int):
+        for label in sorted(results[size]):
+            for (operation, result) in sorted(results[size][label].items()):
+                base = baseline.get(size, {}).get(label, {}).get(operation)
+                if not base or not base['seconds']:
+                    continue
+                print '%8s %-18s %-24s %8.3fs %+7.1f%%' % (
+                    size, label, operation, result['seconds'],
+                    100 * (result['seconds'] / base['seconds'] - 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        'Benchmark scoring and QA with synthetic features.')
+    parser.add_argument('-n', '--sizes', default=','.join(map(str, SIZES)),
+                        help='comma-separated numbers of features')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for the synthetic values')
+    parser.add_argument('-o', '--output', default='benchmark_results',
+                        help='directory for the results')
+    parser.add_argument('-c', '--compare', dest='baseline',
+                        help='results file to compare against')
+    parser.add_argument('-l', '--latency', type=float,
+                        help='also benchmark the batch pipeline on a local '
+                        'workspace with this round trip latency in seconds')
+    args = parser.parse_args()
+
+    commit = current_commit()
+    results = {}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        print 'Benchmarking %i features...' % (size,)
+        results[str(size)] = run_benchmarks(size, args.seed)
+        if args.latency is not None:
+            results[str(size)]['Pipeline'] = run_pipeline_benchmarks(
+                size, args.latency, args.seed)
+        for label in sorted(results[str(size)]):
+            for (operation, result) in sorted(
+                    results[str(size)][label].items()):
+                print '%8i %-18s %-24s %8.3fs' % (
+                    size, label, operation, result['seconds'])
+        if args.latency is not None:
+            pipeline_results = results[str(size)]['Pipeline']
+            print '%8i Overlap gain: %0.1f%%' % (size, 100 * (
+                1 - pipeline_results['pipeline']['seconds'] /
+                pipeline_results['sequential']['seconds']))
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    path = os.path.join(args.output, '%s.json' % (commit,))
+    with open(path, 'wb') as results_file:
+        json.dump({'commit': commit, 'seed': args.seed,
+                   'results': results}, results_file, indent=4)
+    print 'Saved results to %s' % (path,)
+
+    if args.baseline:
+        with open(args.baseline, 'rb') as baseline_file:
+            compare(results, json.load(baseline_file)['results'])
@@ -0,0 +1,56 @@
+"""
+Checkpoints for chunked edits in Sidewalk Inventory and Assessment batch
+jobs.
+
+A chunked job commits its edits in ranges of consecutive OIDs, each in its
+own edit session, which keeps the delta tables of a versioned geodatabase
+small. After each commit, the checkpoint file records the last OID of the
+range for the job and feature class, so a run that fails partway resumes
+after the last committed range instead of starting over. The checkpoint of
+a feature class is cleared once all of its ranges are committed.
+"""
+
+import json
+import os
+
+
+class Checkpoint(object):
+    """
+    Last committed OIDs by job and feature class, persisted to a JSON file.
+    With a blank path, checkpoints only last for the current run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as checkpoint_file:
+                return json.load(checkpoint_file)
+        except ValueError:
+            return {}
+
+    def _save(self):
+        if self.path:
+            with open(self.path, 'wb') as checkpoint_file:
+                json.dump(self.data, checkpoint_file, indent=2)
+
+    def last_oid(self, job, feature_class):
+        """
+        Return the last committed OID, or None to start from the beginning.
+        """
+
+        return self.data.get(job, {}).get(feature_class)
+
+    def save(self, job, feature_class, oid):
+        self.data.setdefault(job, {})[feature_class] = oid
+        self._save()
+
+    def clear(self, job, feature_class):
+        if self.data.get(job, {}).pop(feature_class, None) is not None:
+            if not self.data[job]:
+                del self.data[job]
+            self._save()
@@ -16,6 +16,74 @@ SS_REL_NAME = r''  # Sidewalk-sidewalk segment relationship class
 ZONE_PATH = r''
 RESULT_PATH = r''
 
+# Zone hierarchy for aggregate_results.py --hierarchy. ZONE_PATH holds the
+# finest zones, identified by ZONE_ID_FIELD, and the hierarchy table lists
+# the zone at each level that contains each of them. Each level is a
+# (name, hierarchy table field, output table path) tuple, and its output
+# table will be overwritten.
+ZONE_ID_FIELD = r''
+ZONE_HIERARCHY_PATH = r''
+ZONE_LEVELS = []
+
+# Hexagon cell sizes for aggregate_results.py --hex, as (size, output
+# feature class path) tuples. The size is the distance from the center of
+# a cell to its corners, in the units of the feature classes. Output feature
+# classes will be overwritten.
+HEX_LEVELS = []
+
+# Scores whose quantiles are added to the results of aggregate_results.py
+# --hierarchy and --hex, and the quantiles, as fractions. Scores of linear
+# features are weighted by length.
+SKETCH_SCORES = ['ScoreCompliance']
+SKETCH_QUANTILES = [0.1, 0.5]
+
 # Paths to CSV files for tracking progress.
 SEGMENT_CSV = r''
 QASTATUS_CSV = r''
+
+# Path to the SQLite database of QA input fingerprints. Auto QA skips
+# features that are unchanged since their last QA. Leave blank to validate
+# every feature on every run.
+QA_FINGERPRINT_PATH = r''
+
+# Path to a local SQLite copy of the inventory made with local_workspace.py.
+# When set, batch jobs read and write the local copy instead of the
+# geodatabase. Leave blank to use the geodatabase.
+LOCAL_WORKSPACE_PATH = r''
+
+# Path to the JSON file of cached field lists, and the number of hours
+# before it is refreshed. Leave blank to list the fields on every run.
+SCHEMA_CACHE_PATH = r''
+SCHEMA_CACHE_MAX_AGE = 24
+
+# Directory for JSON run logs with per-phase timings and row counts. Leave
+# blank to only print the summary.
+RUN_LOG_DIR = r''
+
+# Number of consecutive OIDs committed per edit session by batch jobs, and
+# the path to the JSON file of the last committed OIDs, so that a failed run
+# resumes where it stopped. Set the chunk size to 0 to edit each feature
+# class in a single session.
+EDIT_CHUNK_SIZE = 0
+EDIT_CHECKPOINT_PATH = r''
+
+# Editor tracking field with the date each row was last edited, and the SQL
+# template for a date in a where clause (use "date '%s'" for a file
+# geodatabase). The scoring daemon polls for edits every DAEMON_POLL_INTERVAL
+# seconds and commits DAEMON_BATCH_SIZE rows per edit session.
+EDIT_DATE_FIELD = 'last_edited_date'
+EDIT_DATE_SQL = "TIMESTAMP '%s'"
+DAEMON_POLL_INTERVAL = 10
+DAEMON_BATCH_SIZE = 500
+
+# Path to the JSON summary written by create_summary_tables.py in the
+# nightly pipeline, the path to the JSON file of pipeline stage
+# fingerprints, and the number of stages run_pipeline.py runs at once.
+SUMMARY_OUTPUT_PATH = r''
+PIPELINE_STATE_PATH = r''
+PIPELINE_WORKERS = 2
+
+# Path to the JSON file of cached summary tables, which are rebuilt only for
+# feature classes whose data version (row count, latest EDIT_DATE_FIELD and
+# scoring rules) changed. Leave blank to rebuild every table.
+SUMMARY_CACHE_PATH = r''
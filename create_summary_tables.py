@@ -2,9 +2,18 @@ import argparse
 import csv
 import json
 import os
+import re
+from collections import OrderedDict
 from cuuats.datamodel import D
-from datamodel import CurbRamp, Crosswalk, PedestrianSignal, SidewalkSegment
-from config import CR_PATH, CW_PATH, PS_PATH, SS_PATH
+from datamodel import CurbRamp, Crosswalk, PedestrianSignal, \
+    SidewalkSegment
+from config import CR_PATH, CW_PATH, PS_PATH, SS_PATH, RUN_LOG_DIR, \
+    SUMMARY_CACHE_PATH, EDIT_DATE_FIELD
+from batch import oid_field_name
+from fingerprint import data_version
+from group_summary import summarize_groups, segment_groups, nearest_segments
+from instrument import RunLog
+from summary_cache import SummaryCache
 
 SIDEWALK_SEGMENT_FIELDS = [
     ('ScoreMaxCrossSlope', 'Maximum Cross Slope'),
@@ -64,6 +73,9 @@ TACTILE_FEATURES_FIELDS = [
     ('VibrotactileSignal', 50, 'Vibrotactile signal or button'),
 ]
 
+# Length of a segment in miles, from its stored length.
+SIDEWALK_LENGTH = 'self.condition_length'
+
 def is_excluded(level):
     return ('exclude' in level and level['exclude'])
 
@@ -101,8 +113,10 @@ def merge_levels(levels, groups):
 
     return new_levels
 
-def feature_table(query_set, summary_field, column_labels, feature_label):
-    levels = query_set.summarize(summary_field)
+def feature_table(query_set, summary_field, column_labels, feature_label,
+                  levels=None):
+    if levels is None:
+        levels = query_set.summarize(summary_field)
     total = sum([l['count'] for l in levels if not is_excluded(l)])
 
     if not isinstance(column_labels, (list, tuple)):
@@ -142,9 +156,9 @@ def feature_table(query_set, summary_field, column_labels, feature_label):
 
     return results
 
-def sidewalk_table(query_set, summary_field, column_label):
-    levels = query_set.summarize(
-        summary_field, length='Shape.getLength("PLANAR", "MILES")')
+def sidewalk_table(query_set, summary_field, column_label, levels=None):
+    if levels is None:
+        levels = query_set.summarize(summary_field, length=SIDEWALK_LENGTH)
     total_length = sum([l['length'] for l in levels])
 
     results = [
@@ -167,8 +181,13 @@ def sidewalk_table(query_set, summary_field, column_label):
 
     return results
 
-def yes_table(query_set, fields, column_label):
-    total = query_set.count()
+def yes_table(query_set, fields, column_label, levels=None):
+    # Levels of any summary field, with the count of each field that is Yes,
+    # are used instead of the query set if given.
+    if levels is None:
+        total = query_set.count()
+    else:
+        total = sum([l['count'] for l in levels])
 
     results = [
         [
@@ -180,8 +199,10 @@ def yes_table(query_set, fields, column_label):
     ]
 
     for (field_name, value, label) in fields:
-        count = sum(
-            [int(getattr(f, field_name) == D('Yes')) for f in query_set])
+        if levels is None:
+            count = sum([is_yes(field_name)(f) for f in query_set])
+        else:
+            count = sum([l[field_name] for l in levels])
 
         results.append([
             label,
@@ -192,14 +213,125 @@ def yes_table(query_set, fields, column_label):
 
     return results
 
+def is_yes(field_name):
+    return lambda feature: int(getattr(feature, field_name) == D('Yes'))
+
+def fetched(phase, query_set):
+    # Query sets are loaded in full by the summaries, so loading them here
+    # first times the cursor reads apart from summarizing, which then uses
+    # the cached features.
+    for feature in phase.read(query_set):
+        pass
+    return query_set
+
+def group_tables(query_set, group, fields, build, **kwargs):
+    # Without a group, the tables summarize the query set themselves.
+    # Otherwise every group is summarized in one pass over the query set,
+    # and the tables are built for each group from its levels.
+    if group is None:
+        return build({})
+    groups = summarize_groups(
+        query_set, [field for (field, label) in fields], group, **kwargs)
+    return OrderedDict((group, build(levels))
+                       for (group, levels) in groups.items())
+
+def sidewalk_tables(phase, group=None):
+    ss = fetched(phase, SidewalkSegment.objects.filter(SummaryCount=1))
+
+    def build(levels):
+        return dict(
+            (field, sidewalk_table(ss, field, label, levels.get(field)))
+            for (field, label) in SIDEWALK_SEGMENT_FIELDS)
+
+    return group_tables(ss, group, SIDEWALK_SEGMENT_FIELDS, build,
+                        length=SIDEWALK_LENGTH)
+
+def curb_ramp_tables(phase, group=None):
+    cr = fetched(phase, CurbRamp.objects.filter(
+        QAStatus=D('Complete')).exclude(RampType=D('None')))
+
+    def build(levels):
+        return dict(
+            (field, feature_table(
+                cr, field, label, 'Curb Ramps', levels.get(field)))
+            for (field, label) in CURB_RAMP_FIELDS)
+
+    return group_tables(cr, group, CURB_RAMP_FIELDS, build)
+
+def crosswalk_tables(phase, group=None):
+    cw = fetched(phase, Crosswalk.objects.filter(QAStatus=D('Complete')))
+
+    def build(levels):
+        return dict(
+            (field, feature_table(
+                cw, field, label, 'Crosswalks', levels.get(field)))
+            for (field, label) in CROSSWALK_FIELDS)
+
+    return group_tables(cw, group, CROSSWALK_FIELDS, build)
+
+def pedestrian_signal_tables(phase, group=None):
+    ps = fetched(phase, PedestrianSignal.objects.filter(
+        QAStatus=D('Complete')))
+
+    def build(levels):
+        tables = dict(
+            (field, feature_table(
+                ps, field, label, 'Pedestrian Signals', levels.get(field)))
+            for (field, label) in PEDESTRIAN_SIGNAL_FIELDS)
+
+        tables['ScoreButtonPositionAppearance'] = yes_table(
+            ps, BUTTON_POSITION_APPEARANCE_FIELDS,
+            'Button Position and Appearance', levels.get('ScoreCompliance'))
+
+        tables['ScoreTactileFeatures'] = yes_table(
+            ps, TACTILE_FEATURES_FIELDS, 'Tactile Features',
+            levels.get('ScoreCompliance'))
+        return tables
+
+    # Yes counts are added up with the levels of each group.
+    yes_counts = dict(
+        (field_name, is_yes(field_name)) for (field_name, value, label)
+        in BUTTON_POSITION_APPEARANCE_FIELDS + TACTILE_FEATURES_FIELDS)
+    return group_tables(ps, group, PEDESTRIAN_SIGNAL_FIELDS, build,
+                        **yes_counts)
+
+def feature_group(feature_class, nearest, segment_group):
+    oid_name = oid_field_name(feature_class)
+    return lambda feature: segment_group.get(
+        nearest.get(getattr(feature, oid_name)))
+
+# Summary sections as (feature type, feature class, label, table
+# definitions, function building the tables).
+SECTIONS = [
+    ('Sidewalk', SidewalkSegment, 'sidewalk', SIDEWALK_SEGMENT_FIELDS,
+     sidewalk_tables),
+    ('CurbRamp', CurbRamp, 'curb ramp', CURB_RAMP_FIELDS, curb_ramp_tables),
+    ('Crosswalk', Crosswalk, 'crosswalk', CROSSWALK_FIELDS,
+     crosswalk_tables),
+    ('PedestrianSignal', PedestrianSignal, 'pedestrian signal',
+     [PEDESTRIAN_SIGNAL_FIELDS, BUTTON_POSITION_APPEARANCE_FIELDS,
+      TACTILE_FEATURES_FIELDS], pedestrian_signal_tables),
+]
+
 # Parse command line arguments.
 parser = argparse.ArgumentParser(
     'Create summary tables for sidewalk network features.')
 parser.add_argument('-f', '--format', dest='format', default='json',
                     choices=['csv', 'json'], help='format of outpot')
+parser.add_argument('--no-cache', action='store_true', dest='no_cache',
+                    help='rebuild every table instead of using cached '
+                    'tables for unchanged data')
+parser.add_argument('-g', '--group-by', dest='group_by',
+                    help='also create the tables for each value of this '
+                    'sidewalk segment field, such as Municipality; other '
+                    'features without the field take the value of their '
+                    'nearest segment')
 parser.add_argument('output', help='output file or location')
 args = parser.parse_args()
 
+if args.group_by and args.group_by not in SidewalkSegment.fields:
+    parser.error('%s is not a sidewalk segment field' % (args.group_by,))
+
 # Verify the output location.
 if args.format == 'csv':
     assert os.path.isdir(args.output), \
@@ -208,60 +340,94 @@ else:
     assert os.path.isdir(os.path.dirname(args.output)), \
         'Invalid output location'
 
+run_log = RunLog('create_summary_tables')
+
 # Register feature classes
-CurbRamp.register(CR_PATH)
-Crosswalk.register(CW_PATH)
-PedestrianSignal.register(PS_PATH)
-SidewalkSegment.register(SS_PATH)
-
-# Prepare the results dictionary.
-results = {
-    'Sidewalk': {},
-    'Crosswalk': {},
-    'CurbRamp': {},
-    'PedestrianSignal': {}
-}
-
-# Create sidewalk tables.
-print 'Creating sidewalk summary tables...'
-ss = SidewalkSegment.objects.filter(SummaryCount=1)
-for (field, label) in SIDEWALK_SEGMENT_FIELDS:
-    results['Sidewalk'][field] = sidewalk_table(ss, field, label)
-
-# Create curb ramp tables.
-print 'Creating curb ramp summary tables...'
-cr = CurbRamp.objects.filter(QAStatus=D('Complete')).exclude(RampType=D('None'))
-for (field, label) in CURB_RAMP_FIELDS:
-    results['CurbRamp'][field] = feature_table(cr, field, label, 'Curb Ramps')
-
-# Create crosswalk tables.
-print 'Creating crosswalk summary tables...'
-cw = Crosswalk.objects.filter(QAStatus=D('Complete'))
-for (field, label) in CROSSWALK_FIELDS:
-    results['Crosswalk'][field] = feature_table(cw, field, label, 'Crosswalks')
-
-# Create pedestrian signal tables.
-print 'Creating pedestrian signal summary tables...'
-ps = PedestrianSignal.objects.filter(QAStatus=D('Complete'))
-for (field, label) in PEDESTRIAN_SIGNAL_FIELDS:
-    results['PedestrianSignal'][field] = feature_table(
-        ps, field, label, 'Pedestrian Signals')
-
-results['PedestrianSignal']['ScoreButtonPositionAppearance'] = yes_table(
-    ps, BUTTON_POSITION_APPEARANCE_FIELDS, 'Button Position and Appearance')
-
-results['PedestrianSignal']['ScoreTactileFeatures'] = yes_table(
-    ps, TACTILE_FEATURES_FIELDS, 'Tactile Features')
+with run_log.phase('register'):
+    CurbRamp.register(CR_PATH)
+    Crosswalk.register(CW_PATH)
+    PedestrianSignal.register(PS_PATH)
+    SidewalkSegment.register(SS_PATH)
+
+# Tables are cached by the data version of their feature class, so only
+# the feature types whose data changed are summarized again.
+cache = SummaryCache('' if args.no_cache or not EDIT_DATE_FIELD
+                     else SUMMARY_CACHE_PATH)
+results = {}
+group_results = {}
+segment_version = None
+segment_group = None
+
+for (section, feature_class, label, definitions, build) in SECTIONS:
+    with run_log.phase('summary_tables', section) as phase:
+        version = None
+        if cache.path:
+            with phase.cursor():
+                version = data_version(feature_class, EDIT_DATE_FIELD,
+                                       definitions)
+        if feature_class is SidewalkSegment:
+            segment_version = version
+        tables = cache.get(section, version)
+        if tables is None:
+            print 'Creating %s summary tables...' % (label,)
+            tables = build(phase)
+            cache.set(section, version, tables)
+        else:
+            print 'Using cached %s summary tables.' % (label,)
+        results[section] = tables
+
+    if not args.group_by:
+        continue
+    with run_log.phase('group_tables', section) as phase:
+        group_key = '%s:%s' % (section, args.group_by)
+        group = args.group_by
+        group_version = version
+        if group not in feature_class.fields:
+            # The groups also depend on the segments and their locations.
+            group_version = version and '%s:%s' % (version, segment_version)
+        groups = cache.get(group_key, group_version)
+        if groups is None:
+            print 'Creating %s summary tables by %s...' % (
+                label, args.group_by)
+            if group not in feature_class.fields:
+                # Features without the group field take the group of their
+                # nearest segment.
+                with phase.cursor():
+                    if segment_group is None:
+                        segment_group = segment_groups(
+                            SidewalkSegment, args.group_by)
+                    nearest = nearest_segments(feature_class, SidewalkSegment)
+                group = feature_group(feature_class, nearest, segment_group)
+            groups = build(phase, group)
+            cache.set(group_key, group_version, groups)
+        else:
+            print 'Using cached %s summary tables by %s.' % (
+                label, args.group_by)
+    for (group, tables) in groups.items():
+        group_results.setdefault(group, {})[section] = tables
+
+cache.save()
 
 # Create the output file or files.
+# Tables by group are kept under the name of the group field in JSON, and
+# prefixed with the group name in CSV.
 if args.format == 'json':
+    if args.group_by:
+        results[args.group_by] = group_results
     with open(args.output, 'wb') as output_file:
         json.dump(results, output_file, indent=4)
 else:
-    for (feature_type, tables) in results.items():
-        for (var_name, table) in tables.items():
-            output_path = os.path.join(
-                args.output, feature_type + var_name + '.csv')
-            with open(output_path, 'wb') as output_file:
-                writer = csv.writer(output_file)
-                writer.writerows(table)
+    outputs = [('', results)] + [
+        (re.sub(r'\W', '', group), sections)
+        for (group, sections) in group_results.items()]
+    for (prefix, sections) in outputs:
+        for (feature_type, tables) in sections.items():
+            for (var_name, table) in tables.items():
+                output_path = os.path.join(
+                    args.output, prefix + feature_type + var_name + '.csv')
+                with open(output_path, 'wb') as output_file:
+                    writer = csv.writer(output_file)
+                    writer.writerows(table)
+
+run_log.report()
+run_log.save(RUN_LOG_DIR)
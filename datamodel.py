@@ -3,9 +3,10 @@ Sidewalk Inventory and Assessment data model.
 """
 
 from cuuats.datamodel import D, BaseFeature, OIDField, GeometryField, \
-    NumericField, StringField, GlobalIDField, ForeignKey, ScaleField, \
-    WeightsField, MethodField, BreaksScale, DictScale, StaticScale, \
-    ScaleLevel as L
+    NumericField, StringField, GlobalIDField, ForeignKey, CalculatedField, \
+    ScaleField, WeightsField, MethodField, BreaksScale, DictScale, \
+    StaticScale, ScaleLevel as L
+from cuuats.datamodel.field_values import DeferredValue
 
 # Scales
 WIDTH_SCALE = BreaksScale([36, 39, 42, 45, 48], [
@@ -198,25 +199,250 @@ SCORE_SCALE = BreaksScale([60, 70, 80, 90, 100], [
 ], True)
 
 
+class DomainConstants(object):
+    """
+    Codes for the descriptions that fields use in a coded value domain.
+
+    The module-level constants hold D lookups, so comparisons behave exactly
+    like the equivalent D('...') expression. At registration, each feature
+    class resolves the constants of each field against the domain of that
+    field, giving the integer codes of that domain.
+    """
+
+    def __init__(self, **descriptions):
+        self.descriptions = descriptions
+        self.domain_name = None
+        self._domain_descriptions = {}
+        for (name, description) in descriptions.items():
+            setattr(self, name, D(description))
+
+    @property
+    def resolved(self):
+        return self.domain_name is not None
+
+    def only(self, *names):
+        """
+        Return constants for some of the descriptions, for fields that only
+        use those.
+        """
+
+        return DomainConstants(
+            **dict((name, self.descriptions[name]) for name in names))
+
+    def resolve(self, domain_name, coded_values):
+        """
+        Return constants with the integer codes from the domain. Every
+        description must be in the domain.
+        """
+
+        codes = dict((d, c) for (c, d) in coded_values.items())
+        missing = sorted(d for d in self.descriptions.values()
+                         if d not in codes)
+        if missing:
+            raise ValueError('Domain %s has no code for %s' % (
+                domain_name, ', '.join(missing)))
+
+        resolved = DomainConstants(**self.descriptions)
+        resolved.domain_name = domain_name
+        resolved._domain_descriptions = dict(coded_values)
+        for (name, description) in self.descriptions.items():
+            setattr(resolved, name, codes[description])
+        return resolved
+
+    def description(self, value):
+        """
+        Return the description of a field value.
+        """
+
+        if hasattr(value, 'description'):
+            return value.description
+        return self._domain_descriptions.get(value, value)
+
+
+# Domain constants
+QA = DomainConstants(
+    COMPLETE='Complete',
+    NEEDS_FIELD_REVIEW='Needs Field Review',
+    NEEDS_STAFF_REVIEW='Needs Staff Review',
+    DEFERRED='Deferred')
+
+YES_NO = DomainConstants(
+    YES='Yes',
+    NO='No',
+    NA='N/A')
+
+POINT_TYPE = DomainConstants(
+    SUMMARY='Summary',
+    DRIVEWAY='Driveway',
+    LOCAL_ISSUE='Local Issue')
+
+RAMP_TYPE = DomainConstants(
+    NONE='None',
+    PARALLEL='Parallel')
+
+EDGE_TREATMENT = DomainConstants(
+    FLARED_SIDES='Flared Sides')
+
+DWS_TYPE = DomainConstants(
+    NONE='None',
+    NA='N/A')
+
+MARKING_TYPE = DomainConstants(
+    NO_PAINTED_MARKINGS='No Painted Markings',
+    BOX_FOR_EXCLUSIVE_PERIOD='Box for Exclusive Period')
+
+BUTTON_LOCATION = DomainConstants(
+    NO_BUTTON='No Button',
+    NA='N/A')
+
+BUTTON_SIZE = DomainConstants(
+    NO_BUTTON='No Button',
+    NA='N/A')
+
+FAULT_SIZE = DomainConstants(
+    NONE='None',
+    NA='N/A')
+
+SURFACE_CONDITION = DomainConstants(
+    NONE='None',
+    NA='N/A')
+
+OBSTRUCTION = DomainConstants(
+    NONE='None',
+    NA='N/A')
+
+
+def qa_result(messages, constants=QA):
+    """
+    Return the QA status and QA comment for a list of validation messages,
+    using the QA status codes of the given domain constants.
+    """
+
+    # Consolidate missing data messages.
+    missing = [m[:-11] for m in messages if m.endswith(' is missing')]
+    if missing:
+        messages = ['Missing data: %s' % (', '. join(missing),)] + [
+            m for m in messages if not m.endswith(' is missing')]
+
+    # Set QA status based on the number of messages.
+    if len(messages) > 0:
+        qastatus = constants.NEEDS_FIELD_REVIEW
+    else:
+        qastatus = constants.COMPLETE
+
+    # Overwrite existing QA comments.
+    qacomment = '; '.join(messages)
+    if len(qacomment) > 200:
+        qacomment = qacomment[:197] + '...'
+
+    # Use a null value if there is no QA comment.
+    return (qastatus, qacomment or None)
+
+
+def has_valid_decimals(value, decimals, tolerance=1e-6):
+    """
+    Does the value have no more than the given number of decimal places?
+    """
+
+    scaled = value * 10**decimals
+    return abs(scaled - round(scaled)) <= tolerance
+
+
 class SlopeField(NumericField):
     """
     Field for slopes collected with a smart tool.
     """
 
-    def validate(self, value):
+    # Our smart tools only report slopes to the tenth, so hundredths or
+    # smaller places indicate a problem.
+    DECIMALS = 1
+
+    def validate(self, value, check_decimals=True):
         messages = super(SlopeField, self).validate(value)
-        if value is None:
+        if value is None or not check_decimals:
             return messages
 
-        value_parts = str(value).split('.')
-        if len(value_parts) == 2 and len(value_parts[1]) > 1:
-            # Our smart tools only report slopes to the tenth,
-            # so hundredths or smaller places indicate a problem.
+        if not has_valid_decimals(value, self.DECIMALS):
             messages.append('%s has invalid decimals' % (self.label,))
         return messages
 
 
-class SidewalkSegment(BaseFeature):
+class SidewalkBaseFeature(BaseFeature):
+    """
+    Base class for the Sidewalk Inventory and Assessment feature classes.
+    """
+
+    # Domain constants to resolve when the feature class is registered,
+    # keyed by the name of the field that uses the domain. The constants
+    # name the descriptions that the field uses.
+    DOMAIN_CONSTANTS = {}
+
+    # Domain constants resolved against the domain of each field, keyed by
+    # field name.
+    resolved_constants = {}
+
+    # Path of the registered feature class.
+    path = None
+
+    @classmethod
+    def register(cls, path):
+        result = super(SidewalkBaseFeature, cls).register(path)
+        cls.path = path
+        cls.resolve_domain_constants()
+        return result
+
+    @classmethod
+    def resolve_domain_constants(cls):
+        """
+        Resolve the domain constants of each field against the domain of
+        the field. Raises ValueError if a description that a field uses is
+        missing from its domain.
+        """
+
+        resolved = {}
+        for (field_name, constants) in cls.DOMAIN_CONSTANTS.items():
+            domain_name = cls.fields[field_name].domain_name
+            if domain_name is None:
+                continue
+            try:
+                resolved[field_name] = constants.resolve(
+                    domain_name, cls.coded_values(domain_name))
+            except ValueError as e:
+                raise ValueError('%s.%s: %s' % (cls.__name__, field_name, e))
+        cls.resolved_constants = resolved
+
+    @classmethod
+    def domain_constants(cls, field_name):
+        """
+        Return the domain constants of a field, with the integer codes of
+        its domain once the feature class is registered.
+        """
+
+        constants = cls.resolved_constants.get(field_name)
+        if constants is None:
+            return cls.DOMAIN_CONSTANTS[field_name]
+        return constants
+
+    @classmethod
+    def coded_values(cls, domain_name):
+        """
+        Return the coded values of a domain in the workspace.
+        """
+
+        return cls.workspace.get_domain(domain_name).codedValues
+
+    def replace_value(self, field_name, old_name, new_name):
+        """
+        Replace one coded value of a field with another, using the names of
+        the domain constants for the field.
+        """
+
+        constants = self.domain_constants(field_name)
+        if getattr(self, field_name) == getattr(constants, old_name):
+            setattr(self, field_name, getattr(constants, new_name))
+
+
+class SidewalkSegment(SidewalkBaseFeature):
     """
     A block of sidewalk.
     """
@@ -299,6 +525,12 @@ class SidewalkSegment(BaseFeature):
         'Comment',
         storage={'field_length': 200})
 
+    # Length of the geometry in feet, kept up to date by update_length() so
+    # that scoring does not need to read the geometry.
+    SegmentLength = NumericField(
+        'Segment Length',
+        storage={'field_type': 'DOUBLE'})
+
     # Score fields
     ScoreSummaryCrossSlope = ScaleField(
         'Summary Cross Slope Score',
@@ -380,8 +612,7 @@ class SidewalkSegment(BaseFeature):
         })
 
     Shape = GeometryField(
-        'Shape',
-        deferred=False)
+        'Shape')
 
     @property
     def obstruction_types_count(self):
@@ -391,7 +622,11 @@ class SidewalkSegment(BaseFeature):
 
     @property
     def condition_length(self):
-        return self.Shape.length / 5280
+        # Segments whose length has not been stored yet fall back to their
+        # geometry.
+        if self.SegmentLength is None:
+            return self.Shape.length / 5280
+        return self.SegmentLength / 5280
 
     @property
     def qa_complete(self):
@@ -407,12 +642,16 @@ class SidewalkSegment(BaseFeature):
                     hasattr(self, field_name):
                 setattr(self, field_name, getattr(sidewalk, field_name))
 
+    def update_length(self):
+        self.SegmentLength = None if self.Shape is None else self.Shape.length
+
     def update_sidewalk_fields(self):
         self.SummaryCount = 0
         self.DrivewayCount = 0
         self.LocalIssueCount = 0
         self.MaxCrossSlope = 0
         obstruction_types = []
+        descriptions = []
 
         for sw in self.sidewalk_set:
             if not sw.qa_complete:
@@ -428,15 +667,17 @@ class SidewalkSegment(BaseFeature):
             if sw.CrossSlope > self.MaxCrossSlope:
                 self.MaxCrossSlope = sw.CrossSlope
 
-            if sw.Obstruction not in (None, D('None'), D('N/A')):
-                if sw.Obstruction not in obstruction_types:
-                    obstruction_types.append(sw.Obstruction)
+            obstruction = sw.Obstruction
+            constants = sw.domain_constants('Obstruction')
+            if obstruction not in (None, constants.NONE, constants.NA):
+                if obstruction not in obstruction_types:
+                    obstruction_types.append(obstruction)
+                    descriptions.append(constants.description(obstruction))
 
-        self.ObstructionTypes = '; '.join(
-            [ot.description for ot in obstruction_types]) or None
+        self.ObstructionTypes = '; '.join(descriptions) or None
 
 
-class InventoryFeature(BaseFeature):
+class InventoryFeature(SidewalkBaseFeature):
     """
     A feature in the sidewalk inventory.
     """
@@ -444,6 +685,10 @@ class InventoryFeature(BaseFeature):
     QASTATUS_FIELD = 'QAStatus'
     QACOMMENT_FIELD = 'QAComment'
 
+    DOMAIN_CONSTANTS = {
+        'QAStatus': QA,
+    }
+
     # Fields common to all of the sidewalk inventory features
     OBJECTID = OIDField('OBJECTID', order=-1)
     GlobalID = GlobalIDField('GlobalID', order=-1)
@@ -462,38 +707,47 @@ class InventoryFeature(BaseFeature):
         Is the QA status complete?
         """
 
-        return self.QAStatus == D('Complete')
+        return self.QAStatus == self.domain_constants('QAStatus').COMPLETE
 
-    def perform_qa(self):
+    def validate(self, check_decimals=True):
         """
-        Perform automated quality assurance.
+        Validate each field, as BaseFeature.validate() does. Batch QA passes
+        check_decimals=False for features whose slope columns it has already
+        checked.
         """
 
-        # Apply QA unless the current status is Needs Staff Review.
-        if getattr(self, self.QASTATUS_FIELD) != D('Needs Staff Review'):
-            # Perform cleaning and validation.
-            self.clean()
-            messages = self.validate()
+        messages = []
+        for (field_name, field) in self.fields.items():
+            if isinstance(field, (ForeignKey, CalculatedField)):
+                continue
 
-            # Consolidate missing data messages.
-            missing = [m[:-11] for m in messages if m.endswith(' is missing')]
-            if missing:
-                messages = ['Missing data: %s' % (', '. join(missing),)] + [
-                    m for m in messages if not m.endswith(' is missing')]
+            # Skip deferred values that have not been retrieved.
+            if isinstance(self.values.get(field_name), DeferredValue):
+                continue
 
-            # Set QA status based on the number of messages.
-            if len(messages) > 0:
-                setattr(self, self.QASTATUS_FIELD, D('Needs Field Review'))
+            value = getattr(self, field_name)
+            if value is None and self.check_condition(
+                    field.required_if, default=False):
+                messages.append('%s is missing' % (field.label,))
+            elif isinstance(field, SlopeField):
+                messages.extend(field.validate(value, check_decimals))
             else:
-                setattr(self, self.QASTATUS_FIELD, D('Complete'))
+                messages.extend(field.validate(value))
+        return messages
 
-            # Overwrite existing QA comments.
-            qacomment = '; '.join(messages)
-            if len(qacomment) > 200:
-                qacomment = qacomment[:197] + '...'
+    def perform_qa(self, check_decimals=True):
+        """
+        Perform automated quality assurance.
+        """
 
-            # Use a null value if there is no QA comment.
-            qacomment = qacomment or None
+        # Apply QA unless the current status is Needs Staff Review.
+        constants = self.domain_constants(self.QASTATUS_FIELD)
+        if getattr(self, self.QASTATUS_FIELD) != constants.NEEDS_STAFF_REVIEW:
+            # Perform cleaning and validation.
+            self.clean()
+            (qastatus, qacomment) = qa_result(
+                self.validate(check_decimals), constants)
+            setattr(self, self.QASTATUS_FIELD, qastatus)
             setattr(self, self.QACOMMENT_FIELD, qacomment)
 
     def assign_staticid(self):
@@ -507,6 +761,13 @@ class InventoryFeature(BaseFeature):
 
 class Sidewalk(InventoryFeature):
 
+    DOMAIN_CONSTANTS = dict(
+        InventoryFeature.DOMAIN_CONSTANTS,
+        PointType=POINT_TYPE,
+        LargestVerticalFault=FAULT_SIZE,
+        SurfaceCondition=SURFACE_CONDITION,
+        Obstruction=OBSTRUCTION)
+
     PointType = NumericField('Point Type', required=True)
     Material = NumericField('Material', required_if='self.is_summary')
     Width = NumericField('Width', max=50*12, required_if='self.is_summary')
@@ -530,31 +791,31 @@ class Sidewalk(InventoryFeature):
 
     @property
     def is_summary(self):
-        return self.PointType == D('Summary')
+        return self.PointType == self.domain_constants('PointType').SUMMARY
 
     @property
     def is_driveway(self):
-        return self.PointType == D('Driveway')
+        return self.PointType == self.domain_constants('PointType').DRIVEWAY
 
     @property
     def is_localissue(self):
-        return self.PointType == D('Local Issue')
+        return self.PointType == \
+            self.domain_constants('PointType').LOCAL_ISSUE
 
     def clean(self):
         # Replace N/As with Nones for summary points.
         if self.is_summary:
             for field_name in ('LargestVerticalFault', 'SurfaceCondition',
                                'Obstruction'):
-                if getattr(self, field_name) == D('N/A'):
-                    setattr(self, field_name, D('None'))
+                self.replace_value(field_name, 'NA', 'NONE')
 
-    def validate(self):
-        messages = super(Sidewalk, self).validate()
+    def validate(self, check_decimals=True):
+        messages = super(Sidewalk, self).validate(check_decimals)
         # Check that the largest vertical fault and number of vertical faults
         # are consistent.
-        if self.is_summary and \
-            (self.LargestVerticalFault == D('None')) != \
-                (self.VerticalFaultCount == 0):
+        no_fault = self.LargestVerticalFault == \
+            self.domain_constants('LargestVerticalFault').NONE
+        if self.is_summary and no_fault != (self.VerticalFaultCount == 0):
             messages.append('Vertical Faults does not match Largest Fault')
         return messages
 
@@ -564,6 +825,19 @@ class CurbRamp(InventoryFeature):
     QASTATUS_FIELD = 'AutoQAStatus'
     QACOMMENT_FIELD = 'AutoQAComment'
 
+    DOMAIN_CONSTANTS = dict(
+        InventoryFeature.DOMAIN_CONSTANTS,
+        AutoQAStatus=QA.only(
+            'COMPLETE', 'NEEDS_FIELD_REVIEW', 'NEEDS_STAFF_REVIEW'),
+        RampType=RAMP_TYPE,
+        EdgeTreatment=EDGE_TREATMENT,
+        DetectableWarningType=DWS_TYPE,
+        InMedian=YES_NO,
+        AutoQAOverride=YES_NO.only('YES'),
+        LargestPavementFault=FAULT_SIZE,
+        SurfaceCondition=SURFACE_CONDITION,
+        Obstruction=OBSTRUCTION)
+
     RampType = NumericField(
         'Ramp Type',
         required=True)
@@ -918,7 +1192,7 @@ class CurbRamp(InventoryFeature):
 
     @property
     def has_ramp(self):
-        return self.RampType != D('None')
+        return self.RampType != self.domain_constants('RampType').NONE
 
     @property
     def has_left_approach(self):
@@ -938,11 +1212,14 @@ class CurbRamp(InventoryFeature):
 
     @property
     def has_flares(self):
-        return self.EdgeTreatment == D('Flared Sides')
+        return self.EdgeTreatment == \
+            self.domain_constants('EdgeTreatment').FLARED_SIDES
 
     @property
     def has_dws(self):
-        return self.DetectableWarningType not in (D('None'), D('N/A'))
+        constants = self.domain_constants('DetectableWarningType')
+        return self.DetectableWarningType not in (
+            constants.NONE, constants.NA)
 
     @property
     def has_gutter(self):
@@ -950,11 +1227,11 @@ class CurbRamp(InventoryFeature):
 
     @property
     def in_median(self):
-        return self.InMedian == D('Yes')
+        return self.InMedian == self.domain_constants('InMedian').YES
 
     @property
     def is_parallel(self):
-        return self.RampType == D('Parallel')
+        return self.RampType == self.domain_constants('RampType').PARALLEL
 
     @property
     def is_blended_transition(self):
@@ -983,40 +1260,40 @@ class CurbRamp(InventoryFeature):
             # Replace N/As with Nones.
             for field_name in ('DetectableWarningType', 'SurfaceCondition',
                                'LargestPavementFault', 'Obstruction'):
-                if getattr(self, field_name) == D('N/A'):
-                    setattr(self, field_name, D('None'))
+                self.replace_value(field_name, 'NA', 'NONE')
 
             # Replace N/A with No for In Median.
-            if self.InMedian == D('N/A'):
-                self.InMedian = D('No')
+            self.replace_value('InMedian', 'NA', 'NO')
 
             # Set null responses to 0 in cases where no value is expected.
-            if self.DetectableWarningType == D('None'):
+            if self.DetectableWarningType == \
+                    self.domain_constants('DetectableWarningType').NONE:
                 if self.DetectableWarningWidth is None:
                     self.DetectableWarningWidth = 0
                 if self.DetectableWarningLength is None:
                     self.DetectableWarningLength = 0
 
-            if self.EdgeTreatment != D('Flared Sides'):
+            if not self.has_flares:
                 if self.FlareSlope is None:
                     self.FlareSlope = 0
 
-    def validate(self):
-        messages = super(CurbRamp, self).validate()
+    def validate(self, check_decimals=True):
+        messages = super(CurbRamp, self).validate(check_decimals)
         # Check that the largest vertical fault and number of vertical faults
         # are consistent.
-        if (self.LargestPavementFault == D('None')) != \
-                (self.PavementFaultCount == 0):
+        no_fault = self.LargestPavementFault == \
+            self.domain_constants('LargestPavementFault').NONE
+        if no_fault != (self.PavementFaultCount == 0):
             messages.append('Vertical Faults does not match Largest Fault')
 
         # Check that the edge treatment matches the flare slope value.
-        if (self.EdgeTreatment == D('Flared Sides')) != \
+        if self.has_flares != \
                 (self.FlareSlope > 0 or self.FlareSlope == -1):
             messages.append('Edge Treatment does not match Flare Slope')
 
         # Ignore validation messages (except for missing photo) if the ramp
         # type is None.
-        if self.RampType == D('None'):
+        if not self.has_ramp:
             messages = []
 
         # Check for a photo.
@@ -1025,19 +1302,26 @@ class CurbRamp(InventoryFeature):
 
         return messages
 
-    def perform_qa(self):
+    def perform_qa(self, check_decimals=True):
         """
         Perform automated quality assurance.
         """
 
         # Don't touch the QA Status if the Override Auto QA Status field
         # is set to Yes.
-        if self.AutoQAOverride != D('Yes'):
-            return super(CurbRamp, self).perform_qa()
+        if self.AutoQAOverride != \
+                self.domain_constants('AutoQAOverride').YES:
+            return super(CurbRamp, self).perform_qa(check_decimals)
 
 
 class Crosswalk(InventoryFeature):
 
+    DOMAIN_CONSTANTS = dict(
+        InventoryFeature.DOMAIN_CONSTANTS,
+        MarkingType=MARKING_TYPE,
+        StopControlledIntersection=YES_NO.only('YES'),
+        MidblockCrossing=YES_NO.only('YES'))
+
     SurfaceType = NumericField(
         'Surface Type',
         required=True)
@@ -1098,16 +1382,20 @@ class Crosswalk(InventoryFeature):
 
     @property
     def has_width(self):
+        constants = self.domain_constants('MarkingType')
         return self.MarkingType not in (
-            D('No Painted Markings'), D('Box for Exclusive Period'))
+            constants.NO_PAINTED_MARKINGS,
+            constants.BOX_FOR_EXCLUSIVE_PERIOD)
 
     @property
     def is_stop_controlled(self):
-        return self.StopControlledIntersection == D('Yes')
+        return self.StopControlledIntersection == \
+            self.domain_constants('StopControlledIntersection').YES
 
     @property
     def is_midblock(self):
-        return self.MidblockCrossing == D('Yes')
+        return self.MidblockCrossing == \
+            self.domain_constants('MidblockCrossing').YES
 
     def clean(self):
         if not self.has_width and self.Width is None:
@@ -1129,6 +1417,18 @@ class PedestrianSignal(InventoryFeature):
         'LocatorTone',
     ]
 
+    DOMAIN_CONSTANTS = dict(
+        InventoryFeature.DOMAIN_CONSTANTS,
+        PedButtonLocation=BUTTON_LOCATION,
+        PedButtonSize=BUTTON_SIZE,
+        ButtonSpacing=YES_NO,
+        ButtonOffsetFCurb=YES_NO,
+        AllWeatherSurface=YES_NO,
+        HighContrastButton=YES_NO,
+        LocatorTone=YES_NO,
+        TactileArrowPresent=YES_NO,
+        VibrotactileSignal=YES_NO)
+
     SignalPresent = NumericField('Signal Present', required=True)
     PedButtonLocation = NumericField('Button Location', required=True)
     PedButtonSize = NumericField('Button Size', required=True)
@@ -1181,25 +1481,30 @@ class PedestrianSignal(InventoryFeature):
         scale=SCORE_SCALE,
         method_name='_compliance_score')
 
+    def is_yes(self, field_name):
+        return getattr(self, field_name) == \
+            self.domain_constants(field_name).YES
+
     def _position_appearance_score(self, field_name):
         score = 0
-        if self.ButtonCount == 1 or self.ButtonSpacing == D('Yes'):
+        if self.ButtonCount == 1 or \
+                self.is_yes('ButtonSpacing'):
             score += 15
-        if self.ButtonOffsetFCurb == D('Yes'):
+        if self.is_yes('ButtonOffsetFCurb'):
             score += 15
-        if self.AllWeatherSurface == D('Yes'):
+        if self.is_yes('AllWeatherSurface'):
             score += 15
-        if self.HighContrastButton == D('Yes'):
+        if self.is_yes('HighContrastButton'):
             score += 25
-        if self.LocatorTone == D('Yes'):
+        if self.is_yes('LocatorTone'):
             score += 30
         return score
 
     def _tactile_features_score(self, field_name):
         score = 0
-        if self.TactileArrowPresent == D('Yes'):
+        if self.is_yes('TactileArrowPresent'):
             score += 50
-        if self.VibrotactileSignal == D('Yes'):
+        if self.is_yes('VibrotactileSignal'):
             score += 50
         return score
 
@@ -1213,8 +1518,10 @@ class PedestrianSignal(InventoryFeature):
 
     @property
     def has_button(self):
-        return self.PedButtonLocation not in (D('No Button'), D('N/A')) and \
-            self.PedButtonSize != D('No Button')
+        location = self.domain_constants('PedButtonLocation')
+        return self.PedButtonLocation not in (
+            location.NO_BUTTON, location.NA) and self.PedButtonSize != \
+            self.domain_constants('PedButtonSize').NO_BUTTON
 
     def clean(self):
         # Set irrelevant fields to N/A for signals that don't have a button.
@@ -1222,13 +1529,16 @@ class PedestrianSignal(InventoryFeature):
             for field_name in self.BUTTON_FIELDS:
                 if getattr(self, field_name) is None:
                     field = self.fields.get(field_name)
-                    if field.domain_name is not None:
+                    if field_name in self.DOMAIN_CONSTANTS:
+                        setattr(self, field_name,
+                                self.domain_constants(field_name).NA)
+                    elif field.domain_name is not None:
                         setattr(self, field_name, D('N/A'))
                     else:
                         setattr(self, field_name, 0)
 
-    def validate(self):
-        messages = super(PedestrianSignal, self).validate()
+    def validate(self, check_decimals=True):
+        messages = super(PedestrianSignal, self).validate(check_decimals)
         if not (self.has_button == (self.ButtonCount > 0)):
             messages.append('Button Count does not match Button Location')
         return messages
@@ -0,0 +1,107 @@
+"""
+Fingerprints of Sidewalk Inventory and Assessment feature values.
+
+A fingerprint is a hash of the values that a job reads from a feature. Jobs
+store the fingerprint of each feature after processing it, so that the next
+run can skip features whose values have not changed since.
+"""
+
+import hashlib
+import inspect
+import sqlite3
+from batch import search_cursor, column_name, oid_field_name
+
+
+def normalize(value):
+    """
+    Return a value with a stable representation.
+    """
+
+    # Coded values may be objects with a code, and floats have a stable
+    # shortest repr.
+    return getattr(value, 'code', value)
+
+
+def fingerprint(values):
+    """
+    Return the fingerprint of a sequence of values.
+    """
+
+    return hashlib.sha1(
+        repr(tuple(normalize(v) for v in values))).hexdigest()
+
+
+def feature_fingerprint(feature, field_names, related=()):
+    """
+    Return the fingerprint of the given fields and related counts of a
+    feature.
+    """
+
+    values = [getattr(feature, n) for n in field_names]
+    values.extend(getattr(feature, n).count() for n in related)
+    return fingerprint(values)
+
+
+def rules_version(feature_class):
+    """
+    Return a fingerprint of the source of the module that defines the
+    feature class, which includes its score scales and weights.
+    """
+
+    with open(inspect.getsourcefile(feature_class), 'rb') as source:
+        return hashlib.sha1(source.read()).hexdigest()
+
+
+def data_version(feature_class, date_field, *parts):
+    """
+    Return the version of the data in a feature class: a fingerprint of its
+    row count, its latest editor tracking date, its scoring rules and any
+    other parts, such as the definitions of tables built from it.
+    """
+
+    columns = [column_name(feature_class, oid_field_name(feature_class)),
+               date_field]
+    with search_cursor(feature_class, columns) as cursor:
+        dates = [row[1] for row in cursor]
+    latest = max([d for d in dates if d is not None] or [None])
+    return fingerprint(
+        [len(dates), latest, rules_version(feature_class)] + list(parts))
+
+
+class FingerprintStore(object):
+    """
+    Side table of feature fingerprints stored in a SQLite database.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprint ('
+            'job TEXT, feature_class TEXT, oid INTEGER, fingerprint TEXT, '
+            'version TEXT, PRIMARY KEY (job, feature_class, oid))')
+
+    def load(self, job, feature_class):
+        """
+        Return the stored fingerprints and versions, keyed by OID.
+        """
+
+        cursor = self.connection.execute(
+            'SELECT oid, fingerprint, version FROM fingerprint '
+            'WHERE job = ? AND feature_class = ?', (job, feature_class))
+        return dict((oid, (fp, version)) for (oid, fp, version) in cursor)
+
+    def save(self, job, feature_class, fingerprints, version):
+        """
+        Store fingerprints, given as (OID, fingerprint) pairs.
+        """
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO fingerprint '
+                '(job, feature_class, oid, fingerprint, version) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(job, feature_class, oid, fp, version)
+                 for (oid, fp) in fingerprints])
+
+    def close(self):
+        self.connection.close()
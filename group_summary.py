@@ -0,0 +1,151 @@
+"""
+Summaries of Sidewalk Inventory and Assessment features by group.
+
+Features are grouped by the value of a field, such as Municipality, and
+every group is summarized in a single pass over the features, instead of a
+query for each group, field and level. Feature types without the field take
+the group of their nearest sidewalk segment.
+"""
+
+from collections import OrderedDict
+from batch import search_cursor, column_name, oid_field_name
+
+# Name of the group of features without a group value.
+NO_GROUP = 'None'
+
+
+def group_name(value):
+    """
+    Return the name of the group for a field value.
+    """
+
+    if value is None or value == '':
+        return NO_GROUP
+    if isinstance(value, basestring):
+        return value
+    return str(value)
+
+
+def segment_groups(segment_class, group_field):
+    """
+    Return the group of each segment, keyed by segment OID.
+    """
+
+    columns = [column_name(segment_class, oid_field_name(segment_class)),
+               column_name(segment_class, group_field)]
+    with search_cursor(segment_class, columns) as cursor:
+        return dict((oid, group_name(group)) for (oid, group) in cursor)
+
+
+def nearest_segments(feature_class, segment_class):
+    """
+    Return the OID of the segment nearest to each feature, keyed by feature
+    OID, for feature classes without a nearest segment field.
+    """
+
+    import arcpy
+
+    near_table = r'in_memory\nearest_segments'
+    arcpy.GenerateNearTable_analysis(
+        feature_class.path, segment_class.path, near_table,
+        closest='CLOSEST')
+    try:
+        with arcpy.da.SearchCursor(
+                near_table, ['IN_FID', 'NEAR_FID']) as cursor:
+            return dict(cursor)
+    finally:
+        arcpy.Delete_management(near_table)
+
+
+def summarize_groups(query_set, field_names, group, **kwargs):
+    """
+    Summarize several fields for each group of features in one pass over a
+    query set. Returns the levels of each field, as QuerySet.summarize()
+    would for the features of the group, keyed by group name and field name.
+    The group is the name of a field, or a function of the feature. Keyword
+    arguments are expressions evaluated for each feature, or functions of
+    the feature, and are added up by level.
+    """
+
+    group_of = group if callable(group) else \
+        lambda feature: getattr(feature, group)
+
+    fields = [(name, query_set.feature_class.fields[name])
+              for name in field_names]
+    levels = dict((name, field.get_levels()) for (name, field) in fields)
+
+    def empty_levels(name):
+        results = {}
+        for level in levels[name]:
+            result = {}
+            result.update(level.meta)
+            result.update(dict((k, 0) for k in kwargs.keys()))
+            result.update({
+                'count': 0,
+                'value': level.value,
+                'label': level.label,
+            })
+            results[hash(level)] = result
+        return results
+
+    groups = {}
+    for feature in query_set:
+        key = group_name(group_of(feature))
+        results = groups.get(key)
+        if results is None:
+            results = groups[key] = dict(
+                (name, empty_levels(name)) for (name, field) in fields)
+        values = [(k, expr(feature) if callable(expr) else feature.eval(expr))
+                  for (k, expr) in kwargs.items()]
+        for (name, field) in fields:
+            result = results[name][hash(field.summarize(feature))]
+            result['count'] += 1
+            for (k, value) in values:
+                result[k] += value
+
+    return OrderedDict(
+        (key, dict(
+            (name, [groups[key][name][hash(l)] for l in levels[name]])
+            for (name, field) in fields))
+        for key in sorted(groups.keys()))
+
+
+class GroupTally(object):
+    """
+    Counts and lengths of features by group and category.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.lengths = {}
+
+    def add(self, group, category, length=0.0):
+        counts = self.counts.setdefault(group, {})
+        counts[category] = counts.get(category, 0) + 1
+        lengths = self.lengths.setdefault(group, {})
+        lengths[category] = lengths.get(category, 0.0) + (length or 0.0)
+
+    def groups(self):
+        return sorted(self.counts.keys())
+
+    def count(self, group, category=None):
+        """
+        Return the number of features in a group and category, or in the
+        whole group if no category is given.
+        """
+
+        counts = self.counts.get(group, {})
+        if category is None:
+            return sum(counts.values())
+        return counts.get(category, 0)
+
+    def length(self, group, category=None):
+        """
+        Return the length of the features in a group and category, or in
+        the whole group if no category is given.
+        """
+
+        lengths = self.lengths.get(group, {})
+        if category is None:
+            return sum(lengths.values())
+        return lengths.get(category, 0.0)
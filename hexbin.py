@@ -0,0 +1,208 @@
+"""
+Hexagonal grid binning of Sidewalk Inventory and Assessment scores.
+
+Cells of a regular hexagonal grid are found arithmetically from feature
+coordinates, so features can be aggregated at several cell sizes without
+any polygon overlay. Cells are pointy-topped hexagons with the given size,
+the distance from the center to each corner, identified by their axial
+(q, r) coordinates on a grid centered on the origin of the coordinate
+system.
+
+Point features are binned by their location. Linear features are split
+into short pieces whose midpoints are binned, and each piece adds its
+length to the totals of its cell, so scores are length-weighted as with the
+intersection in aggregate_results.py. Only pieces that cross a cell edge
+are assigned to one side, so the error in each cell is at most one piece
+length per crossing.
+"""
+
+import numpy as np
+from collections import OrderedDict
+from sketch import BIN_COUNT, score_bins
+from zone_hierarchy import ZoneTotals
+
+SQRT_3 = np.sqrt(3.0)
+
+# Length of the pieces of linear features, as a fraction of the smallest
+# cell size.
+PIECE_FRACTION = 0.1
+
+# Multiplier for combining axial coordinates into a single key.
+KEY_BASE = 1 << 31
+
+
+def hex_cells(x, y, size):
+    """
+    Return the axial (q, r) coordinates of the cells containing points, as
+    integer arrays.
+    """
+
+    x = np.asarray(x, dtype=float) / size
+    y = np.asarray(y, dtype=float) / size
+    q = (SQRT_3 / 3.0) * x - y / 3.0
+    r = (2.0 / 3.0) * y
+
+    # Round the cube coordinates, fixing the component with the largest
+    # rounding error so that they still add up to zero.
+    s = -q - r
+    (rq, rr, rs) = (np.rint(q), np.rint(r), np.rint(s))
+    (dq, dr, ds) = (np.abs(rq - q), np.abs(rr - r), np.abs(rs - s))
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return (rq.astype(np.int64), rr.astype(np.int64))
+
+
+def hex_center(q, r, size):
+    """
+    Return the (x, y) center of a cell.
+    """
+
+    return (size * SQRT_3 * (q + r / 2.0), size * 1.5 * r)
+
+
+def hex_corners(q, r, size):
+    """
+    Return the corners of a cell as a closed list of (x, y) points.
+    """
+
+    (x, y) = hex_center(q, r, size)
+    angles = np.radians(np.arange(7) * 60.0 + 30.0)
+    return zip(x + size * np.cos(angles), y + size * np.sin(angles))
+
+
+def line_segments(lines):
+    """
+    Return the straight segments of lines as (x1, y1, x2, y2, feature)
+    arrays, where feature is the index of the line. Each line is a list of
+    parts, and each part is a list of (x, y) vertices.
+    """
+
+    segments = []
+    for (feature, parts) in enumerate(lines):
+        for part in parts:
+            for ((x1, y1), (x2, y2)) in zip(part[:-1], part[1:]):
+                segments.append((x1, y1, x2, y2, feature))
+    if not segments:
+        return tuple(np.empty(0) for i in range(4)) + (
+            np.empty(0, dtype=np.int64),)
+    segments = np.array(segments, dtype=float)
+    return (segments[:, 0], segments[:, 1], segments[:, 2], segments[:, 3],
+            segments[:, 4].astype(np.int64))
+
+
+def split_segments(x1, y1, x2, y2, piece_length):
+    """
+    Split segments into equal pieces no longer than the piece length, and
+    return the midpoint x and y, length and segment index of every piece.
+    """
+
+    (dx, dy) = (x2 - x1, y2 - y1)
+    lengths = np.hypot(dx, dy)
+    counts = np.maximum(np.ceil(lengths / piece_length), 1).astype(np.int64)
+    segment = np.repeat(np.arange(len(lengths)), counts)
+
+    # Position of each piece within its segment.
+    starts = np.cumsum(counts) - counts
+    position = np.arange(counts.sum()) - np.repeat(starts, counts)
+    t = (position + 0.5) / counts[segment]
+    return (x1[segment] + t * dx[segment], y1[segment] + t * dy[segment],
+            (lengths / counts)[segment], segment)
+
+
+def bin_totals(q, r, scores, counted, lengths=None, features=None,
+               sketched=()):
+    """
+    Add up scores by cell, and return the totals keyed by (q, r). Scores
+    are a two-dimensional array with a row for each feature, a column for
+    each score and NaN for nulls. For linear features, each row is a piece
+    with its length and the index of its feature, and a feature is counted
+    once in each cell it crosses. Sketched scores are given by their index.
+    """
+
+    scores = np.asarray(scores, dtype=float)
+    counted = np.asarray(counted, dtype=bool)
+    keys = q * KEY_BASE + r
+    (unique_keys, first, cell) = np.unique(
+        keys, return_index=True, return_inverse=True)
+    size = len(unique_keys)
+
+    weights = np.ones(len(q)) if lengths is None else lengths
+    valid = ~np.isnan(scores)
+    sums = [np.bincount(cell, np.where(valid[:, i], scores[:, i], 0.0) *
+                        weights, size) for i in range(scores.shape[1])]
+    score_weights = [np.bincount(cell, valid[:, i] * weights, size)
+                     for i in range(scores.shape[1])]
+    cell_lengths = np.zeros(size) if lengths is None else np.bincount(
+        cell, lengths, size)
+
+    if features is None:
+        counts = np.bincount(cell, counted, size)
+    else:
+        # Count each feature once per cell.
+        feature_count = features.max() + 1 if len(features) else 1
+        pairs = np.unique((cell * feature_count + features)[counted])
+        counts = np.bincount(pairs // feature_count, minlength=size)
+
+    cell_totals = []
+    for i in range(size):
+        zone_totals = ZoneTotals(scores.shape[1], sketched)
+        zone_totals.count = int(counts[i])
+        zone_totals.length = float(cell_lengths[i])
+        zone_totals.sums = [float(s[i]) for s in sums]
+        zone_totals.weights = [float(w[i]) for w in score_weights]
+        cell_totals.append(zone_totals)
+
+    # Add up the weight in each score bin of each cell.
+    for (j, i) in enumerate(sketched):
+        pairs = cell[valid[:, i]] * BIN_COUNT + score_bins(
+            scores[valid[:, i], i])
+        (unique_pairs, pair) = np.unique(pairs, return_inverse=True)
+        pair_weights = np.bincount(pair, weights[valid[:, i]])
+        for (cell_bin, weight) in zip(unique_pairs, pair_weights):
+            cell_totals[cell_bin // BIN_COUNT].sketches[j].weights[
+                int(cell_bin % BIN_COUNT)] = float(weight)
+
+    return dict(((int(q[first[i]]), int(r[first[i]])), cell_totals[i])
+                for i in range(size))
+
+
+def bin_points(x, y, scores, counted, sizes, sketched=()):
+    """
+    Bin point features at each cell size, and return the totals keyed by
+    size and (q, r). Scores are a two-dimensional array as in bin_totals().
+    """
+
+    results = OrderedDict()
+    for size in sizes:
+        (q, r) = hex_cells(x, y, size)
+        results[size] = bin_totals(q, r, scores, counted,
+                                   sketched=sketched)
+    return results
+
+
+def bin_lines(lines, scores, counted, sizes, piece_length=None,
+              sketched=()):
+    """
+    Bin linear features at each cell size, and return the totals keyed by
+    size and (q, r). Each line is a list of parts, and each part is a list
+    of (x, y) vertices, and scores are a two-dimensional array as in
+    bin_totals(). Lines are split once, into pieces no longer than the piece
+    length, which defaults to a fraction of the smallest size.
+    """
+
+    if piece_length is None:
+        piece_length = min(sizes) * PIECE_FRACTION
+    scores = np.asarray(scores, dtype=float)
+    counted = np.asarray(counted, dtype=bool)
+    (x1, y1, x2, y2, features) = line_segments(lines)
+    (x, y, lengths, segment) = split_segments(x1, y1, x2, y2, piece_length)
+    features = features[segment]
+
+    results = OrderedDict()
+    for size in sizes:
+        (q, r) = hex_cells(x, y, size)
+        results[size] = bin_totals(q, r, scores[features], counted[features],
+                                   lengths, features, sketched)
+    return results
@@ -0,0 +1,176 @@
+"""
+Run instrumentation for Sidewalk Inventory and Assessment batch scripts.
+
+A run log records, for each phase of a script and each feature class, the
+wall time, the rows read, written and skipped, the time spent waiting on
+cursors versus running Python code, and how much the phase raised the peak
+resident set size of the process. The peak itself is only known for the
+whole process, so it is recorded once for the run. The log is written as
+JSON so that nightly runs can be compared.
+"""
+
+import datetime
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of the process in bytes, or None if
+    it cannot be determined.
+    """
+
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes.
+        return usage if sys.platform == 'darwin' else usage * 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss)
+    return None
+
+
+class Phase(object):
+    """
+    Counters and timers for one phase of a run.
+    """
+
+    def __init__(self, name, feature_class=None):
+        self.name = name
+        self.feature_class = feature_class
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
+        self.cursor_time = 0.0
+        self.wall_time = 0.0
+        self.peak_rss_growth = None
+        self._start = time.time()
+        self._start_peak_rss = peak_rss()
+
+    @property
+    def python_time(self):
+        return max(0.0, self.wall_time - self.cursor_time)
+
+    @contextmanager
+    def cursor(self):
+        """
+        Count the time spent in the block as cursor time.
+        """
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.cursor_time += time.time() - start
+
+    def read(self, iterable):
+        """
+        Iterate over rows, counting them and the time spent fetching them.
+        """
+
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.cursor_time += time.time() - start
+                return
+            self.cursor_time += time.time() - start
+            self.rows_read += 1
+            yield item
+
+    def finish(self):
+        self.wall_time = time.time() - self._start
+        # A phase that stays below the peak of an earlier phase does not
+        # raise it, so its growth is zero.
+        end_peak_rss = peak_rss()
+        if end_peak_rss is not None and self._start_peak_rss is not None:
+            self.peak_rss_growth = end_peak_rss - self._start_peak_rss
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'feature_class': self.feature_class,
+            'wall_time': round(self.wall_time, 3),
+            'cursor_time': round(self.cursor_time, 3),
+            'python_time': round(self.python_time, 3),
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'rows_skipped': self.rows_skipped,
+            'peak_rss_growth': self.peak_rss_growth,
+        }
+
+
+class RunLog(object):
+    """
+    Log of the phases of a script run.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.started = datetime.datetime.now()
+        self.phases = []
+        self._start = time.time()
+
+    @contextmanager
+    def phase(self, name, feature_class=None):
+        """
+        Record a phase of the run.
+        """
+
+        phase = Phase(name, feature_class)
+        try:
+            yield phase
+        finally:
+            phase.finish()
+            self.phases.append(phase)
+
+    def as_dict(self):
+        return {
+            'script': self.script,
+            'started': self.started.isoformat(),
+            'wall_time': round(time.time() - self._start, 3),
+            'peak_rss': peak_rss(),
+            'phases': [p.as_dict() for p in self.phases],
+        }
+
+    def report(self):
+        """
+        Print a summary of each phase.
+        """
+
+        for phase in self.phases:
+            print '%-40s %8.1fs (cursor %0.1fs) %8i read %8i written ' \
+                '%8i skipped' % (
+                    ': '.join(n for n in (phase.name, phase.feature_class)
+                              if n),
+                    phase.wall_time, phase.cursor_time, phase.rows_read,
+                    phase.rows_written, phase.rows_skipped)
+
+    def save(self, directory):
+        """
+        Write the run log to a timestamped JSON file in the directory, and
+        return its path. Nothing is written if the directory is blank.
+        """
+
+        if not directory:
+            return None
+        path = os.path.join(directory, '%s-%s.json' % (
+            self.script, self.started.strftime('%Y%m%d-%H%M%S')))
+        with open(path, 'wb') as log_file:
+            json.dump(self.as_dict(), log_file, indent=4)
+        return path
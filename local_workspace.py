@@ -0,0 +1,730 @@
+"""
+Local SQLite stand-in for the Sidewalk Inventory and Assessment geodatabase.
+
+A local workspace stores the feature classes, their coded value domains, the
+attachment tables and the sidewalk segment relationship in a single SQLite
+file, so that the batch jobs can run and be benchmarked off the production
+network. Geometries are stored as WKT. Feature classes registered with a
+local workspace are read and written by the batch cursors in batch.py, and
+their query sets and saves go through the same cursors, so the batch and
+per-object paths can be compared on the same rows.
+"""
+
+import argparse
+import datetime
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple, OrderedDict
+from itertools import islice
+from contextlib import contextmanager
+from math import floor, hypot
+from cuuats.datamodel.exceptions import ObjectDoesNotExist, \
+    MultipleObjectsReturned
+from cuuats.datamodel.features import BaseAttachment, \
+    attachment_class_factory
+from batch import stored_field_names, score_field_names, column_name, \
+    oid_field_name
+
+# Number of rows fetched per simulated round trip.
+FETCH_SIZE = 1000
+
+# Format of editor tracking dates, which sorts in date order.
+EDIT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Columns of an attachment table.
+ATTACHMENT_COLUMNS = [
+    'REL_GLOBALID', 'ATT_NAME', 'CONTENT_TYPE', 'DATA_SIZE', 'DATA']
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?')
+
+
+def quote(name):
+    return '"%s"' % (name.replace('"', '""'),)
+
+
+class CodedValueDomain(object):
+    """
+    Coded value domain with the attributes of an arcpy domain.
+    """
+
+    def __init__(self, name, coded_values):
+        self.name = name
+        self.domainType = 'CodedValue'
+        self.codedValues = coded_values
+
+
+class LocalField(object):
+    """
+    Table column with the attributes of an arcpy field that field
+    registration uses.
+    """
+
+    def __init__(self, name, domain=None):
+        self.name = name
+        self.domain = domain
+        self.scale = None
+        self.precision = None
+
+
+# Attachment relationship, as returned by Workspace.get_attachment_info().
+RelationshipInfo = namedtuple(
+    'RelationshipInfo', ['origin', 'destination', 'primary_key',
+                         'foreign_key', 'is_attachment'])
+
+
+class LocalGeometry(object):
+    """
+    Point or polyline geometry with the attributes the data model uses.
+    """
+
+    __slots__ = ('points', 'is_point')
+
+    def __init__(self, points, is_point=False):
+        self.points = [tuple(p) for p in points]
+        self.is_point = is_point
+
+    @classmethod
+    def from_wkt(cls, wkt):
+        if wkt is None:
+            return None
+        numbers = [float(n) for n in _NUMBER.findall(wkt)]
+        points = zip(numbers[0::2], numbers[1::2])
+        return cls(points, wkt.lstrip().upper().startswith('POINT'))
+
+    @property
+    def wkt(self):
+        coordinates = ', '.join('%r %r' % p for p in self.points)
+        if self.is_point:
+            return 'POINT (%s)' % (coordinates,)
+        return 'LINESTRING (%s)' % (coordinates,)
+
+    @property
+    def length(self):
+        return sum(hypot(x2 - x1, y2 - y1) for ((x1, y1), (x2, y2))
+                   in zip(self.points[:-1], self.points[1:]))
+
+    @property
+    def extent(self):
+        xs = [p[0] for p in self.points]
+        ys = [p[1] for p in self.points]
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def distance_to(self, point):
+        """
+        Return the distance from an (x, y) point to the geometry.
+        """
+
+        (x, y) = point
+        if len(self.points) == 1:
+            return hypot(self.points[0][0] - x, self.points[0][1] - y)
+        distance = None
+        for ((x1, y1), (x2, y2)) in zip(self.points[:-1], self.points[1:]):
+            (dx, dy) = (x2 - x1, y2 - y1)
+            length2 = dx * dx + dy * dy
+            t = 0.0 if length2 == 0 else max(0.0, min(1.0, (
+                (x - x1) * dx + (y - y1) * dy) / length2))
+            d = hypot(x1 + t * dx - x, y1 + t * dy - y)
+            if distance is None or d < distance:
+                distance = d
+        return distance
+
+
+def _geometry_value(column, wkt):
+    geometry = LocalGeometry.from_wkt(wkt)
+    if column == 'SHAPE@WKT' or geometry is None:
+        return wkt
+    if column == 'SHAPE@LENGTH':
+        return geometry.length
+    if column == 'SHAPE@XY':
+        return geometry.points[0]
+    return geometry
+
+
+class LocalSearchCursor(object):
+    """
+    Search cursor over a table in a local workspace.
+    """
+
+    def __init__(self, workspace, table, columns, where=None, postfix=None):
+        self.workspace = workspace
+        self.table = table
+        self.columns = list(columns)
+        (self._oid, self._shape) = workspace.table_info(table)
+        sql = 'SELECT %s FROM %s' % (
+            ', '.join([quote(self._oid)] + [
+                quote(self._column(c)) for c in self.columns]),
+            quote(table))
+        if where:
+            sql += ' WHERE ' + where
+        if postfix:
+            sql += ' ' + postfix
+        workspace.wait()
+        with workspace.lock:
+            self._rows = self._execute(sql)
+        self._oid_value = None
+
+    def _execute(self, sql):
+        return self.workspace.connection.execute(sql)
+
+    def _fetch(self):
+        with self.workspace.lock:
+            return self._rows.fetchmany(FETCH_SIZE)
+
+    def _column(self, column):
+        if column == 'OID@':
+            return self._oid
+        return self._shape if column.startswith('SHAPE@') else column
+
+    def _row(self, values):
+        return tuple(
+            _geometry_value(c, v) if c.startswith('SHAPE@') else v
+            for (c, v) in zip(self.columns, values))
+
+    def __iter__(self):
+        # Rows are fetched in round trips so that another thread can use
+        # the connection in between.
+        while True:
+            rows = self._fetch()
+            for row in rows:
+                self._oid_value = row[0]
+                yield self._row(row[1:])
+            if len(rows) < FETCH_SIZE:
+                return
+            self.workspace.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._rows = []
+
+
+class LocalUpdateCursor(LocalSearchCursor):
+    """
+    Update cursor over a table in a local workspace.
+    """
+
+    def __init__(self, workspace, table, columns, where=None, postfix=None):
+        super(LocalUpdateCursor, self).__init__(
+            workspace, table, columns, where, postfix)
+        self._updates = 0
+        self._edit_date = workspace.edit_date_field
+        if self._edit_date not in workspace.table_columns(table):
+            self._edit_date = None
+
+    def _execute(self, sql):
+        # Read the rows up front so that updates don't disturb the query.
+        return iter(self.workspace.connection.execute(sql).fetchall())
+
+    def _fetch(self):
+        return list(islice(self._rows, FETCH_SIZE))
+
+    def _row(self, values):
+        return list(super(LocalUpdateCursor, self)._row(values))
+
+    def updateRow(self, row):
+        self._updates += 1
+        if self._updates % FETCH_SIZE == 0:
+            self.workspace.wait()
+        assignments = []
+        values = []
+        for (column, value) in zip(self.columns, row):
+            if column in ('SHAPE@', 'SHAPE@WKT'):
+                value = getattr(value, 'wkt', value)
+            elif column.startswith('SHAPE@') or column == 'OID@':
+                continue
+            assignments.append('%s = ?' % (quote(self._column(column)),))
+            values.append(value)
+        if self._edit_date:
+            assignments.append('%s = ?' % (quote(self._edit_date),))
+            values.append(datetime.datetime.utcnow().strftime(
+                EDIT_DATE_FORMAT))
+        with self.workspace.lock:
+            self.workspace.connection.execute(
+                'UPDATE %s SET %s WHERE %s = ?' % (
+                    quote(self.table), ', '.join(assignments),
+                    quote(self._oid)),
+                values + [self._oid_value])
+
+
+class Registration(object):
+    """
+    Snapshot of the registration of feature classes, including the classes
+    their foreign keys relate them to, which restore() puts back.
+    """
+
+    FIELD_ATTRIBUTES = ('name', 'db_name', 'domain_name', 'choices',
+                        'db_scale', 'db_precision')
+
+    def __init__(self, feature_classes):
+        classes = list(feature_classes)
+        for feature_class in list(classes):
+            for field in feature_class.fields.values():
+                origin_class = getattr(field, 'origin_class', None)
+                if origin_class is not None and origin_class not in classes:
+                    classes.append(origin_class)
+        self.classes = []
+        for feature_class in classes:
+            attributes = dict(feature_class.__dict__)
+            if attributes.get('related_classes') is not None:
+                attributes['related_classes'] = dict(
+                    attributes['related_classes'])
+            fields = [(field, [
+                list(getattr(field, a)) if a == 'choices' else
+                getattr(field, a, None) for a in self.FIELD_ATTRIBUTES])
+                for field in feature_class.fields.values()]
+            self.classes.append((feature_class, attributes, fields))
+
+    def restore(self):
+        for (feature_class, attributes, fields) in self.classes:
+            for name in feature_class.__dict__.keys():
+                if name not in attributes:
+                    delattr(feature_class, name)
+            for (name, value) in attributes.items():
+                if feature_class.__dict__.get(name) is not value and \
+                        not name.startswith('__'):
+                    setattr(feature_class, name, value)
+            for (field, values) in fields:
+                for (name, value) in zip(self.FIELD_ATTRIBUTES, values):
+                    setattr(field, name, value)
+
+
+class LocalWorkspace(object):
+    """
+    Feature classes, domains, attachments and relationships stored in a
+    SQLite database. The latency, in seconds, is added to each cursor and
+    each fetch or update of FETCH_SIZE rows to approximate a networked
+    geodatabase. Cursors can be used from several threads at once; each
+    statement holds the workspace lock.
+
+    With an edit date field, feature class tables get an editor tracking
+    column that update cursors set to the UTC time of each update.
+    """
+
+    # Batch cursors use the workspace cursors instead of arcpy.
+    local = True
+
+    def __init__(self, path, latency=0.0, edit_date_field=None):
+        self.path = path
+        self.latency = latency
+        self.edit_date_field = edit_date_field
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self._domains = {}
+        # Registration of each feature class before it was registered with
+        # this workspace.
+        self._registrations = OrderedDict()
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS gdb_table (
+                name TEXT PRIMARY KEY, oid_column TEXT, shape_column TEXT);
+            CREATE TABLE IF NOT EXISTS gdb_domain (
+                name TEXT, code, description TEXT,
+                PRIMARY KEY (name, code));
+            CREATE TABLE IF NOT EXISTS gdb_field_domain (
+                table_name TEXT, field TEXT, domain TEXT,
+                PRIMARY KEY (table_name, field));
+            CREATE TABLE IF NOT EXISTS gdb_relationship (
+                name TEXT PRIMARY KEY, origin_table TEXT, origin_key TEXT,
+                destination_table TEXT, foreign_key TEXT);
+        ''')
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def table_info(self, table):
+        """
+        Return the OID and shape columns of a table.
+        """
+
+        row = self.connection.execute(
+            'SELECT oid_column, shape_column FROM gdb_table WHERE name = ?',
+            (table,)).fetchone()
+        if row is None:
+            raise ValueError('%s is not in %s' % (table, self.path))
+        return row
+
+    def table_columns(self, table):
+        with self.lock:
+            return [row[1] for row in self.connection.execute(
+                'PRAGMA table_info(%s)' % (quote(table),))]
+
+    @contextmanager
+    def edit(self):
+        """
+        Commit the edits made in the block, or roll them back on error.
+        """
+
+        try:
+            yield self
+        except Exception:
+            with self.lock:
+                self.connection.rollback()
+            raise
+        with self.lock:
+            self.connection.commit()
+
+    def search_cursor(self, table, columns, where=None,
+                      sql_clause=(None, None)):
+        # Only the postfix of an arcpy sql_clause, such as ORDER BY, is
+        # supported.
+        return LocalSearchCursor(self, table, columns, where, sql_clause[1])
+
+    def update_cursor(self, table, columns, where=None):
+        return LocalUpdateCursor(self, table, columns, where)
+
+    def count(self, table, where=None):
+        sql = 'SELECT COUNT(*) FROM %s' % (quote(table),)
+        if where:
+            sql += ' WHERE ' + where
+        self.wait()
+        with self.lock:
+            return self.connection.execute(sql).fetchone()[0]
+
+    def count_rows(self, layer_name, where_clause=None):
+        return self.count(layer_name, where_clause)
+
+    def iter_rows(self, layer_name, field_names, update=False,
+                  where_clause=None, limit=None, prefix=None, postfix=None):
+        """
+        Iterate over (row, cursor) pairs, as Workspace.iter_rows() does for
+        the query sets and saves of the data model.
+        """
+
+        cursor_class = LocalUpdateCursor if update else LocalSearchCursor
+        with cursor_class(self, layer_name, field_names, where_clause,
+                          postfix) as cursor:
+            for row in islice(cursor, limit):
+                yield (list(row), cursor)
+
+    def update_row(self, cursor, values):
+        cursor.updateRow(values)
+
+    def get_row(self, layer_name, field_names, where_clause=None):
+        rows = [row for (row, cursor) in self.iter_rows(
+            layer_name, field_names, where_clause=where_clause, limit=2)]
+        if len(rows) == 0:
+            raise ObjectDoesNotExist(where_clause)
+        if len(rows) > 1:
+            raise MultipleObjectsReturned(where_clause)
+        return rows[0]
+
+    def get_layer_fields(self, layer_name):
+        """
+        Return the columns of a table, keyed by name, with their domains.
+        """
+
+        domains = dict(self.connection.execute(
+            'SELECT field, domain FROM gdb_field_domain WHERE table_name = ?',
+            (layer_name,)))
+        return OrderedDict((c, LocalField(c, domains.get(c)))
+                           for c in self.table_columns(layer_name))
+
+    def get_attachment_info(self, layer_name):
+        """
+        Return the attachment relationship of a table, if it has an
+        attachment table.
+        """
+
+        attach_table = layer_name + '__ATTACH'
+        if self.connection.execute(
+                'SELECT name FROM gdb_table WHERE name = ?',
+                (attach_table,)).fetchone() is None:
+            return None
+        return RelationshipInfo(
+            layer_name, attach_table, 'GlobalID', 'REL_GLOBALID', True)
+
+    def add_domain(self, name, coded_values):
+        self._domains.pop(name, None)
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM gdb_domain WHERE name = ?', (name,))
+            self.connection.executemany(
+                'INSERT INTO gdb_domain VALUES (?, ?, ?)',
+                [(name, c, d) for (c, d) in coded_values.items()])
+
+    def get_domain(self, name):
+        # Domains are kept in memory once read, as in a geodatabase
+        # workspace, since field values look them up on every access.
+        if name not in self._domains:
+            with self.lock:
+                coded_values = dict(self.connection.execute(
+                    'SELECT code, description FROM gdb_domain '
+                    'WHERE name = ?', (name,)))
+            if not coded_values:
+                raise ValueError('Domain %s is not in %s' % (
+                    name, self.path))
+            self._domains[name] = CodedValueDomain(name, coded_values)
+        return self._domains[name]
+
+    def get_coded_value(self, domain_name, description):
+        for (code, desc) in self.get_domain(domain_name).codedValues.items():
+            if desc == description:
+                return code
+        raise ValueError('Domain %s has no code for description %s' % (
+            domain_name, description))
+
+    def add_table(self, table, columns, oid_column, shape_column=None):
+        """
+        Create a table with an integer OID column.
+        """
+
+        definitions = ['%s INTEGER PRIMARY KEY' % (quote(oid_column),)] + [
+            quote(c) for c in columns if c not in (oid_column, shape_column)]
+        if shape_column:
+            definitions.append('%s TEXT' % (quote(shape_column),))
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (
+                quote(table), ', '.join(definitions)))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO gdb_table VALUES (?, ?, ?)',
+                (table, oid_column, shape_column))
+
+    def add_feature_class(self, feature_class, table=None, domains=None):
+        """
+        Create a table and an attachment table for a feature class.
+        Domains are given as domain names keyed by field name.
+        """
+
+        table = table or feature_class.__name__
+        geometry_names = [
+            n for n in stored_field_names(feature_class, geometry=True)
+            if n not in stored_field_names(feature_class)]
+        shape_column = geometry_names[0] if geometry_names else None
+        columns = [column_name(feature_class, n) for n in
+                   stored_field_names(feature_class) +
+                   score_field_names(feature_class)]
+        if self.edit_date_field:
+            columns.append(self.edit_date_field)
+        self.add_table(table, columns, column_name(
+            feature_class, oid_field_name(feature_class)), shape_column)
+        self.add_table(table + '__ATTACH', ATTACHMENT_COLUMNS, 'ATTACHMENTID')
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO gdb_field_domain VALUES (?, ?, ?)',
+                [(table, f, d) for (f, d) in (domains or {}).items()])
+        return table
+
+    def add_relationship(self, name, origin_table, destination_table,
+                         foreign_key, origin_key='OBJECTID'):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO gdb_relationship VALUES '
+                '(?, ?, ?, ?, ?)', (name, origin_table, origin_key,
+                                    destination_table, foreign_key))
+
+    def insert_rows(self, table, columns, rows):
+        """
+        Insert rows into a table. Geometries may be given as WKT or as
+        LocalGeometry instances in a SHAPE@ column.
+        """
+
+        (oid, shape) = self.table_info(table)
+        names = [shape if c.startswith('SHAPE@') else c for c in columns]
+        geometry_index = [i for (i, c) in enumerate(columns)
+                          if c.startswith('SHAPE@')]
+
+        def values(row):
+            row = list(row)
+            for i in geometry_index:
+                row[i] = getattr(row[i], 'wkt', row[i])
+            return row
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO %s (%s) VALUES (%s)' % (
+                    quote(table), ', '.join(quote(n) for n in names),
+                    ', '.join('?' * len(names))),
+                (values(row) for row in rows))
+
+    def register(self, feature_class, table=None):
+        """
+        Register a feature class with the table that stores it, and its
+        attachment class with the attachment table, as BaseFeature.register()
+        does with a geodatabase. Registration changes the feature class and
+        the classes it is related to until unregister() is called.
+        """
+
+        if feature_class not in self._registrations:
+            self._registrations[feature_class] = Registration([feature_class])
+        try:
+            self._register(feature_class, table)
+        except Exception:
+            self.unregister(feature_class)
+            raise
+
+    def unregister(self, *feature_classes):
+        """
+        Restore the registration that feature classes had before they were
+        registered with this workspace, or that of every feature class
+        registered with it, in the reverse order of registration.
+        """
+
+        for feature_class in reversed(
+                feature_classes or self._registrations.keys()):
+            registration = self._registrations.pop(feature_class, None)
+            if registration is not None:
+                registration.restore()
+
+    @contextmanager
+    def registered(self, *feature_classes):
+        """
+        Register feature classes with this workspace for the duration of
+        the block.
+        """
+
+        try:
+            for feature_class in feature_classes:
+                self.register(feature_class)
+            yield self
+        finally:
+            self.unregister(*feature_classes)
+
+    def _register(self, feature_class, table=None):
+        table = table or feature_class.__name__
+        self.table_info(table)
+        feature_class.name = table
+        feature_class.path = table
+        feature_class.workspace = self
+
+        if not issubclass(feature_class, BaseAttachment):
+            info = self.get_attachment_info(table)
+            if info is not None:
+                attachment_class = attachment_class_factory(
+                    feature_class, info.primary_key, info.foreign_key)
+                self._register(attachment_class, info.destination)
+                feature_class.attachment_class = attachment_class
+
+        layer_fields = self.get_layer_fields(table)
+        for (field_name, field) in feature_class.fields.items():
+            field.register(self, feature_class, field_name, table,
+                           layer_fields)
+        if hasattr(feature_class, 'resolve_domain_constants'):
+            feature_class.resolve_domain_constants()
+
+    def update_spatial_relationship(self, name, method='CLOSEST',
+                                    distance=None):
+        """
+        Set the foreign key of each destination feature to the OID of the
+        closest origin feature within the distance.
+        """
+
+        if method != 'CLOSEST':
+            raise ValueError('Unsupported spatial relationship %s' % (
+                method,))
+        row = self.connection.execute(
+            'SELECT origin_table, origin_key, destination_table, '
+            'foreign_key FROM gdb_relationship WHERE name = ?',
+            (name,)).fetchone()
+        if row is None:
+            raise ValueError('Relationship %s is not in %s' % (
+                name, self.path))
+        (origin_table, origin_key, destination_table, foreign_key) = row
+
+        nearest = self.nearest(
+            destination_table, origin_table, distance, key=origin_key)
+        with self.update_cursor(
+                destination_table, ['OID@', foreign_key]) as cursor:
+            for row in cursor:
+                if row[1] != nearest.get(row[0]):
+                    cursor.updateRow([row[0], nearest.get(row[0])])
+
+    def nearest(self, table, near_table, distance=None, where=None,
+                key=None):
+        """
+        Return the key of the closest feature of the near table within the
+        distance of each point feature of the table selected by the where
+        clause, keyed by OID. The key defaults to the OID of the near table.
+        """
+
+        # Index the near features in a grid with cells the size of the
+        # search distance, so each point only checks nearby features.
+        size = float(distance or 1e9)
+        grid = defaultdict(list)
+        with self.search_cursor(
+                near_table, [key or 'OID@', 'SHAPE@']) as cursor:
+            for (near_key, geometry) in cursor:
+                if geometry is None:
+                    continue
+                (xmin, ymin, xmax, ymax) = geometry.extent
+                for i in xrange(int(floor((xmin - size) / size)),
+                                int(floor((xmax + size) / size)) + 1):
+                    for j in xrange(int(floor((ymin - size) / size)),
+                                    int(floor((ymax + size) / size)) + 1):
+                        grid[(i, j)].append((near_key, geometry))
+
+        nearest = {}
+        with self.search_cursor(table, ['OID@', 'SHAPE@XY'], where) as cursor:
+            for (oid, point) in cursor:
+                if point is None:
+                    continue
+                cell = (int(floor(point[0] / size)),
+                        int(floor(point[1] / size)))
+                candidates = [(g.distance_to(point), near_key)
+                              for (near_key, g) in grid.get(cell, [])]
+                candidates = [c for c in candidates if distance is None
+                              or c[0] <= distance]
+                if candidates:
+                    nearest[oid] = min(candidates)[1]
+        return nearest
+
+    def copy_feature_class(self, feature_class, table=None):
+        """
+        Copy a feature class registered with the geodatabase, with its
+        domains and attachment records, into the local workspace.
+        """
+
+        import arcpy
+
+        domains = {}
+        for (name, field) in feature_class.fields.items():
+            domain_name = getattr(field, 'domain_name', None)
+            if domain_name:
+                domains[name] = domain_name
+                domain = feature_class.workspace.get_domain(domain_name)
+                self.add_domain(domain_name, domain.codedValues)
+
+        source = feature_class.path
+        table = self.add_feature_class(feature_class, table, domains)
+        (oid, shape) = self.table_info(table)
+        columns = [column_name(feature_class, n)
+                   for n in stored_field_names(feature_class)]
+        if shape:
+            columns.append('SHAPE@WKT')
+        with arcpy.da.SearchCursor(source, columns) as cursor:
+            self.insert_rows(table, columns, cursor)
+
+        if arcpy.Exists(source + '__ATTACH'):
+            with arcpy.da.SearchCursor(
+                    source + '__ATTACH', ['REL_GLOBALID', 'ATT_NAME']) \
+                    as cursor:
+                self.insert_rows(
+                    table + '__ATTACH', ['REL_GLOBALID', 'ATT_NAME'], cursor)
+        return table
+
+
+if __name__ == '__main__':
+    from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
+        SidewalkSegment
+    from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH, \
+        SS_REL_NAME
+
+    parser = argparse.ArgumentParser(
+        'Copy the sidewalk inventory to a local workspace.')
+    parser.add_argument('path', help='SQLite file to create')
+    args = parser.parse_args()
+
+    workspace = LocalWorkspace(args.path)
+    for (feature_class, path) in [
+            (Sidewalk, SW_PATH), (CurbRamp, CR_PATH), (Crosswalk, CW_PATH),
+            (PedestrianSignal, PS_PATH), (SidewalkSegment, SS_PATH)]:
+        print 'Copying %s...' % (feature_class.__name__,)
+        feature_class.register(path)
+        workspace.copy_feature_class(feature_class)
+    workspace.add_relationship(
+        SS_REL_NAME, 'SidewalkSegment', 'Sidewalk',
+        column_name(Sidewalk, 'NearestSegmentOID'),
+        column_name(SidewalkSegment, 'OBJECTID'))
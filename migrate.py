@@ -0,0 +1,53 @@
+"""
+Add the stored fields of the data model to the Sidewalk Inventory and
+Assessment feature classes.
+
+Fields added to the data model, such as the stored segment length, are only
+added to the geodatabase by this script. Run it once after upgrading, before
+the other scripts, which stop with an error while fields are missing. New
+segment lengths are filled in from the segment geometry.
+"""
+
+import argparse
+from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
+    SidewalkSegment
+from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH, \
+    LOCAL_WORKSPACE_PATH
+from batch import missing_fields, update_segment_lengths
+
+FEATURE_CLASSES = [
+    (Sidewalk, SW_PATH),
+    (CurbRamp, CR_PATH),
+    (Crosswalk, CW_PATH),
+    (PedestrianSignal, PS_PATH),
+    (SidewalkSegment, SS_PATH),
+]
+
+parser = argparse.ArgumentParser(
+    'Add missing data model fields to the sidewalk inventory.')
+parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                    help='list the missing fields without adding them')
+args = parser.parse_args()
+
+if LOCAL_WORKSPACE_PATH:
+    parser.error('local workspaces are created with every field; '
+                 'clear LOCAL_WORKSPACE_PATH to migrate the geodatabase')
+
+for (feature_class, path) in FEATURE_CLASSES:
+    feature_class.register(path)
+
+missing = missing_fields([fc for (fc, path) in FEATURE_CLASSES])
+if not missing:
+    print 'All fields are present.'
+elif args.dry_run:
+    print 'Missing fields: %s' % (', '.join(missing),)
+else:
+    for (feature_class, path) in FEATURE_CLASSES:
+        feature_class.sync_fields()
+    print 'Added fields: %s' % (', '.join(missing),)
+
+    if 'SidewalkSegment.SegmentLength' in missing:
+        print 'Storing segment lengths...'
+        with SidewalkSegment.workspace.edit():
+            updated = update_segment_lengths(SidewalkSegment)
+        print '%i segments updated' % (updated,)
@@ -0,0 +1,207 @@
+"""
+Prioritization lists of Sidewalk Inventory and Assessment features.
+
+The features with the lowest compliance scores in each zone are found in a
+single pass over a scored feature class. Each zone, at the finest level and
+at every level of the zone hierarchy, keeps a bounded heap of its worst
+features, so memory depends on the number of zones and the list length
+rather than on the number of features. Ties are broken by the lower
+condition score, then by the greater length.
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import os
+from collections import OrderedDict
+
+# Name of the level of the finest zones.
+FINEST_LEVEL = 'Zone'
+
+# Columns of the ranked lists.
+COLUMNS = ['Rank', 'OBJECTID', 'ScoreCompliance', 'ScoreCondition', 'Length']
+
+
+class WorstFeatures(object):
+    """
+    The features with the lowest compliance scores, up to a limit.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.heap = []
+        self.oids = set()
+
+    def add(self, oid, compliance, condition=None, length=None):
+        """
+        Add a feature, unless it has already been added. Features without
+        a condition score rank after those with one, and features without a
+        length after those with one.
+        """
+
+        if oid in self.oids:
+            return
+        # Keys are negated so that the best of the kept features is at the
+        # top of the heap, ready to be replaced.
+        item = (-compliance,
+                float('-inf') if condition is None else -condition,
+                length or 0.0, -oid, condition, length)
+        if len(self.heap) < self.limit:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            self.oids.discard(-heapq.heapreplace(self.heap, item)[3])
+        else:
+            return
+        self.oids.add(oid)
+
+    def ranked(self):
+        """
+        Return the kept features, worst first, as lists of COLUMNS.
+        """
+
+        return [[rank, -item[3], -item[0], item[4], item[5]]
+                for (rank, item) in enumerate(
+                    sorted(self.heap, reverse=True), 1)]
+
+
+class Prioritizer(object):
+    """
+    The worst features in every zone at the finest level and at each level
+    of a zone hierarchy.
+    """
+
+    def __init__(self, limit, hierarchy=None):
+        self.limit = limit
+        self.hierarchy = hierarchy
+        levels = [FINEST_LEVEL] + (hierarchy.levels if hierarchy else [])
+        self.zones = OrderedDict((level, {}) for level in levels)
+
+    def add(self, zone_ids, oid, compliance, condition=None, length=None):
+        """
+        Add a feature to the zones it is in, given by finest zone ID, and
+        their zones at each level. Features without a compliance score are
+        skipped.
+        """
+
+        if compliance is None:
+            return
+        for zone_id in zone_ids:
+            zones = [zone_id]
+            if self.hierarchy:
+                zones.extend(self.hierarchy.parents.get(
+                    zone_id, [None] * len(self.hierarchy.levels)))
+            for (level, level_zone_id) in zip(self.zones.keys(), zones):
+                if level_zone_id is None:
+                    continue
+                worst = self.zones[level].get(level_zone_id)
+                if worst is None:
+                    worst = self.zones[level][level_zone_id] = \
+                        WorstFeatures(self.limit)
+                worst.add(oid, compliance, condition, length)
+
+    def ranked(self):
+        """
+        Return the ranked lists keyed by level and zone ID.
+        """
+
+        return OrderedDict(
+            (level, OrderedDict(
+                (zone_id, zones[zone_id].ranked())
+                for zone_id in sorted(zones.keys())))
+            for (level, zones) in self.zones.items())
+
+
+def feature_zones(fc_path, zone_path, zone_id_field):
+    """
+    Return the IDs of the zones each feature is in, keyed by OID.
+    """
+
+    import arcpy
+
+    intersect_path = r'in_memory\priority_zones'
+    arcpy.Intersect_analysis([fc_path, zone_path], intersect_path)
+    # The first FID field refers to the features.
+    fid_field = arcpy.ListFields(intersect_path, 'FID_*')[0].name
+    zones = {}
+    with arcpy.da.SearchCursor(
+            intersect_path, [fid_field, zone_id_field]) as cursor:
+        for (oid, zone_id) in cursor:
+            zones.setdefault(oid, set()).add(zone_id)
+    arcpy.Delete_management(intersect_path)
+    return zones
+
+
+if __name__ == '__main__':
+    import arcpy
+    from config import CR_PATH, SS_PATH, ZONE_PATH, ZONE_ID_FIELD, \
+        ZONE_HIERARCHY_PATH, ZONE_LEVELS, RUN_LOG_DIR
+    from instrument import RunLog
+    from zone_hierarchy import read_hierarchy
+
+    # Feature types as (feature type, path, is linear).
+    FEATURE_TYPES = [
+        ('Sidewalk', SS_PATH, True),
+        ('CurbRamp', CR_PATH, False),
+    ]
+
+    parser = argparse.ArgumentParser(
+        'Create lists of the lowest scoring features in each zone.')
+    parser.add_argument('-f', '--format', dest='format', default='json',
+                        choices=['csv', 'json'], help='format of output')
+    parser.add_argument('-n', '--limit', type=int, default=25,
+                        help='number of features in each list')
+    parser.add_argument('output', help='output file or location')
+    args = parser.parse_args()
+
+    if args.format == 'csv':
+        assert os.path.isdir(args.output), \
+            'Output location must be a directory for CSV format'
+    else:
+        assert os.path.isdir(os.path.dirname(args.output)), \
+            'Invalid output location'
+
+    run_log = RunLog('prioritize')
+    hierarchy = None
+    if ZONE_HIERARCHY_PATH:
+        hierarchy = read_hierarchy(
+            ZONE_HIERARCHY_PATH, ZONE_ID_FIELD, ZONE_LEVELS)
+
+    results = OrderedDict()
+    for (feature_type, fc_path, is_linear) in FEATURE_TYPES:
+        with run_log.phase('prioritize', feature_type) as phase:
+            print 'Ranking %s features...' % (feature_type,)
+            zones = feature_zones(fc_path, ZONE_PATH, ZONE_ID_FIELD)
+            prioritizer = Prioritizer(args.limit, hierarchy)
+            columns = ['OID@', 'ScoreCompliance', 'ScoreCondition']
+            if is_linear:
+                columns.append('SHAPE@LENGTH')
+            with arcpy.da.SearchCursor(fc_path, columns) as cursor:
+                for row in cursor:
+                    prioritizer.add(zones.get(row[0], ()), *row)
+                    phase.rows_read += 1
+            results[feature_type] = prioritizer.ranked()
+
+    if args.format == 'json':
+        with open(args.output, 'wb') as output_file:
+            json.dump(dict(
+                (feature_type, dict(
+                    (level, dict(
+                        (zone_id, [dict(zip(COLUMNS, row)) for row in rows])
+                        for (zone_id, rows) in zones.items()))
+                    for (level, zones) in levels.items()))
+                for (feature_type, levels) in results.items()),
+                output_file, indent=4)
+    else:
+        for (feature_type, levels) in results.items():
+            for (level, zones) in levels.items():
+                output_path = os.path.join(
+                    args.output, '%s%sPriorities.csv' % (feature_type, level))
+                with open(output_path, 'wb') as output_file:
+                    writer = csv.writer(output_file)
+                    writer.writerow([level] + COLUMNS)
+                    for (zone_id, rows) in zones.items():
+                        writer.writerows([zone_id] + row for row in rows)
+
+    run_log.report()
+    run_log.save(RUN_LOG_DIR)
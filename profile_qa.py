@@ -0,0 +1,68 @@
+"""
+Profile automated quality assurance for Sidewalk Inventory and Assessment
+data.
+"""
+
+import argparse
+import cProfile
+import pstats
+from itertools import islice
+from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal
+from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH
+
+# Parse command line arguments.
+parser = argparse.ArgumentParser('Profile automatic QA.')
+parser.add_argument('-n', '--limit', type=int, default=1000,
+                    help='number of features of each type to profile')
+parser.add_argument('-s', '--sort', default='cumulative',
+                    help='sort order for the profile statistics')
+parser.add_argument('--compare', action='store_true',
+                    help='also profile with per-call D lookups')
+args = parser.parse_args()
+
+# Register feature classes.
+Sidewalk.register(SW_PATH)
+CurbRamp.register(CR_PATH)
+Crosswalk.register(CW_PATH)
+PedestrianSignal.register(PS_PATH)
+
+feature_classes = [Sidewalk, CurbRamp, Crosswalk, PedestrianSignal]
+
+PREFETCH_RELS = {
+    'CurbRamp': ['attachments'],
+}
+
+# Load the features up front so that the profile only covers QA.
+print 'Loading features...'
+features = []
+for feature_class in feature_classes:
+    query_set = feature_class.objects.all()
+    if feature_class.__name__ in PREFETCH_RELS:
+        query_set = query_set.prefetch_related(
+            *PREFETCH_RELS[feature_class.__name__])
+    features.extend(islice(query_set, args.limit))
+
+
+def profile_qa(label):
+    profile = cProfile.Profile()
+    profile.enable()
+    for feature in features:
+        feature.perform_qa()
+    profile.disable()
+
+    stats = pstats.Stats(profile)
+    print '%s: %i features in %0.3f seconds' % (
+        label, len(features), stats.total_tt)
+    stats.sort_stats(args.sort).print_stats(20)
+    return stats.total_tt
+
+
+resolved_time = profile_qa('Resolved domain constants')
+
+if args.compare:
+    # Fall back to the D lookups of the unresolved domain constants.
+    for feature_class in feature_classes:
+        feature_class.resolved_constants = {}
+    lookup_time = profile_qa('Per-call D lookups')
+    print 'Resolved domain constants take %0.1f%% of the lookup time' % (
+        100 * resolved_time / lookup_time,)
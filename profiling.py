@@ -0,0 +1,192 @@
+"""
+Opt-in profiling of Sidewalk Inventory and Assessment hot paths.
+
+A profiler wraps the QA and scoring methods and the calculated score fields
+of the registered feature classes with call counters and timers, and runs
+cProfile on a sample of the method calls. The timers are cheap enough to
+leave on for a full run; the sampled profile shows where the time goes
+inside the methods without slowing every call down.
+"""
+
+import cProfile
+import pstats
+from timeit import default_timer
+from cuuats.datamodel import ScaleField, WeightsField, MethodField
+
+# Methods to time, if the feature class has them.
+PROFILED_METHODS = ('perform_qa', 'clean', 'validate',
+                    'update_sidewalk_fields', 'save')
+
+# Methods whose calls are sampled by cProfile.
+SAMPLED_METHODS = ('perform_qa', 'update_sidewalk_fields', 'save')
+
+SCORE_FIELD_TYPES = (ScaleField, WeightsField, MethodField)
+
+_timed_field_classes = {}
+
+
+def _timed_field_class(field_class):
+    """
+    Return a subclass of the field class that times each evaluation.
+    """
+
+    if field_class not in _timed_field_classes:
+        def __get__(self, instance, owner):
+            if instance is None:
+                return field_class.__get__(self, instance, owner)
+            start = default_timer()
+            try:
+                return field_class.__get__(self, instance, owner)
+            finally:
+                self._profiler.record(
+                    self._profile_name, default_timer() - start)
+
+        _timed_field_classes[field_class] = type(
+            'Timed' + field_class.__name__, (field_class,),
+            {'__get__': __get__})
+
+    return _timed_field_classes[field_class]
+
+
+class Profiler(object):
+    """
+    Call counters, timers and a sampled profile for feature classes.
+    """
+
+    def __init__(self, sample_interval=100):
+        self.sample_interval = sample_interval
+        self.counters = {}
+        self.profile = cProfile.Profile()
+        self.sample_count = 0
+        self._calls = 0
+        self._sampling = False
+        self._methods = []
+        self._fields = []
+
+    def record(self, name, elapsed):
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = [0, 0.0]
+        counter[0] += 1
+        counter[1] += elapsed
+
+    def timed_method(self, name, method, sampled=False):
+        """
+        Return a function that times calls to the method and, if sampled,
+        profiles every sample_interval-th call.
+        """
+
+        def timed(*args, **kwargs):
+            sample = False
+            if sampled and not self._sampling:
+                self._calls += 1
+                sample = self._calls % self.sample_interval == 0
+            start = default_timer()
+            if sample:
+                self._sampling = True
+                self.sample_count += 1
+                self.profile.enable()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if sample:
+                    self.profile.disable()
+                    self._sampling = False
+                self.record(name, default_timer() - start)
+
+        timed.__name__ = getattr(method, '__name__', name)
+        timed.__doc__ = getattr(method, '__doc__', None)
+        return timed
+
+    def install(self, feature_class):
+        """
+        Wrap the profiled methods and score fields of the feature class.
+        """
+
+        class_name = feature_class.__name__
+        for method_name in PROFILED_METHODS:
+            method = getattr(feature_class, method_name, None)
+            if method is None:
+                continue
+            self._methods.append((
+                feature_class, method_name,
+                feature_class.__dict__.get(method_name)))
+            setattr(feature_class, method_name, self.timed_method(
+                '%s.%s' % (class_name, method_name), method,
+                method_name in SAMPLED_METHODS))
+
+        for (field_name, field) in feature_class.fields.items():
+            if isinstance(field, SCORE_FIELD_TYPES):
+                self._fields.append((field, field.__class__))
+                field.__class__ = _timed_field_class(field.__class__)
+                field._profiler = self
+                field._profile_name = '%s.%s' % (class_name, field_name)
+
+    def uninstall(self):
+        """
+        Restore the methods and score fields wrapped by install().
+        """
+
+        for (feature_class, method_name, original) in self._methods:
+            if original is None:
+                delattr(feature_class, method_name)
+            else:
+                setattr(feature_class, method_name, original)
+        for (field, field_class) in self._fields:
+            field.__class__ = field_class
+            del field._profiler
+            del field._profile_name
+        self._methods = []
+        self._fields = []
+
+    def iterate(self, iterable, name):
+        """
+        Iterate over features, timing each fetch, including the prefetch
+        of related features.
+        """
+
+        iterator = iter(iterable)
+        while True:
+            start = default_timer()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.record(name, default_timer() - start)
+            yield item
+
+    def cost_table(self):
+        """
+        Return (name, calls, total seconds, average microseconds) tuples,
+        most expensive first. Times include nested calls, so a weighted score
+        includes the scores it weights.
+        """
+
+        return [(name, calls, total, 1e6 * total / calls)
+                for (name, (calls, total))
+                in sorted(self.counters.items(), key=lambda i: -i[1][1])]
+
+    def report(self, limit=20, sort='cumulative'):
+        """
+        Print the cost table and the sampled profile.
+        """
+
+        print '%-50s %10s %10s %10s' % ('Name', 'Calls', 'Total s', 'Avg us')
+        for (name, calls, total, average) in self.cost_table():
+            print '%-50s %10i %10.2f %10.1f' % (name, calls, total, average)
+
+        if self.sample_count:
+            print 'Profile of %i sampled calls (1 in %i):' % (
+                self.sample_count, self.sample_interval)
+            pstats.Stats(self.profile).sort_stats(sort).print_stats(limit)
+
+
+def profiled(profiler, iterable, name):
+    """
+    Time fetches from the iterable if profiling is enabled.
+    """
+
+    if profiler is None:
+        return iterable
+    return profiler.iterate(iterable, name)
@@ -0,0 +1,433 @@
+"""
+Rule tables for column-wise automated quality assurance.
+
+Each rule table restates the checks performed by the clean() and validate()
+methods of a feature class as declarative rules. Rules for single fields are
+derived from the field definitions, so that they follow changes to the data
+model; cross-field rules are stated in the table. A compiled rule table runs
+every rule over whole columns of field values at once, producing the QA
+status and QA comment for every feature in one pass. The per-object
+perform_qa() remains the path used for edit-time QA in ArcMap.
+"""
+
+import re
+import numpy as np
+from cuuats.datamodel import NumericField, OIDField, ForeignKey, \
+    CalculatedField
+from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
+    SlopeField, qa_result
+from batch import column, invalid_decimals, oid_field_name
+from fingerprint import fingerprint, rules_version
+
+_PROPERTY = re.compile(r'^self\.(\w+)$')
+
+
+class Rule(object):
+    """
+    A check that produces a message for every failing feature.
+    """
+
+    # Order of the rule relative to other rules for the same field.
+    ORDER = 0
+
+    def __init__(self, field_names, when=None):
+        if not isinstance(field_names, (list, tuple)):
+            field_names = [field_names]
+        self.field_names = list(field_names)
+        self.when = when
+
+    def failures(self, feature_class, columns, field_name):
+        """
+        Return a boolean array that is true for failing features.
+        """
+
+        raise NotImplementedError
+
+    def message(self, feature_class, field_name):
+        raise NotImplementedError
+
+
+class Required(Rule):
+    """
+    The field must not be null.
+    """
+
+    def failures(self, feature_class, columns, field_name):
+        return np.isnan(columns[field_name])
+
+    def message(self, feature_class, field_name):
+        return '%s is missing' % (feature_class.fields[field_name].label,)
+
+
+class Choices(Rule):
+    """
+    The field must have one of the codes of its coded value domain.
+    """
+
+    ORDER = 1
+
+    def failures(self, feature_class, columns, field_name):
+        choices = feature_class.fields[field_name].choices
+        if not choices:
+            return np.zeros(len(columns[field_name]), dtype=bool)
+        return ~np.isnan(columns[field_name]) & \
+            ~np.in1d(columns[field_name], choices)
+
+    def message(self, feature_class, field_name):
+        return '%s is invalid' % (feature_class.fields[field_name].label,)
+
+
+class Range(Rule):
+    """
+    The field must be within the minimum and maximum of its definition.
+    """
+
+    ORDER = 2
+
+    def failures(self, feature_class, columns, field_name):
+        field = feature_class.fields[field_name]
+        failures = np.zeros(len(columns[field_name]), dtype=bool)
+        if field.min is not None:
+            failures |= columns[field_name] < field.min
+        if field.max is not None:
+            failures |= columns[field_name] > field.max
+        return failures
+
+    def message(self, feature_class, field_name):
+        return '%s out of range' % (feature_class.fields[field_name].label,)
+
+
+class Decimals(Rule):
+    """
+    The slope must not have more decimal places than the smart tools report.
+    """
+
+    ORDER = 3
+
+    def failures(self, feature_class, columns, field_name):
+        field = feature_class.fields[field_name]
+        return invalid_decimals(columns[field_name], field.DECIMALS)
+
+    def message(self, feature_class, field_name):
+        return '%s has invalid decimals' % (
+            feature_class.fields[field_name].label,)
+
+
+def required_when(condition):
+    """
+    Return the predicate names for a required_if condition, which the data
+    model writes as properties of the feature joined by 'or'.
+    """
+
+    if condition is None:
+        return None
+    matches = [_PROPERTY.match(n.strip()) for n in condition.split(' or ')]
+    if not all(matches):
+        raise ValueError(
+            'Cannot translate required_if condition: %s' % (condition,))
+    names = [m.group(1) for m in matches]
+    return names[0] if len(names) == 1 else tuple(names)
+
+
+def field_rules(feature_class):
+    """
+    Return the rules stated by the field definitions of a feature class:
+    required fields, coded value choices, ranges and slope decimals.
+    Choices and ranges are set when the feature class is registered, so the
+    rules read them when they run.
+    """
+
+    rules = []
+    for (field_name, field) in feature_class.fields.items():
+        if isinstance(field, (ForeignKey, CalculatedField)):
+            continue
+        if field.required:
+            rules.append(Required(field_name))
+        elif field.required_if:
+            rules.append(Required(
+                field_name, when=required_when(field.required_if)))
+        if isinstance(field, NumericField):
+            if field.choices:
+                rules.append(Choices(field_name))
+            if field.min is not None or field.max is not None:
+                rules.append(Range(field_name))
+        if isinstance(field, SlopeField):
+            rules.append(Decimals(field_name))
+    return rules
+
+
+class Consistent(object):
+    """
+    Two conditions on different fields must be either both true or both
+    false.
+    """
+
+    def __init__(self, message, left, right, when=None):
+        self.message = message
+        self.left = left
+        self.right = right
+        self.when = when
+
+
+class Check(object):
+    """
+    Features for which the condition is true fail with the message.
+    """
+
+    def __init__(self, message, condition, when=None):
+        self.message = message
+        self.condition = condition
+        self.when = when
+
+
+class RuleTable(object):
+    """
+    The QA rules for a feature class.
+
+    Predicates are functions of a dictionary of columns that return boolean
+    arrays. Rules refer to predicates by name in their when arguments; a
+    tuple of names means any of the predicates, and the required_if
+    conditions of the fields name them as properties. Field rules are
+    derived from the field definitions and run in field order, followed by
+    the cross-field rules. If the gate predicate is
+    false, only the rules listed in always apply, which mirrors validate()
+    methods that discard their messages.
+    """
+
+    def __init__(self, feature_class, predicates, cross_field_rules=(),
+                 gate=None, always=(), skip=None, related=()):
+        self.feature_class = feature_class
+        self.predicates = predicates
+        self.cross_field_rules = cross_field_rules
+        self.gate = gate
+        self.always = always
+        self.skip = skip
+        self.related = related
+
+    @property
+    def field_rules(self):
+        return field_rules(self.feature_class)
+
+    def _condition(self, columns, when):
+        if when is None:
+            return np.ones(
+                len(columns[oid_field_name(self.feature_class)]), dtype=bool)
+        if isinstance(when, (list, tuple)):
+            return np.logical_or.reduce(
+                [self._condition(columns, w) for w in when])
+        return self.predicates[when](columns)
+
+    def compile(self):
+        """
+        Return a list of (mask function, message) pairs in message order.
+        """
+
+        field_order = dict(
+            (n, i) for (i, n) in enumerate(self.feature_class.fields.keys()))
+        field_checks = []
+        for rule in self.field_rules:
+            for field_name in rule.field_names:
+                field_checks.append((
+                    (field_order[field_name], rule.ORDER),
+                    self._field_check(rule, field_name),
+                    rule.message(self.feature_class, field_name)))
+        field_checks.sort(key=lambda c: c[0])
+        checks = [(check, message) for (_, check, message) in field_checks]
+
+        for rule in self.cross_field_rules:
+            checks.append((self._cross_field_check(rule), rule.message))
+        return checks
+
+    def _field_check(self, rule, field_name):
+        def check(columns):
+            return self._condition(columns, rule.when) & \
+                rule.failures(self.feature_class, columns, field_name)
+        return check
+
+    def _cross_field_check(self, rule):
+        def check(columns):
+            condition = self._condition(columns, rule.when)
+            if isinstance(rule, Consistent):
+                return condition & \
+                    (rule.left(columns) != rule.right(columns))
+            return condition & rule.condition(columns)
+        return check
+
+    def columns(self, features):
+        """
+        Return the numeric columns of a list of row features.
+        """
+
+        columns = dict(
+            (n, column(features, n)) for n in features[0].FIELD_NAMES
+            if isinstance(self.feature_class.fields[n],
+                          (NumericField, OIDField)))
+        for name in self.related:
+            columns[name] = np.array(
+                [getattr(f, name).count() for f in features], dtype=float)
+        return columns
+
+    def skipped(self, columns):
+        """
+        Return a boolean array that is true for features that QA leaves
+        unchanged.
+        """
+
+        qastatus_field = self.feature_class.QASTATUS_FIELD
+        with np.errstate(invalid='ignore'):
+            skipped = columns[qastatus_field] == \
+                self.feature_class.domain_constants(
+                    qastatus_field).NEEDS_STAFF_REVIEW
+            if self.skip is not None:
+                skipped = skipped | self.predicates[self.skip](columns)
+        return skipped
+
+    def evaluate(self, columns):
+        """
+        Run the rules over the columns, and return arrays of QA statuses
+        and QA comments.
+        """
+
+        count = len(columns[oid_field_name(self.feature_class)])
+        messages = [[] for _ in xrange(count)]
+        with np.errstate(invalid='ignore'):
+            gate = self._condition(columns, self.gate) if self.gate else None
+
+        # Comparisons with null (NaN) values are false, as comparisons
+        # with None are in validate().
+        with np.errstate(invalid='ignore'):
+            for (check, message) in self.compile():
+                failures = check(columns)
+                if gate is not None and message not in self.always:
+                    failures = failures & gate
+                for index in np.flatnonzero(failures):
+                    messages[index].append(message)
+
+        constants = self.feature_class.domain_constants(
+            self.feature_class.QASTATUS_FIELD)
+        qastatus = np.empty(count, dtype=object)
+        qacomment = np.empty(count, dtype=object)
+        for index in xrange(count):
+            (qastatus[index], qacomment[index]) = qa_result(
+                messages[index], constants)
+        return (qastatus, qacomment)
+
+    def perform_qa(self, features):
+        """
+        Clean and validate row features, and set their QA fields.
+        """
+
+        if not features:
+            return
+        if not self.feature_class.domain_constants(
+                self.feature_class.QASTATUS_FIELD).resolved:
+            raise ValueError(
+                'Column-wise QA requires resolved domain constants; '
+                'register %s first' % (self.feature_class.__name__,))
+
+        # Cleaning changes values that the rules depend on, so it runs on
+        # each feature before the columns are built.
+        skipped = self.skipped(self.columns(features))
+        for (feature, skip) in zip(features, skipped):
+            if not skip:
+                feature.clean()
+
+        (qastatus, qacomment) = self.evaluate(self.columns(features))
+        for (index, feature) in enumerate(features):
+            if not skipped[index]:
+                setattr(feature, self.feature_class.QASTATUS_FIELD,
+                        qastatus[index])
+                setattr(feature, self.feature_class.QACOMMENT_FIELD,
+                        qacomment[index])
+
+
+def _is(feature_class, field_name, name):
+    # Domain constants are looked up when the rule runs, after the feature
+    # classes have been registered.
+    return lambda c: c[field_name] == getattr(
+        feature_class.domain_constants(field_name), name)
+
+
+def _is_zero(field_name):
+    return lambda c: c[field_name] == 0
+
+
+def _has_button(c):
+    location = PedestrianSignal.domain_constants('PedButtonLocation')
+    size = PedestrianSignal.domain_constants('PedButtonSize')
+    return ~np.in1d(c['PedButtonLocation'],
+                    [location.NO_BUTTON, location.NA]) & \
+        (c['PedButtonSize'] != size.NO_BUTTON)
+
+
+SIDEWALK_RULES = RuleTable(
+    Sidewalk,
+    predicates={
+        'is_summary': _is(Sidewalk, 'PointType', 'SUMMARY'),
+        'is_driveway': _is(Sidewalk, 'PointType', 'DRIVEWAY'),
+    },
+    cross_field_rules=[
+        Consistent(
+            'Vertical Faults does not match Largest Fault',
+            _is(Sidewalk, 'LargestVerticalFault', 'NONE'),
+            _is_zero('VerticalFaultCount'),
+            when='is_summary'),
+    ])
+
+CURB_RAMP_RULES = RuleTable(
+    CurbRamp,
+    predicates={
+        'has_ramp': lambda c: ~_is(CurbRamp, 'RampType', 'NONE')(c),
+        'has_override': _is(CurbRamp, 'AutoQAOverride', 'YES'),
+    },
+    cross_field_rules=[
+        Consistent(
+            'Vertical Faults does not match Largest Fault',
+            _is(CurbRamp, 'LargestPavementFault', 'NONE'),
+            _is_zero('PavementFaultCount')),
+        Consistent(
+            'Edge Treatment does not match Flare Slope',
+            _is(CurbRamp, 'EdgeTreatment', 'FLARED_SIDES'),
+            lambda c: (c['FlareSlope'] > 0) | (c['FlareSlope'] == -1)),
+        Check(
+            'Photo is missing',
+            lambda c: c['attachments'] == 0),
+    ],
+    gate='has_ramp',
+    always=['Photo is missing'],
+    skip='has_override',
+    related=['attachments'])
+
+CROSSWALK_RULES = RuleTable(
+    Crosswalk,
+    predicates={})
+
+PEDESTRIAN_SIGNAL_RULES = RuleTable(
+    PedestrianSignal,
+    predicates={
+        'has_button': _has_button,
+    },
+    cross_field_rules=[
+        Consistent(
+            'Button Count does not match Button Location',
+            _has_button,
+            lambda c: c['ButtonCount'] > 0),
+    ])
+
+RULE_TABLES = {
+    'Sidewalk': SIDEWALK_RULES,
+    'CurbRamp': CURB_RAMP_RULES,
+    'Crosswalk': CROSSWALK_RULES,
+    'PedestrianSignal': PEDESTRIAN_SIGNAL_RULES,
+}
+
+
+def qa_version(feature_class):
+    """
+    Return the version of the QA of a feature class: a fingerprint of the
+    sources of the data model and of the rule tables, so that stored QA
+    results are stale whenever either changes.
+    """
+
+    return fingerprint(
+        [rules_version(feature_class), rules_version(RuleTable)])
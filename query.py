@@ -0,0 +1,151 @@
+"""
+Where clauses for batch reads of Sidewalk Inventory and Assessment features.
+
+Filters are given as data model lookups, such as QAStatus__in or
+RampType, and compiled into a single SQL where clause on integer codes, so
+the database only returns the rows a job needs. A lookup that cannot be
+compiled raises an error instead of falling back to filtering rows after
+they are fetched. query_set() applies the same where clause to a query set,
+so that both paths of a job select the same rows.
+"""
+
+from cuuats.datamodel import D
+from cuuats.datamodel.query import Query
+from batch import delimit, count_rows
+
+OPERATORS = {
+    'exact': '=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+}
+
+
+def sql_value(feature_class, field_name, value):
+    """
+    Return the SQL literal for a field value. Descriptions are looked up in
+    the domain of the field.
+    """
+
+    if isinstance(value, D):
+        field = feature_class.fields[field_name]
+        codes = dict((d, c) for (c, d) in feature_class.coded_values(
+            field.domain_name).items())
+        if value.description not in codes:
+            raise ValueError('%s is not in the domain of %s.%s' % (
+                value.description, feature_class.__name__, field_name))
+        value = codes[value.description]
+    value = getattr(value, 'code', value)
+
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, long)):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, basestring):
+        return "'%s'" % (value.replace("'", "''"),)
+    raise ValueError('Cannot compile %r for %s.%s' % (
+        value, feature_class.__name__, field_name))
+
+
+def compile_lookup(feature_class, lookup, value):
+    """
+    Return the SQL condition for a lookup, such as QAStatus__in.
+    """
+
+    (field_name, _, operator) = lookup.partition('__')
+    operator = operator or 'exact'
+    if field_name not in feature_class.fields:
+        raise ValueError('%s has no field %s' % (
+            feature_class.__name__, field_name))
+    column = delimit(feature_class, field_name)
+
+    if operator == 'isnull':
+        return '%s IS %sNULL' % (column, '' if value else 'NOT ')
+    if operator == 'exact' and value is None:
+        return '%s IS NULL' % (column,)
+    if operator == 'in':
+        values = [sql_value(feature_class, field_name, v) for v in value]
+        if not values:
+            return '1 = 0'
+        return '%s IN (%s)' % (column, ', '.join(values))
+    if operator in OPERATORS:
+        return '%s %s %s' % (column, OPERATORS[operator],
+                             sql_value(feature_class, field_name, value))
+    raise ValueError('Unsupported lookup %s' % (lookup,))
+
+
+def compile_where(feature_class, filter=None, exclude=None):
+    """
+    Return a where clause selecting rows that match all of the filter
+    lookups and none of the exclude lookups, or None to select every row.
+    """
+
+    conditions = [compile_lookup(feature_class, lookup, value)
+                  for (lookup, value) in sorted((filter or {}).items())]
+    for (lookup, value) in sorted((exclude or {}).items()):
+        # NOT (...) is unknown for null values, which would drop rows where
+        # the field is null. A null is not one of the excluded values, so
+        # keep those rows.
+        (field_name, _, operator) = lookup.partition('__')
+        condition = compile_lookup(feature_class, lookup, value)
+        if operator != 'isnull' and value is not None:
+            condition = '(%s OR %s IS NULL)' % (
+                'NOT (%s)' % (condition,),
+                delimit(feature_class, field_name))
+        else:
+            condition = 'NOT (%s)' % (condition,)
+        conditions.append(condition)
+    return ' AND '.join(conditions) or None
+
+
+class WhereQuery(Query):
+    """
+    Data model query with a where clause compiled by compile_where(). Filters
+    added to the query set are combined with the where clause.
+    """
+
+    def __init__(self, fields, compiler, where_clause=None):
+        super(WhereQuery, self).__init__(fields, compiler)
+        self.where_clause = where_clause
+
+    def clone(self):
+        clone = super(WhereQuery, self).clone()
+        clone.where_clause = self.where_clause
+        return clone
+
+    @property
+    def where(self):
+        conditions = [c for c in [self.where_clause,
+                                  super(WhereQuery, self).where] if c]
+        if len(conditions) > 1:
+            return ' AND '.join(['(%s)' % (c,) for c in conditions])
+        return conditions[0] if conditions else None
+
+
+def query_set(feature_class, filter=None, exclude=None):
+    """
+    Return a query set of the features selected by compile_where(). Unlike
+    QuerySet.exclude(), excluded lookups keep rows where the field is null.
+    """
+
+    features = feature_class.objects.all()
+    query = WhereQuery(features.query.fields, features.query.compiler,
+                       compile_where(feature_class, filter, exclude))
+    query.set_order(features.query._order_by or [])
+    return features.__class__(feature_class, query)
+
+
+def explain(feature_class, where=None):
+    """
+    Return a description of a where clause and the number of rows it
+    selects, counted by the database.
+    """
+
+    rows = count_rows(feature_class, where)
+    total = count_rows(feature_class) if where else rows
+    return '%s: WHERE %s (%s of %s rows)' % (
+        feature_class.__name__, where or '(all rows)',
+        '{:,d}'.format(rows), '{:,d}'.format(total))
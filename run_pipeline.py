@@ -0,0 +1,308 @@
+"""
+Nightly pipeline runner for the Sidewalk Inventory and Assessment scripts.
+
+Each script is a stage with declared inputs and outputs: feature classes,
+zone and result layers, and summary and progress files. Before a stage runs,
+its inputs are fingerprinted; a stage whose inputs have the same
+fingerprints as after its last successful run, and whose outputs exist, is
+skipped. A stage depends on the earlier stages that write its inputs, and
+stages whose dependencies are done run concurrently in subprocesses.
+
+The fingerprints stored for a stage are those taken before it ran, so edits
+that land while the pipeline runs are processed the next night. The outputs
+of each stage are fingerprinted as soon as it finishes, and an input that
+still has the fingerprint it was last written with also counts as
+unchanged, so the edits the scripts make to their own inputs don't cause a
+rerun. Only edits that land while a stage is writing the same target can't
+be told apart from the stage's own writes.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import Queue
+from collections import OrderedDict
+from timeit import default_timer
+from fingerprint import fingerprint
+
+try:
+    import arcpy
+except ImportError:
+    # Only file targets can be fingerprinted.
+    arcpy = None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Statuses of stages that did not complete.
+FAILED = ('failed', 'blocked')
+
+
+class FileTarget(object):
+    """
+    A file read or written by a stage, fingerprinted by its contents.
+    """
+
+    def __init__(self, path):
+        self.key = path
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def fingerprint(self):
+        if not os.path.isfile(self.path):
+            return None
+        digest = hashlib.sha1()
+        with open(self.path, 'rb') as target_file:
+            for block in iter(lambda: target_file.read(1 << 20), ''):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+class TableTarget(object):
+    """
+    A table or feature class read or written by a stage. With an editor
+    tracking date field, it is fingerprinted by its row count and latest
+    edit date; otherwise by the values of every row.
+    """
+
+    def __init__(self, path, date_field=None):
+        self.key = path
+        self.path = path
+        self.date_field = date_field
+
+    def exists(self):
+        return bool(arcpy.Exists(self.path))
+
+    def fingerprint(self):
+        if not self.exists():
+            return None
+        field_names = [f.name for f in arcpy.ListFields(self.path)]
+        if self.date_field in field_names:
+            with arcpy.da.SearchCursor(
+                    self.path, ['OID@', self.date_field]) as cursor:
+                dates = [row[1] for row in cursor]
+            return fingerprint([len(dates), max(
+                [d for d in dates if d is not None] or [None])])
+
+        columns = ['OID@'] + field_names
+        if arcpy.Describe(self.path).dataType == 'FeatureClass':
+            columns.append('SHAPE@WKT')
+        digest = hashlib.sha1()
+        with arcpy.da.SearchCursor(self.path, columns) as cursor:
+            for row in cursor:
+                digest.update(repr(row))
+        return digest.hexdigest()
+
+
+class Stage(object):
+    """
+    A command with declared input and output targets. A stage that always
+    runs is never skipped.
+    """
+
+    def __init__(self, name, command, inputs=(), outputs=(), always=False):
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.always = always
+
+
+class PipelineRunner(object):
+    """
+    Runs stages in order of their dependencies, skipping stages whose inputs
+    are unchanged. The fingerprints of the inputs of each successful stage
+    before it ran, and of the outputs after it finished, are stored in a
+    JSON state file.
+    """
+
+    def __init__(self, stages, state_path, workers=2, force=False):
+        self.stages = stages
+        self.state_path = state_path
+        self.workers = max(1, workers)
+        self.force = force
+        self.state = {'inputs': {}, 'outputs': {}}
+        if state_path and os.path.exists(state_path):
+            with open(state_path, 'rb') as state_file:
+                state = json.load(state_file)
+            # State files from before outputs were tracked are ignored.
+            if 'outputs' in state:
+                self.state = state
+        # Output fingerprints of the last run, since this run replaces them
+        # in the state as stages finish.
+        self._written = dict(self.state['outputs'])
+        self._fingerprints = {}
+
+    def dependencies(self, stage):
+        """
+        Return the earlier stages that write the inputs or outputs of the
+        stage.
+        """
+
+        keys = set(t.key for t in stage.inputs + stage.outputs)
+        earlier = self.stages[:self.stages.index(stage)]
+        return [s for s in earlier if keys & set(t.key for t in s.outputs)]
+
+    def fingerprints(self, stage):
+        """
+        Return the fingerprints of the inputs of the stage, keyed by target.
+        """
+
+        for target in stage.inputs:
+            if target.key not in self._fingerprints:
+                self._fingerprints[target.key] = target.fingerprint()
+        return dict((t.key, self._fingerprints[t.key]) for t in stage.inputs)
+
+    def is_current(self, stage):
+        if self.force or stage.always:
+            return False
+        previous = self.state['inputs'].get(stage.name)
+        if previous is None or set(previous) != set(
+                t.key for t in stage.inputs):
+            return False
+        for (key, value) in self.fingerprints(stage).items():
+            if value != previous[key] and value != self._written.get(key):
+                return False
+        return all(t.exists() for t in stage.outputs)
+
+    def execute(self, stage, finished):
+        start = default_timer()
+        try:
+            status = 'miss' if subprocess.call(
+                stage.command, cwd=SCRIPT_DIR) == 0 else 'failed'
+        except OSError:
+            status = 'failed'
+        finished.put((stage, status, default_timer() - start))
+
+    def finish(self, stage, inputs):
+        """
+        Store the fingerprints of the inputs of a successful stage before
+        it ran, and of its outputs now.
+        """
+
+        self.state['inputs'][stage.name] = inputs
+        for target in stage.outputs:
+            self._fingerprints.pop(target.key, None)
+            self.state['outputs'][target.key] = target.fingerprint()
+
+    def run(self):
+        """
+        Run the stages, and return (status, seconds) pairs keyed by stage
+        name. The status is hit, miss, failed or blocked.
+        """
+
+        results = OrderedDict()
+        pending = list(self.stages)
+        running = {}
+        finished = Queue.Queue()
+
+        while pending or running:
+            for stage in list(pending):
+                statuses = [results.get(s.name, (None,))[0]
+                            for s in self.dependencies(stage)]
+                if any(s in FAILED for s in statuses):
+                    pending.remove(stage)
+                    results[stage.name] = ('blocked', 0.0)
+                elif None not in statuses and len(running) < self.workers:
+                    pending.remove(stage)
+                    start = default_timer()
+                    if self.is_current(stage):
+                        results[stage.name] = ('hit', default_timer() - start)
+                        continue
+                    print 'Running %s...' % (stage.name,)
+                    running[stage] = self.fingerprints(stage)
+                    thread = threading.Thread(
+                        target=self.execute, args=(stage, finished))
+                    thread.daemon = True
+                    thread.start()
+
+            if running:
+                (stage, status, seconds) = finished.get()
+                inputs = running.pop(stage)
+                results[stage.name] = (status, seconds)
+                if status not in FAILED:
+                    self.finish(stage, inputs)
+                else:
+                    # The outputs may have changed.
+                    for target in stage.outputs:
+                        self._fingerprints.pop(target.key, None)
+
+        self.save()
+        return OrderedDict((s.name, results[s.name]) for s in self.stages)
+
+    def save(self):
+        """
+        Write the state file.
+        """
+
+        if self.state_path:
+            with open(self.state_path, 'wb') as state_file:
+                json.dump(self.state, state_file, indent=2)
+
+
+def report(results):
+    """
+    Print the status and duration of each stage.
+    """
+
+    for (name, (status, seconds)) in results.items():
+        print '%-24s %-8s %8.1fs' % (name, status, seconds)
+
+
+def nightly_stages():
+    """
+    Return the stages of the nightly run.
+    """
+
+    from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH, \
+        ZONE_PATH, RESULT_PATH, SEGMENT_CSV, QASTATUS_CSV, EDIT_DATE_FIELD, \
+        SUMMARY_OUTPUT_PATH
+
+    def script(name, *args):
+        return [sys.executable, os.path.join(SCRIPT_DIR, name)] + list(args)
+
+    (sidewalks, curb_ramps, crosswalks, signals, segments) = [
+        TableTarget(path, EDIT_DATE_FIELD)
+        for path in (SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH)]
+    inventory = [sidewalks, curb_ramps, crosswalks, signals, segments]
+    scored = [segments, curb_ramps, crosswalks, signals]
+
+    return [
+        Stage('auto_qa', script('auto_qa.py', '--batch'), inventory,
+              inventory),
+        Stage('update_scores', script('update_scores.py', '--batch'),
+              inventory, scored),
+        Stage('aggregate_results', script('aggregate_results.py'),
+              scored + [TableTarget(ZONE_PATH)], [TableTarget(RESULT_PATH)]),
+        Stage('create_summary_tables',
+              script('create_summary_tables.py', SUMMARY_OUTPUT_PATH),
+              scored, [FileTarget(SUMMARY_OUTPUT_PATH)]),
+        # Progress is tracked daily, even when nothing has changed.
+        Stage('track_progress', script('track_progress.py'), inventory,
+              [FileTarget(SEGMENT_CSV), FileTarget(QASTATUS_CSV)],
+              always=True),
+    ]
+
+
+if __name__ == '__main__':
+    from config import PIPELINE_STATE_PATH, PIPELINE_WORKERS
+
+    parser = argparse.ArgumentParser(
+        'Run the sidewalk inventory scripts, skipping unchanged stages.')
+    parser.add_argument('-f', '--force', action='store_true', dest='force',
+                        help='run every stage even if its inputs are '
+                        'unchanged')
+    parser.add_argument('-w', '--workers', type=int, default=PIPELINE_WORKERS,
+                        help='number of stages to run at once')
+    args = parser.parse_args()
+
+    results = PipelineRunner(nightly_stages(), PIPELINE_STATE_PATH,
+                             args.workers, args.force).run()
+    report(results)
+    if any(status in FAILED for (status, seconds) in results.values()):
+        sys.exit(1)
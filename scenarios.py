@@ -0,0 +1,431 @@
+"""
+What-if scoring of the Sidewalk Inventory and Assessment.
+
+A scenario replaces some breaks scales of the data model, by name, and the
+weights of some weights fields, and gives the scores and zone means that
+would result. Scenarios are evaluated against a snapshot of each feature
+class: the scores, the values the replaced scales apply to, and the zone of
+each feature, read once and kept in memory. Nothing is written back.
+
+Many scenarios are evaluated together, with a column for each scenario.
+Weights fields are recomputed as a matrix product of their component scores
+and the weights of every scenario, so a grid of weight variants costs about
+as much as a single scenario.
+
+The uses of each scale are restated here as SCALE_USES, with the value each
+score is taken from and the condition under which the scale applies, in the
+same way the rule tables restate the QA methods. Dictionary scales and
+method fields are not rescored; their stored scores are used as is.
+"""
+
+import argparse
+import csv
+import json
+import numpy as np
+from collections import OrderedDict
+from datamodel import SidewalkSegment, CurbRamp, Crosswalk, PedestrianSignal
+from batch import calculate_scores, read_rows, stored_field_names, \
+    oid_field_name, score_field_names
+from cuuats.datamodel import WeightsField
+
+
+class Breaks(object):
+    """
+    Replacement for a breaks scale, with one more score than breaks. As in
+    BreaksScale, values up to each break get its score if right is true, and
+    values below it otherwise.
+    """
+
+    def __init__(self, breaks, scores, right=True):
+        if len(scores) != len(breaks) + 1:
+            raise ValueError('A scale needs one more score than breaks')
+        self.breaks = np.asarray(breaks, dtype=float)
+        self.scores = np.asarray(scores, dtype=float)
+        self.right = right
+
+    def score(self, values):
+        values = np.asarray(values, dtype=float)
+        scores = self.scores[np.searchsorted(
+            self.breaks, values, 'left' if self.right else 'right')]
+        scores[np.isnan(values)] = np.nan
+        return scores
+
+
+class ScaleUse(object):
+    """
+    A score field that uses a named scale, with the attribute or function
+    giving its value, and the attribute or function that is true for
+    features where the scale applies.
+    """
+
+    def __init__(self, feature_class, score_field, value, applies=None):
+        self.feature_class = feature_class
+        self.score_field = score_field
+        self.value = value
+        self.applies = applies
+
+    def _get(self, feature, getter):
+        if callable(getter):
+            return getter(feature)
+        return getattr(feature, getter)
+
+    def values(self, features):
+        """
+        Return the values of the features as an array, with NaN for nulls
+        and for features where the scale does not apply.
+        """
+
+        values = []
+        for feature in features:
+            try:
+                applies = self.applies is None or \
+                    self._get(feature, self.applies)
+                value = self._get(feature, self.value) if applies else None
+            except (TypeError, ZeroDivisionError):
+                value = None
+            values.append(value)
+        return np.array(values, dtype=float)
+
+
+def _ratio(numerator, denominator):
+    def get_ratio(feature):
+        return getattr(feature, numerator) / denominator(feature)
+    return get_ratio
+
+
+def _landing_applies(feature):
+    return feature.has_landing and not feature.is_blended_transition
+
+
+# Uses of each breaks scale by name. Where a field has conditional scales,
+# the named scale applies where its condition is the first that is true.
+SCALE_USES = {
+    'WIDTH_SCALE': [
+        ScaleUse(SidewalkSegment, 'ScoreWidth', 'Width'),
+        ScaleUse(CurbRamp, 'ScoreRampWidth', 'RampWidth'),
+        ScaleUse(Crosswalk, 'ScoreWidth', 'Width', 'has_width'),
+    ],
+    'CROSS_SLOPE_SCALE': [
+        ScaleUse(SidewalkSegment, 'ScoreSummaryCrossSlope', 'CrossSlope'),
+        ScaleUse(SidewalkSegment, 'ScoreMaxCrossSlope', 'MaxCrossSlope'),
+        ScaleUse(CurbRamp, 'ScoreRampCrossSlope', 'RampCrossSlope'),
+        ScaleUse(CurbRamp, 'ScoreGutterCrossSlope', 'GutterCrossSlope',
+                 'has_gutter'),
+        ScaleUse(CurbRamp, 'ScoreLandingSlope',
+                 lambda f: max(f.LandingRunningSlope, f.LandingCrossSlope),
+                 _landing_applies),
+        ScaleUse(CurbRamp, 'ScoreApproachCrossSlope',
+                 lambda f: max(f.LeftApproachCrossSlope,
+                               f.RightApproachCrossSlope),
+                 lambda f: f.approach_count > 0),
+        ScaleUse(Crosswalk, 'ScoreCrossSlope', 'CrossSlope',
+                 lambda f: f.is_stop_controlled and not f.is_midblock),
+    ],
+    'CROSSWALK_UNCONTROLLED_CROSS_SLOPE_SCALE': [
+        ScaleUse(Crosswalk, 'ScoreCrossSlope', 'CrossSlope',
+                 lambda f: not f.is_stop_controlled and not f.is_midblock),
+    ],
+    'RAMP_RUNNING_SLOPE_SCALE': [
+        ScaleUse(CurbRamp, 'ScoreRampRunningSlope', 'RampRunningSlope',
+                 lambda f: f.RampLength <= 15*12),
+    ],
+    'DWS_WIDTH_SCALE': [
+        ScaleUse(CurbRamp, 'ScoreDetectableWarningWidth', 'dws_coverage',
+                 lambda f: f.has_dws and f.has_gutter),
+    ],
+    'GUTTER_RUNNING_SLOPE_SCALE': [
+        ScaleUse(CurbRamp, 'ScoreGutterRunningSlope', 'GutterRunningSlope',
+                 'has_gutter'),
+    ],
+    'LANDING_DIMENSIONS_SCALE': [
+        ScaleUse(CurbRamp, 'ScoreLandingDimensions',
+                 lambda f: min(f.LandingWidth, f.LandingLength),
+                 _landing_applies),
+    ],
+    'FLARE_SLOPE_SCALE': [
+        ScaleUse(CurbRamp, 'ScoreFlareSlope', 'FlareSlope', 'has_flares'),
+    ],
+    'SIDEWALK_VERTICAL_FAULT_COUNT_SCALE': [
+        ScaleUse(SidewalkSegment, 'ScoreVerticalFaultCount',
+                 _ratio('VerticalFaultCount', lambda f: f.condition_length)),
+    ],
+    'SIDEWALK_CRACKED_PANEL_SCALE': [
+        ScaleUse(SidewalkSegment, 'ScoreCrackedPanelCount',
+                 _ratio('CrackedPanelCount',
+                        lambda f: f.condition_length * 1056)),
+    ],
+    'CURB_RAMP_VERTICAL_FAULT_COUNT_SCALE': [
+        ScaleUse(CurbRamp, 'ScorePavementFaultCount', 'PavementFaultCount'),
+    ],
+    'CURB_RAMP_CRACKED_PANEL_SCALE': [
+        ScaleUse(CurbRamp, 'ScoreCrackedPanelCount', 'CrackedPanelCount'),
+    ],
+    'OBSTRUCTION_TYPES_SCALE': [
+        ScaleUse(SidewalkSegment, 'ScoreObstructionTypes',
+                 'obstruction_types_count'),
+    ],
+    'BUTTON_HEIGHT_SCALE': [
+        ScaleUse(PedestrianSignal, 'ScoreButtonHeight', 'ButtonHeight',
+                 'has_button'),
+    ],
+}
+
+
+class Scenario(object):
+    """
+    Replacement scales, as Breaks keyed by scale name, and replacement
+    weights, as dictionaries keyed by 'FeatureClass.ScoreField'.
+    """
+
+    def __init__(self, name, scales=None, weights=None):
+        self.name = name
+        self.scales = scales or {}
+        self.weights = weights or {}
+        for scale_name in self.scales:
+            if scale_name not in SCALE_USES:
+                raise ValueError('Unknown scale: %s' % (scale_name,))
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Create a scenario from a dictionary with a name, scales as
+        dictionaries of breaks, scores and right, and weights.
+        """
+
+        return cls(data['name'], dict(
+            (name, Breaks(s['breaks'], s['scores'], s.get('right', True)))
+            for (name, s) in data.get('scales', {}).items()),
+            data.get('weights'))
+
+
+def weights_fields(feature_class):
+    """
+    Return the weights of the weights fields of a feature class, keyed by
+    field name in field order.
+    """
+
+    return OrderedDict(
+        (name, field.weights) for (name, field) in feature_class.fields.items()
+        if isinstance(field, WeightsField))
+
+
+class Snapshot(object):
+    """
+    Features of a feature class with their scores, as arrays keyed by score
+    field, and the zone of each feature. A feature crossing several zones
+    has a row in each, with the length of the feature in the zone for
+    linear features.
+    """
+
+    def __init__(self, feature_class, features, scores, feature_index=None,
+                 zone_ids=None, lengths=None, weights=None):
+        self.feature_class = feature_class
+        self.features = features
+        self.scores = dict((name, np.asarray(column, dtype=float))
+                           for (name, column) in scores.items())
+        self.weights_fields = weights or weights_fields(feature_class)
+        self.linear = lengths is not None
+        self._values = {}
+
+        # Rows are sorted by zone, so that zone totals are sums of runs.
+        if feature_index is None:
+            feature_index = np.arange(len(features))
+            zone_ids = np.zeros(len(features))
+        (self.zone_ids, zone_index) = np.unique(
+            np.asarray(zone_ids), return_inverse=True)
+        order = np.argsort(zone_index, kind='mergesort')
+        self.feature_index = np.asarray(feature_index)[order]
+        self.lengths = np.ones(len(order)) if lengths is None else \
+            np.asarray(lengths, dtype=float)[order]
+        self.starts = np.searchsorted(
+            zone_index[order], np.arange(len(self.zone_ids)))
+
+    def values(self, use):
+        if use not in self._values:
+            self._values[use] = use.values(self.features)
+        return self._values[use]
+
+
+def evaluate(snapshot, scenarios):
+    """
+    Return the scores of every scenario as a two-dimensional array for each
+    score field, with a row for each feature and a column for each scenario.
+    Scores that no scenario changes are one-dimensional.
+    """
+
+    feature_class = snapshot.feature_class
+    class_name = feature_class.__name__
+    scores = dict(snapshot.scores)
+
+    # Rescore the uses of the replaced scales. Features where the scale
+    # does not apply or its score is null keep their scores.
+    for (j, scenario) in enumerate(scenarios):
+        for (scale_name, scale) in scenario.scales.items():
+            for use in SCALE_USES[scale_name]:
+                if use.feature_class is not feature_class:
+                    continue
+                name = use.score_field
+                values = snapshot.values(use)
+                rescore = ~np.isnan(values) & ~np.isnan(snapshot.scores[name])
+                if scores[name].ndim == 1:
+                    scores[name] = np.repeat(
+                        scores[name][:, np.newaxis], len(scenarios), 1)
+                scores[name][rescore, j] = scale.score(values[rescore])
+
+    # Recompute weights fields, in field order, where a component or the
+    # weights changed. As in WeightsField, the score is the weighted sum of
+    # its components, or null if any component in the weights is null.
+    for (name, field_weights) in snapshot.weights_fields.items():
+        key = '%s.%s' % (class_name, name)
+        scenario_weights = [s.weights.get(key, field_weights)
+                            for s in scenarios]
+        components = sorted(set(c for w in scenario_weights for c in w))
+        if not any(key in s.weights for s in scenarios) and \
+                all(scores[c].ndim == 1 for c in components):
+            continue
+
+        weights = np.array([[w.get(c, 0.0) for w in scenario_weights]
+                            for c in components], dtype=float)
+        weighted = np.array([[float(c in w) for w in scenario_weights]
+                             for c in components])
+        fixed = [i for (i, c) in enumerate(components)
+                 if scores[c].ndim == 1]
+        total = np.zeros((len(snapshot.features), len(scenarios)))
+        nulls = np.zeros_like(total)
+        if fixed:
+            matrix = np.column_stack([scores[components[i]] for i in fixed])
+            missing = np.isnan(matrix)
+            total += np.dot(np.where(missing, 0.0, matrix), weights[fixed])
+            nulls += np.dot(missing.astype(float), weighted[fixed])
+        for (i, component) in enumerate(components):
+            if i not in fixed:
+                missing = np.isnan(scores[component])
+                total += np.where(missing, 0.0, scores[component]) * \
+                    weights[i]
+                nulls += missing * weighted[i]
+
+        total[nulls > 0] = np.nan
+        total[np.isnan(snapshot.scores[name])] = np.nan
+        scores[name] = total
+
+    return scores
+
+
+def zone_means(snapshot, scores):
+    """
+    Return the means of scores in each zone in snapshot.zone_ids, as a
+    two-dimensional array with a column for each scenario. Scores of linear
+    features are weighted by their length in the zone and divided by the
+    total length of the zone, as in aggregate_results.py.
+    """
+
+    if scores.ndim == 1:
+        scores = scores[:, np.newaxis]
+    if not len(snapshot.feature_index):
+        return np.empty((0, scores.shape[1]))
+    rows = scores[snapshot.feature_index]
+    valid = ~np.isnan(rows)
+    weights = snapshot.lengths[:, np.newaxis]
+    sums = np.add.reduceat(
+        np.where(valid, rows, 0.0) * weights, snapshot.starts)
+    valid_weights = np.add.reduceat(valid * weights, snapshot.starts)
+    if snapshot.linear:
+        totals = np.add.reduceat(snapshot.lengths, snapshot.starts)
+        totals = np.repeat(totals[:, np.newaxis], scores.shape[1], 1)
+    else:
+        totals = valid_weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / totals
+    means[valid_weights == 0] = np.nan
+    return means
+
+
+def read_snapshot(feature_class, zone_rows):
+    """
+    Read a snapshot of a registered feature class, with the zone of each
+    feature given as (OID, zone ID) rows, or (OID, zone ID, length) rows
+    for segments. Rows of features that weren't read are skipped.
+    """
+
+    linear = feature_class is SidewalkSegment
+    features = read_rows(
+        feature_class, None, stored_field_names(feature_class))
+    oid_name = oid_field_name(feature_class)
+    index = dict((getattr(f, oid_name), i) for (i, f) in enumerate(features))
+    scores = calculate_scores(feature_class, features)
+    score_names = score_field_names(feature_class)
+    score_matrix = np.array(
+        [scores[getattr(f, oid_name)] for f in features],
+        dtype=float).reshape((len(features), len(score_names)))
+    rows = [row for row in zone_rows if row[0] in index]
+
+    return Snapshot(
+        feature_class, features,
+        dict((name, score_matrix[:, i])
+             for (i, name) in enumerate(score_names)),
+        [index[row[0]] for row in rows],
+        [row[1] for row in rows],
+        [row[2] for row in rows] if linear else None)
+
+
+def load_snapshot(feature_class, zone_path, zone_id_field):
+    """
+    Read a snapshot of a registered feature class, with the zones in the
+    zone feature class.
+    """
+
+    import arcpy
+
+    intersect_path = r'in_memory\scenario_zones'
+    arcpy.Intersect_analysis([feature_class.path, zone_path], intersect_path)
+    # The first FID field refers to the features.
+    fid_field = arcpy.ListFields(intersect_path, 'FID_*')[0].name
+    columns = [fid_field, zone_id_field]
+    if feature_class is SidewalkSegment:
+        columns.append('SHAPE@LENGTH')
+    with arcpy.da.SearchCursor(intersect_path, columns) as cursor:
+        zone_rows = list(cursor)
+    arcpy.Delete_management(intersect_path)
+
+    return read_snapshot(feature_class, zone_rows)
+
+
+if __name__ == '__main__':
+    from config import SS_PATH, CR_PATH, CW_PATH, PS_PATH, ZONE_PATH, \
+        ZONE_ID_FIELD
+
+    parser = argparse.ArgumentParser(
+        'Compare zone scores under alternative scales and weights.')
+    parser.add_argument('scenarios',
+                        help='JSON file with a list of scenarios')
+    parser.add_argument('output', help='CSV file for the zone means')
+    parser.add_argument('-f', '--field', default='ScoreCompliance',
+                        help='score field to compare')
+    args = parser.parse_args()
+
+    with open(args.scenarios, 'rb') as scenario_file:
+        scenarios = [Scenario('Current')] + [
+            Scenario.from_json(s) for s in json.load(scenario_file)]
+
+    feature_classes = OrderedDict([
+        (SidewalkSegment, SS_PATH),
+        (CurbRamp, CR_PATH),
+        (Crosswalk, CW_PATH),
+        (PedestrianSignal, PS_PATH),
+    ])
+    with open(args.output, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['Scenario', 'Feature Type', 'Zone', args.field])
+        for (feature_class, path) in feature_classes.items():
+            print 'Reading %s' % (feature_class.__name__,)
+            feature_class.register(path)
+            snapshot = load_snapshot(feature_class, ZONE_PATH, ZONE_ID_FIELD)
+            means = zone_means(
+                snapshot, evaluate(snapshot, scenarios)[args.field])
+            if means.shape[1] == 1:
+                means = np.repeat(means, len(scenarios), 1)
+            for (j, scenario) in enumerate(scenarios):
+                for (zone_id, mean) in zip(snapshot.zone_ids, means[:, j]):
+                    writer.writerow([
+                        scenario.name, feature_class.__name__, zone_id,
+                        '' if np.isnan(mean) else '%.2f' % (mean,)])
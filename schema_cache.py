@@ -0,0 +1,100 @@
+"""
+Cache of geodatabase schema metadata for Sidewalk Inventory and Assessment
+scripts.
+
+aggregate_results.py lists the score fields of each feature class, and each
+listing is a round trip to the enterprise geodatabase. The schema cache
+stores the field lists in a local JSON file so that warm startups skip them.
+The whole cache is discarded when its format version changes or when it is
+older than its maximum age.
+
+Registration is not cached. BaseFeature.register() still lists the layer
+fields and reads the coded value domains of every feature class from the
+geodatabase: the geodatabase has no schema version or modification date to
+tell a stale cache from a current one, and QA must compare against the
+current codes.
+"""
+
+import json
+import os
+import time
+
+# Increment when the format of the cache file changes.
+SCHEMA_CACHE_VERSION = 2
+
+FIELD_ATTRIBUTES = ('name', 'aliasName', 'type', 'length', 'domain')
+
+
+class CachedField(object):
+    """
+    Field metadata with the attributes of an arcpy field.
+    """
+
+    def __init__(self, name, aliasName, type, length, domain):
+        self.name = name
+        self.aliasName = aliasName
+        self.type = type
+        self.length = length
+        self.domain = domain
+
+
+class SchemaCache(object):
+    """
+    Field lists, persisted to a JSON file. With a
+    blank path, lookups are only cached for the current run.
+    """
+
+    def __init__(self, path, max_age=24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self.changed = False
+        self.data = self._load()
+
+    def _empty(self):
+        return {
+            'version': SCHEMA_CACHE_VERSION,
+            'created': time.time(),
+            'fields': {},
+        }
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return self._empty()
+        try:
+            with open(self.path, 'rb') as cache_file:
+                data = json.load(cache_file)
+        except ValueError:
+            return self._empty()
+        if data.get('version') != SCHEMA_CACHE_VERSION or \
+                time.time() - data.get('created', 0) > self.max_age:
+            return self._empty()
+        return data
+
+    def list_fields(self, path, wildcard=None):
+        """
+        Return the fields of a table, like arcpy.ListFields.
+        """
+
+        key = '%s|%s' % (path, wildcard or '')
+        fields = self.data['fields']
+        if key not in fields:
+            import arcpy
+            fields[key] = [
+                dict((a, getattr(f, a)) for a in FIELD_ATTRIBUTES)
+                for f in arcpy.ListFields(path, wildcard)]
+            self.changed = True
+        return [CachedField(**f) for f in fields[key]]
+
+    def save(self):
+        """
+        Write the cache file if any lookups were added.
+        """
+
+        if self.path and self.changed:
+            with open(self.path, 'wb') as cache_file:
+                json.dump(self.data, cache_file, indent=2)
+            self.changed = False
+
+    def clear(self):
+        self.data = self._empty()
+        self.changed = True
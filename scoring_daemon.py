@@ -0,0 +1,334 @@
+"""
+Resident worker that keeps Sidewalk Inventory and Assessment QA and scores
+up to date as field crews sync their edits.
+
+The worker registers the feature classes once and then polls each of them
+for rows whose editor tracking date is newer than the last poll. Edited
+inventory features get automated QA and new scores, and the segments of
+edited sidewalks get their sidewalk summary fields and scores updated. The
+rows are processed in small batches, each in its own edit session.
+
+The worker's own edits also update the editor tracking dates, so its rows
+come back once in the next poll. Only changed values are written, so the
+second pass leaves them alone.
+
+The nearest segment of each edited sidewalk is found again, and the worker
+remembers the nearest segment of each sidewalk, so that a segment is also
+updated when one of its sidewalks moves to another segment or is deleted.
+Deletions leave no edit date, so they are found by comparing the number of
+sidewalks with the number the worker knows of.
+
+A poll that fails, such as on a lost database connection, is logged and
+retried at the next poll.
+"""
+
+import argparse
+import datetime
+import time
+import traceback
+from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
+    SidewalkSegment, QA, RAMP_TYPE
+from batch import read_rows, write_rows, write_scores, perform_qa, \
+    stored_field_names, score_field_names, oid_field_name, column_name, \
+    search_cursor, delimit, is_local, where_oid_in, update_segment_fields, \
+    update_segment_lengths, update_nearest_segments, count_rows, \
+    missing_fields, MAX_IN_LIST
+from qa_rules import RULE_TABLES
+from local_workspace import LocalWorkspace, EDIT_DATE_FORMAT
+from query import compile_where
+
+PREFETCH_RELS = {
+    'CurbRamp': ['attachments'],
+}
+
+
+def date_text(value):
+    """
+    Return an editor tracking date as text in EDIT_DATE_FORMAT.
+    """
+
+    if isinstance(value, datetime.datetime):
+        return value.strftime(EDIT_DATE_FORMAT)
+    return value
+
+
+class EditTracker(object):
+    """
+    Finds the rows of a feature class edited since the last poll, using an
+    editor tracking date field. Dates are compared in the where clause
+    using the date SQL template, except in a local workspace, where they
+    are stored as text.
+    """
+
+    def __init__(self, feature_class, date_field, date_sql="TIMESTAMP '%s'",
+                 since=None):
+        self.feature_class = feature_class
+        self.date_field = date_field
+        self.date_sql = date_sql
+        self.since = since
+        # Rows already seen at the date of the last poll.
+        self.seen = set()
+        if since is None:
+            # Start with the edits made after the latest edit so far.
+            edited = self.edited()
+            self.since = max([date for (oid, date) in edited] or [''])
+            self.seen = set(
+                oid for (oid, date) in edited if date == self.since)
+
+    def literal(self, value):
+        if is_local(self.feature_class):
+            return "'%s'" % (value,)
+        return self.date_sql % (value,)
+
+    def edited(self, where=None):
+        columns = [column_name(self.feature_class,
+                               oid_field_name(self.feature_class)),
+                   self.date_field]
+        with search_cursor(self.feature_class, columns, where) as cursor:
+            return [(oid, date_text(edited)) for (oid, edited) in cursor
+                    if edited is not None]
+
+    def poll(self):
+        """
+        Return the OIDs of the rows edited since the last poll.
+        """
+
+        where = None
+        if self.since:
+            where = '%s >= %s' % (delimit(self.feature_class, self.date_field),
+                                  self.literal(self.since))
+        edited = [(oid, date) for (oid, date) in self.edited(where)
+                  if date > self.since or oid not in self.seen]
+        if edited:
+            latest = max(date for (oid, date) in edited)
+            if latest > self.since:
+                self.since = latest
+                self.seen = set()
+            self.seen.update(oid for (oid, date) in edited if date == latest)
+        return sorted(oid for (oid, date) in edited)
+
+
+class ScoringWorker(object):
+    """
+    Runs QA, segment summaries and scoring on edited features.
+    """
+
+    def __init__(self, date_field, date_sql="TIMESTAMP '%s'", batch_size=500,
+                 since=None, feature_classes=None):
+        self.batch_size = min(batch_size, MAX_IN_LIST)
+        self.trackers = [
+            EditTracker(feature_class, date_field, date_sql, since)
+            for feature_class in feature_classes or [
+                Sidewalk, CurbRamp, Crosswalk, PedestrianSignal,
+                SidewalkSegment]]
+        # Nearest segment of each sidewalk, keyed by sidewalk OID.
+        self.sidewalk_segments = {}
+        if any(t.feature_class is Sidewalk for t in self.trackers):
+            self.sidewalk_segments = self.nearest_segments()
+
+    def batches(self, oids):
+        for start in xrange(0, len(oids), self.batch_size):
+            yield oids[start:start + self.batch_size]
+
+    def perform_qa(self, feature_class, oids):
+        """
+        Perform automated QA on features, and return the number of rows
+        updated.
+        """
+
+        # Deferred features and those requiring staff review are skipped,
+        # as in auto_qa.py.
+        where = compile_where(feature_class, exclude={
+            'QAStatus__in': [QA.NEEDS_STAFF_REVIEW, QA.DEFERRED]})
+        where = '(%s) AND %s' % (where, where_oid_in(feature_class, oids))
+        rows = read_rows(feature_class, where, stored_field_names(
+            feature_class), PREFETCH_RELS.get(feature_class.__name__, ()))
+
+        rule_table = RULE_TABLES.get(feature_class.__name__)
+        if rule_table is not None:
+            rule_table.perform_qa(rows)
+        else:
+            perform_qa(feature_class, rows)
+        for feature in rows:
+            feature.assign_staticid()
+        return write_rows(feature_class, rows, where)
+
+    def score(self, feature_class, oids):
+        """
+        Write the scores of features, and return the number of rows updated.
+        """
+
+        if not score_field_names(feature_class):
+            return 0
+        where = where_oid_in(feature_class, oids)
+        if feature_class is CurbRamp:
+            where = '(%s) AND %s' % (where, compile_where(
+                CurbRamp, exclude={'RampType': RAMP_TYPE.NONE}))
+        features = read_rows(
+            feature_class, where, stored_field_names(feature_class))
+        return write_scores(feature_class, features, where)
+
+    def nearest_segments(self, where=None):
+        """
+        Return the nearest segment OIDs of the sidewalks selected by the
+        where clause, keyed by sidewalk OID.
+        """
+
+        columns = [column_name(Sidewalk, oid_field_name(Sidewalk)),
+                   column_name(Sidewalk, 'NearestSegmentOID')]
+        with search_cursor(Sidewalk, columns, where) as cursor:
+            return dict((oid, segment) for (oid, segment) in cursor)
+
+    def segment_oids(self, sidewalk_oids=None):
+        """
+        Return the OIDs of the segments that the sidewalks are nearest to,
+        and of those they were nearest to before. Without sidewalk OIDs,
+        every sidewalk is read, and the segments of sidewalks that moved or
+        were deleted are returned.
+        """
+
+        previous = self.sidewalk_segments
+        if sidewalk_oids is None:
+            current = self.nearest_segments()
+            self.sidewalk_segments = current
+            sidewalk_oids = [oid for oid in set(current) | set(previous)
+                             if current.get(oid) != previous.get(oid)]
+        else:
+            current = self.nearest_segments(
+                where_oid_in(Sidewalk, sidewalk_oids))
+            previous = dict((oid, previous.pop(oid, None))
+                            for oid in sidewalk_oids)
+            self.sidewalk_segments.update(current)
+
+        segment_oids = set()
+        for oid in sidewalk_oids:
+            segment_oids.update([previous.get(oid), current.get(oid)])
+        segment_oids.discard(None)
+        return segment_oids
+
+    def run_once(self):
+        """
+        Process the rows edited since the last poll, and return the numbers
+        of rows edited and updated, keyed by feature class name.
+        """
+
+        # Failed polls are retried, so the edits found in this one are
+        # only forgotten once they have all been processed.
+        state = ([(t.since, set(t.seen)) for t in self.trackers],
+                 dict(self.sidewalk_segments))
+        try:
+            return self._run_once()
+        except Exception:
+            for (tracker, (since, seen)) in zip(self.trackers, state[0]):
+                (tracker.since, tracker.seen) = (since, seen)
+            self.sidewalk_segments = state[1]
+            raise
+
+    def _run_once(self):
+        results = {}
+        segment_oids = set()
+        for tracker in self.trackers:
+            feature_class = tracker.feature_class
+            oids = tracker.poll()
+            results[feature_class.__name__] = [len(oids), 0]
+            if feature_class is SidewalkSegment:
+                segment_oids.update(oids)
+                continue
+            for batch in self.batches(oids):
+                with feature_class.workspace.edit():
+                    updated = self.perform_qa(feature_class, batch)
+                    updated += self.score(feature_class, batch)
+                    if feature_class is Sidewalk:
+                        # Edited sidewalks may have moved to another
+                        # segment.
+                        updated += update_nearest_segments(
+                            Sidewalk, SidewalkSegment, batch)
+                        segment_oids.update(self.segment_oids(batch))
+                results[feature_class.__name__][1] += updated
+            # Deleted sidewalks have no edit date, so every sidewalk is read
+            # once fewer are left than the worker knows of.
+            if feature_class is Sidewalk and \
+                    count_rows(Sidewalk) != len(self.sidewalk_segments):
+                segment_oids.update(self.segment_oids())
+
+        # Segments are updated after the sidewalks so that their summary
+        # fields reflect the QA of the edited sidewalks. Their stored length
+        # follows any edit to their geometry.
+        for batch in self.batches(sorted(segment_oids)):
+            with SidewalkSegment.workspace.edit():
+                updated = update_segment_lengths(
+                    SidewalkSegment, where_oid_in(SidewalkSegment, batch))
+                updated += update_segment_fields(
+                    SidewalkSegment, Sidewalk, oids=batch)
+                updated += self.score(SidewalkSegment, batch)
+            results.setdefault(SidewalkSegment.__name__, [0, 0])[1] += updated
+        return results
+
+    def run(self, interval=10, cycles=None):
+        """
+        Poll for edits every interval seconds, for the given number of
+        cycles or until interrupted. Errors are logged, and the poll is
+        retried after the interval.
+        """
+
+        cycle = 0
+        try:
+            while cycles is None or cycle < cycles:
+                start = time.time()
+                try:
+                    results = self.run_once()
+                except Exception:
+                    print '%s Poll failed, retrying in %g seconds:' % (
+                        time.strftime('%H:%M:%S'), interval)
+                    traceback.print_exc()
+                    results = {}
+                for (name, (edited, updated)) in sorted(results.items()):
+                    if edited or updated:
+                        print '%s %s: %i edited, %i updated' % (
+                            time.strftime('%H:%M:%S'), name, edited, updated)
+                cycle += 1
+                time.sleep(max(0, interval - (time.time() - start)))
+        except KeyboardInterrupt:
+            print 'Stopped.'
+
+
+if __name__ == '__main__':
+    from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH, \
+        LOCAL_WORKSPACE_PATH, EDIT_DATE_FIELD, EDIT_DATE_SQL, \
+        DAEMON_POLL_INTERVAL, DAEMON_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(
+        'Update QA and scores of edited sidewalk inventory features.')
+    parser.add_argument('-i', '--interval', type=float,
+                        default=DAEMON_POLL_INTERVAL,
+                        help='seconds between polls for edits')
+    parser.add_argument('-b', '--batch-size', type=int,
+                        default=DAEMON_BATCH_SIZE, dest='batch_size',
+                        help='rows per edit session')
+    parser.add_argument('--since',
+                        help='process rows edited since this date, as '
+                        'YYYY-MM-DD HH:MM:SS, instead of only new edits')
+    args = parser.parse_args()
+
+    if LOCAL_WORKSPACE_PATH:
+        workspace = LocalWorkspace(
+            LOCAL_WORKSPACE_PATH, edit_date_field=EDIT_DATE_FIELD)
+        for feature_class in [Sidewalk, CurbRamp, Crosswalk,
+                              PedestrianSignal, SidewalkSegment]:
+            workspace.register(feature_class)
+    else:
+        Sidewalk.register(SW_PATH)
+        CurbRamp.register(CR_PATH)
+        Crosswalk.register(CW_PATH)
+        PedestrianSignal.register(PS_PATH)
+        SidewalkSegment.register(SS_PATH)
+
+    missing = missing_fields([Sidewalk, CurbRamp, Crosswalk, PedestrianSignal,
+                              SidewalkSegment])
+    if missing:
+        parser.error('missing fields %s; run migrate.py to add them' % (
+            ', '.join(missing),))
+
+    print 'Polling for edits every %g seconds...' % (args.interval,)
+    ScoringWorker(EDIT_DATE_FIELD, EDIT_DATE_SQL, args.batch_size,
+                  args.since).run(args.interval)
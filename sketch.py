@@ -0,0 +1,73 @@
+"""
+Mergeable quantile sketches of Sidewalk Inventory and Assessment scores.
+
+Scores range from 0 to 100, so a sketch keeps the total weight of the
+scores in each of a fixed set of bins, RESOLUTION wide, instead of the
+scores themselves. A sketch never holds more than one entry per bin however
+many features are added, sketches of different zones merge exactly by
+adding their bins, and a quantile is never off by more than half a bin.
+Scores that fall on a bin, such as those from a scale, are kept exactly.
+"""
+
+import numpy as np
+
+# Width of a bin, in score points.
+RESOLUTION = 0.5
+
+MAX_SCORE = 100.0
+
+BIN_COUNT = int(MAX_SCORE / RESOLUTION) + 1
+
+
+def score_bins(scores):
+    """
+    Return the bin of each score in an array, clipping scores to the range
+    of the sketch.
+    """
+
+    scores = np.clip(np.asarray(scores, dtype=float), 0.0, MAX_SCORE)
+    # Round halves up, as round() does for the scores in add().
+    return np.floor(scores / RESOLUTION + 0.5).astype(np.int64)
+
+
+class ScoreSketch(object):
+    """
+    Total weight of the scores in each bin. Features are weighted by their
+    length for linear features, and equally otherwise.
+    """
+
+    __slots__ = ('weights',)
+
+    def __init__(self):
+        self.weights = {}
+
+    def add(self, score, weight=1.0):
+        """
+        Add a score with the given weight. Null scores are skipped.
+        """
+
+        if score is None or score != score:
+            return
+        score_bin = int(round(min(max(score, 0.0), MAX_SCORE) / RESOLUTION))
+        self.weights[score_bin] = self.weights.get(score_bin, 0.0) + weight
+
+    def merge(self, other):
+        for (score_bin, weight) in other.weights.items():
+            self.weights[score_bin] = self.weights.get(score_bin, 0.0) + weight
+
+    def quantile(self, fraction):
+        """
+        Return the lowest score with at least the given fraction of the
+        total weight at or below it, or None if the sketch is empty.
+        """
+
+        total = sum(self.weights.values())
+        if not total:
+            return None
+        cumulative = 0.0
+        for score_bin in sorted(self.weights.keys()):
+            cumulative += self.weights[score_bin]
+            # Allow for rounding in the sum.
+            if cumulative >= fraction * total * (1 - 1e-9):
+                return score_bin * RESOLUTION
+        return score_bin * RESOLUTION
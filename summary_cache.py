@@ -0,0 +1,73 @@
+"""
+Cache of Sidewalk Inventory and Assessment summary tables.
+
+The summary tables of each feature type are stored in a local JSON file with
+the data version of the feature class they were built from. When the data
+version is unchanged, the stored tables are returned instead of summarizing
+the feature class again, so only the feature types whose data changed are
+rebuilt.
+"""
+
+import json
+import os
+
+# Increment when the format of the cache file changes.
+SUMMARY_CACHE_VERSION = 1
+
+
+class SummaryCache(object):
+    """
+    Summary tables by feature type, persisted to a JSON file. With a blank
+    path, nothing is cached.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self.data = self._load()
+
+    def _empty(self):
+        return {
+            'version': SUMMARY_CACHE_VERSION,
+            'sections': {},
+        }
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return self._empty()
+        try:
+            with open(self.path, 'rb') as cache_file:
+                data = json.load(cache_file)
+        except ValueError:
+            return self._empty()
+        if data.get('version') != SUMMARY_CACHE_VERSION:
+            return self._empty()
+        return data
+
+    def get(self, section, data_version):
+        """
+        Return the stored tables of a section, or None if they were built
+        from a different version of the data.
+        """
+
+        entry = self.data['sections'].get(section)
+        if entry is None or entry['data_version'] != data_version:
+            return None
+        return entry['tables']
+
+    def set(self, section, data_version, tables):
+        self.data['sections'][section] = {
+            'data_version': data_version,
+            'tables': tables,
+        }
+        self.changed = True
+
+    def save(self):
+        """
+        Write the cache file if any sections were rebuilt.
+        """
+
+        if self.path and self.changed:
+            with open(self.path, 'wb') as cache_file:
+                json.dump(self.data, cache_file, indent=2)
+            self.changed = False
@@ -2,11 +2,39 @@
 Sidewalk Inventory and Assessment tests.
 """
 
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
 import unittest
-from cuuats.datamodel import D
+from cuuats.datamodel import D, CodedValue, NumericField, OIDField, \
+    ForeignKey
 from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
-    SidewalkSegment
+    SidewalkSegment, DomainConstants, QA, has_valid_decimals
 from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH
+from qa_rules import RULE_TABLES, required_when, qa_version
+from fingerprint import fingerprint, data_version, rules_version
+from profiling import Profiler
+from benchmarks import SyntheticFeatures, local_features, local_sidewalks, \
+    run_benchmarks, run_pipeline_benchmarks
+from local_workspace import LocalWorkspace, LocalGeometry
+from schema_cache import SchemaCache
+from query import compile_where, explain, query_set
+from batch import pipeline, chunked, read_rows, stored_field_names, \
+    score_field_names, column_name, update_segment_lengths, count_query_set, \
+    missing_fields
+from checkpoint import Checkpoint
+from scoring_daemon import EditTracker, ScoringWorker
+from run_pipeline import FileTarget, Stage, PipelineRunner
+from summary_cache import SummaryCache
+from zone_hierarchy import ZoneTotals, ZoneHierarchy
+from hexbin import hex_cells, hex_center, bin_points, bin_lines
+from sketch import ScoreSketch
+from scenarios import Breaks, Scenario, Snapshot, evaluate, zone_means, \
+    read_snapshot
+from prioritize import WorstFeatures, Prioritizer
+from group_summary import GroupTally, NO_GROUP, summarize_groups
 
 CROSS_SLOPE_VALUES = [
     (0, 2.0), (2.1, 4.0), (4.1, 6.0), (6.1, 8.0), (8.1, 10.0), (10.1, 100.0)]
@@ -101,6 +129,10 @@ class TestSidewalkSegment(unittest.TestCase, BaseTestFeature):
         self._test_scores(
             'Width', 'ScoreWidth', WIDTH_VALUES, WIDTH_SCORES)
 
+    def test_condition_length(self):
+        self.feature.SegmentLength = 2640.0
+        self.assertEqual(self.feature.condition_length, 0.5)
+
     def test_score_compliance(self):
         self.feature.CrossSlope = 1.0
         self.feature.MaxCrossSlope = 12.0
@@ -155,5 +187,1126 @@ class TestCurbRamp(unittest.TestCase, BaseTestFeature):
             'DetectableWarningType', 'ScoreDetectableWarningType',
             DWS_TYPE_VALUES, DWS_TYPE_SCORES)
 
+
+class TestDomainConstants(unittest.TestCase):
+
+    def setUp(self):
+        self.constants = DomainConstants(YES='Yes', NO='No', NA='N/A')
+
+    def test_unresolved(self):
+        self.assertFalse(self.constants.resolved)
+        self.assertTrue(isinstance(self.constants.YES, D))
+
+    def test_resolve(self):
+        resolved = self.constants.resolve(
+            'YesNo', {1: 'Yes', 2: 'No', 3: 'N/A'})
+        self.assertTrue(resolved.resolved)
+        self.assertEqual(resolved.YES, 1)
+        self.assertEqual(resolved.NA, 3)
+        self.assertEqual(resolved.description(2), 'No')
+        self.assertTrue(isinstance(self.constants.YES, D))
+
+    def test_domains(self):
+        # Each domain keeps its own codes.
+        yes_no = self.constants.resolve(
+            'YesNo', {1: 'Yes', 2: 'No', 3: 'N/A'})
+        no_yes = self.constants.resolve(
+            'NoYes', {1: 'No', 2: 'Yes', 9: 'N/A'})
+        self.assertEqual((yes_no.YES, no_yes.YES), (1, 2))
+        self.assertEqual((yes_no.NA, no_yes.NA), (3, 9))
+
+    def test_missing(self):
+        self.assertRaises(ValueError, self.constants.resolve,
+                          'YesNo', {1: 'Yes', 2: 'No'})
+        yes = self.constants.only('YES').resolve('YesNo', {1: 'Yes', 2: 'No'})
+        self.assertEqual(yes.YES, 1)
+
+    def test_registration(self):
+        workspace = LocalWorkspace(':memory:')
+        workspace.add_domain('PointType', {1: 'Summary', 2: 'Driveway'})
+        workspace.add_domain('FaultSize', {1: 'None', 2: 'N/A'})
+        workspace.add_domain('Condition', {7: 'N/A', 8: 'None'})
+        workspace.add_feature_class(Sidewalk, domains={
+            'PointType': 'PointType',
+            'LargestVerticalFault': 'FaultSize',
+            'SurfaceCondition': 'Condition',
+        })
+        try:
+            # Local Issue is missing from the point type domain.
+            self.assertRaises(ValueError, workspace.register, Sidewalk)
+            workspace.add_domain(
+                'PointType', {1: 'Summary', 2: 'Driveway', 3: 'Local Issue'})
+            workspace.register(Sidewalk)
+            self.assertEqual(
+                Sidewalk.domain_constants('LargestVerticalFault').NA, 2)
+            self.assertEqual(
+                Sidewalk.domain_constants('SurfaceCondition').NA, 7)
+        finally:
+            workspace.unregister()
+        self.assertTrue(isinstance(
+            Sidewalk.domain_constants('SurfaceCondition').NA, D))
+
+
+class TestSlopeDecimals(unittest.TestCase):
+
+    def test_valid_decimals(self):
+        for value in [0, 2, 2.3, 8.3, 9.9, 10.1, 24.7, -1, 0.1 + 0.2]:
+            self.assertTrue(has_valid_decimals(value, 1), str(value))
+
+    def test_invalid_decimals(self):
+        for value in [2.35, 8.31, 0.01, 1e-05, 12.345]:
+            self.assertFalse(has_valid_decimals(value, 1), str(value))
+
+    def test_check_decimals(self):
+        field = Sidewalk.fields['CrossSlope']
+        self.assertEqual(
+            field.validate(2.35), ['Cross Slope has invalid decimals'])
+        self.assertEqual(field.validate(2.35, check_decimals=False), [])
+        self.assertEqual(
+            field.validate(2.35), ['Cross Slope has invalid decimals'])
+
+
+class TestRuleTables(unittest.TestCase):
+
+    def test_required_when(self):
+        self.assertEqual(required_when('self.is_summary'), 'is_summary')
+        self.assertEqual(
+            required_when('self.is_summary or self.is_driveway'),
+            ('is_summary', 'is_driveway'))
+        self.assertRaises(ValueError, required_when, 'self.Width > 0')
+
+    def test_predicates(self):
+        for rule_table in RULE_TABLES.values():
+            for rule in rule_table.field_rules:
+                when = rule.when if isinstance(rule.when, tuple) else \
+                    [rule.when] if rule.when else []
+                for name in when:
+                    self.assertTrue(
+                        name in rule_table.predicates,
+                        '%s.%s' % (rule_table.feature_class.__name__, name))
+
+    def test_field_names(self):
+        for rule_table in RULE_TABLES.values():
+            feature_class = rule_table.feature_class
+            for rule in rule_table.field_rules:
+                for field_name in rule.field_names:
+                    self.assertTrue(
+                        field_name in feature_class.fields,
+                        '%s.%s' % (feature_class.__name__, field_name))
+
+    def test_qa_version(self):
+        # The version follows both the data model and the rule tables.
+        version = qa_version(Sidewalk)
+        self.assertEqual(qa_version(Sidewalk), version)
+        self.assertEqual(len(version), 40)
+        self.assertNotEqual(version, rules_version(Sidewalk))
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_fingerprint(self):
+        values = [1, 2.3, None, 'Curb ramp']
+        self.assertEqual(fingerprint(values), fingerprint(list(values)))
+        self.assertNotEqual(fingerprint(values), fingerprint([1, 2.3, 0]))
+        self.assertNotEqual(fingerprint([1, None]), fingerprint([None, 1]))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_install(self):
+        class Feature(object):
+            fields = {}
+
+            def perform_qa(self):
+                return 'QA'
+
+        profiler = Profiler(sample_interval=2)
+        profiler.install(Feature)
+        for i in range(4):
+            self.assertEqual(Feature().perform_qa(), 'QA')
+        profiler.uninstall()
+        Feature().perform_qa()
+
+        self.assertEqual(profiler.sample_count, 2)
+        (name, calls, total, average) = profiler.cost_table()[0]
+        self.assertEqual((name, calls), ('Feature.perform_qa', 4))
+
+
+class TestSyntheticFeatures(unittest.TestCase):
+
+    def test_sidewalk_segments(self):
+        synthetic = SyntheticFeatures(seed=1)
+        sidewalks = synthetic.sidewalks(20)
+        segments = synthetic.sidewalk_segments(10, sidewalks)
+        self.assertEqual(len(segments), 10)
+        self.assertEqual(
+            len(set(f.OBJECTID for f in sidewalks + segments)), 30)
+        for segment in segments:
+            self.assertTrue(len(segment.sidewalk_set) <= 4)
+            self.assertTrue(segment.Shape.length > 0)
+
+    def test_run_benchmarks(self):
+        path = Sidewalk.path
+        for seed in range(3):
+            results = run_benchmarks(20, seed)
+            self.assertEqual(
+                sorted(results['SidewalkSegment']),
+                ['read', 'score', 'summarize', 'update_sidewalk_fields'])
+        results = run_pipeline_benchmarks(20, 0.0)
+        self.assertEqual(sorted(results), ['pipeline', 'sequential'])
+        self.assertEqual(Sidewalk.path, path)
+
+
+class TestLocalWorkspace(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = LocalWorkspace(':memory:')
+
+    def test_domain(self):
+        self.workspace.add_domain('YesNo', {1: 'Yes', 2: 'No'})
+        domain = self.workspace.get_domain('YesNo')
+        self.assertEqual(domain.codedValues, {1: 'Yes', 2: 'No'})
+        self.assertRaises(ValueError, self.workspace.get_domain, 'NoYes')
+
+    def test_geometry(self):
+        line = LocalGeometry.from_wkt('LINESTRING (0 0, 30 40, 30 50)')
+        self.assertEqual(line.length, 60)
+        self.assertEqual(line.distance_to((30, 45)), 0)
+        self.assertEqual(line.distance_to((0, 10)), 6)
+        self.assertEqual(
+            LocalGeometry.from_wkt(line.wkt).points, line.points)
+
+    def test_cursors(self):
+        self.workspace.add_table('Point', ['Name'], 'OBJECTID', 'SHAPE')
+        self.workspace.insert_rows('Point', ['Name', 'SHAPE@WKT'], [
+            ('A', 'POINT (1 2)'), ('B', 'POINT (3 4)')])
+        with self.workspace.edit():
+            with self.workspace.update_cursor(
+                    'Point', ['Name'], '"Name" = \'B\'') as cursor:
+                for row in cursor:
+                    cursor.updateRow(['C'])
+        with self.workspace.search_cursor(
+                'Point', ['Name', 'SHAPE@XY']) as cursor:
+            self.assertEqual(
+                list(cursor), [('A', (1, 2)), ('C', (3, 4))])
+
+    def test_registered(self):
+        workspace = local_sidewalks(':memory:', 10)
+        path = Sidewalk.path
+        with workspace.registered(Sidewalk):
+            self.assertEqual(Sidewalk.path, 'Sidewalk')
+            self.assertTrue(Sidewalk.workspace is workspace)
+            self.assertEqual(len(list(Sidewalk.objects.all())), 10)
+        self.assertEqual(Sidewalk.path, path)
+        self.assertFalse(Sidewalk.workspace is workspace)
+
+
+class TestRowFeatures(unittest.TestCase):
+
+    FEATURE_CLASSES = [Sidewalk, CurbRamp, Crosswalk, PedestrianSignal]
+
+    def setUp(self):
+        self.workspace = local_features(':memory:', self.FEATURE_CLASSES, 200)
+        for feature_class in self.FEATURE_CLASSES:
+            self.workspace.register(feature_class)
+
+    def tearDown(self):
+        self.workspace.unregister()
+
+    def features(self, feature_class):
+        related = ['attachments'] if feature_class is CurbRamp else []
+        return (list(feature_class.objects.all()),
+                read_rows(feature_class, related=related))
+
+    def test_values(self):
+        # Row features return the raw key of a foreign key, while regular
+        # features look up the related feature, so foreign keys are only
+        # compared by their stored values.
+        for feature_class in self.FEATURE_CLASSES:
+            (features, rows) = self.features(feature_class)
+            for (feature, row) in zip(features, rows):
+                for field_name in stored_field_names(feature_class):
+                    if isinstance(feature_class.fields[field_name],
+                                  ForeignKey):
+                        self.assertEqual(getattr(row, field_name),
+                                         feature.values.get(field_name))
+                        continue
+                    value = getattr(feature, field_name)
+                    self.assertEqual(getattr(row, field_name), value)
+                    self.assertEqual(row.values.get(field_name),
+                                     feature.values.get(field_name))
+                    if isinstance(value, CodedValue):
+                        self.assertEqual(
+                            getattr(row, field_name).description,
+                            value.description)
+
+    def test_query_set_columns(self):
+        # Query sets read the same stored inputs as row features, plus the
+        # stored scores that save() compares against, and no geometry.
+        for feature_class in self.FEATURE_CLASSES + [SidewalkSegment]:
+            columns = [column_name(feature_class, n) for n in
+                       stored_field_names(feature_class) +
+                       score_field_names(feature_class)]
+            self.assertEqual(
+                sorted(feature_class.objects.all().query.fields),
+                sorted(columns))
+
+    def test_query_set(self):
+        # Query sets select the same rows as batch reads, including rows
+        # where an excluded field is null.
+        with self.workspace.edit():
+            with self.workspace.update_cursor(
+                    'Sidewalk', ['OBJECTID', 'QAStatus']) as cursor:
+                for (oid, qa_status) in cursor:
+                    if oid % 5 == 0:
+                        cursor.updateRow([oid, None])
+                    elif oid % 5 == 1:
+                        cursor.updateRow([oid, self.workspace.get_coded_value(
+                            'QAStatus', 'Deferred')])
+        exclude = {'QAStatus__in': [QA.NEEDS_STAFF_REVIEW, QA.DEFERRED]}
+        features = query_set(Sidewalk, exclude=exclude)
+        rows = read_rows(Sidewalk, compile_where(Sidewalk, exclude=exclude))
+        oids = [f.OBJECTID for f in features.iterator()]
+        self.assertEqual(oids, [r.OBJECTID for r in rows])
+        self.assertEqual(count_query_set(features), len(oids))
+        self.assertIn(5, oids)
+        self.assertNotIn(1, oids)
+
+        # Further filters are combined with the where clause.
+        self.assertEqual(
+            [f.OBJECTID for f in features.filter(OBJECTID__lt=20)],
+            [oid for oid in oids if oid < 20])
+
+    def test_set_values(self):
+        row = read_rows(PedestrianSignal)[0]
+        row.SignalPresent = D('N/A')
+        self.assertEqual(row.SignalPresent.description, 'N/A')
+        row.SignalPresent = row.PedButtonLocation
+        self.assertFalse(isinstance(
+            row.row[row.FIELD_INDEX['SignalPresent']], CodedValue))
+
+    def test_perform_qa(self):
+        for feature_class in self.FEATURE_CLASSES:
+            (features, rows) = self.features(feature_class)
+            qa_fields = [feature_class.QASTATUS_FIELD,
+                         feature_class.QACOMMENT_FIELD]
+            for (feature, row) in zip(features, rows):
+                feature.perform_qa()
+                row.perform_qa()
+                self.assertEqual(
+                    [getattr(row, n) for n in qa_fields],
+                    [getattr(feature, n) for n in qa_fields],
+                    '%s %i' % (feature_class.__name__, feature.OBJECTID))
+
+    def test_rule_tables(self):
+        # The synthetic values are in range with valid decimals and codes,
+        # so some rows are given values that break those rules.
+        for feature_class in self.FEATURE_CLASSES:
+            related = ['attachments'] if feature_class is CurbRamp else []
+            by_rule = read_rows(feature_class, related=related)
+            by_feature = read_rows(feature_class, related=related)
+            for rows in (by_rule, by_feature):
+                for (index, row) in enumerate(rows):
+                    for field_name in row.FIELD_NAMES:
+                        field = feature_class.fields[field_name]
+                        if index % 7 == 0 and \
+                                getattr(field, 'max', None) is not None:
+                            setattr(row, field_name, field.max + 0.25)
+                        elif index % 7 == 1 and \
+                                getattr(field, 'min', None) is not None:
+                            setattr(row, field_name, field.min - 1)
+                        elif index % 7 == 2 and field.choices and \
+                                field_name != feature_class.QASTATUS_FIELD:
+                            setattr(row, field_name, 999)
+
+            RULE_TABLES[feature_class.__name__].perform_qa(by_rule)
+            for row in by_feature:
+                row.perform_qa()
+            qa_fields = [feature_class.QASTATUS_FIELD,
+                         feature_class.QACOMMENT_FIELD]
+            for (rule_row, feature_row) in zip(by_rule, by_feature):
+                self.assertEqual(
+                    [getattr(rule_row, n) for n in qa_fields],
+                    [getattr(feature_row, n) for n in qa_fields],
+                    '%s %i' % (feature_class.__name__, rule_row.OBJECTID))
+            comments = [getattr(r, feature_class.QACOMMENT_FIELD) or ''
+                        for r in by_rule]
+            self.assertTrue(any('out of range' in c for c in comments))
+
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        (handle, self.path) = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        os.remove(self.path)
+        self.field = {'name': 'ScoreWidth', 'aliasName': 'Width Score',
+                      'type': 'Double', 'length': 8, 'domain': ''}
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_list_fields(self):
+        cache = SchemaCache(self.path)
+        cache.data['fields']['Sidewalks|Score*'] = [self.field]
+        cache.changed = True
+        cache.save()
+
+        # A warm cache doesn't list the fields again.
+        cache = SchemaCache(self.path)
+        fields = cache.list_fields('Sidewalks', 'Score*')
+        self.assertEqual([(f.name, f.aliasName) for f in fields],
+                         [('ScoreWidth', 'Width Score')])
+        self.assertFalse(cache.changed)
+
+    def test_expired(self):
+        cache = SchemaCache(self.path)
+        cache.data['fields']['Sidewalks|Score*'] = [self.field]
+        cache.data['created'] -= 7200
+        cache.changed = True
+        cache.save()
+        cache = SchemaCache(self.path, max_age=3600)
+        self.assertEqual(cache.data['fields'], {})
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self):
+        workspace = LocalWorkspace(':memory:')
+        workspace.add_table(
+            'Feature', ['QAStatus', 'SummaryCount'], 'OBJECTID')
+        workspace.insert_rows('Feature', ['QAStatus', 'SummaryCount'], [
+            (1, 1), (2, 0), (3, 1), (4, 1), (None, 1)])
+
+        class Feature(object):
+            path = 'Feature'
+            fields = {
+                'QAStatus': NumericField('QA Status'),
+                'SummaryCount': NumericField('Summary Count'),
+            }
+
+            @classmethod
+            def coded_values(cls, domain_name):
+                return {1: 'Complete', 2: 'Needs Field Review',
+                        3: 'Needs Staff Review', 4: 'Deferred'}
+
+        Feature.workspace = workspace
+        Feature.fields['QAStatus'].domain_name = 'QAStatus'
+        self.feature_class = Feature
+
+    def assertSelects(self, where, count):
+        self.assertTrue(explain(self.feature_class, where).endswith(
+            '(%i of 5 rows)' % (count,)))
+
+    def test_exclude_in(self):
+        where = compile_where(self.feature_class, exclude={
+            'QAStatus__in': [D('Needs Staff Review'), D('Deferred')]})
+        self.assertEqual(
+            where, '(NOT ("QAStatus" IN (3, 4)) OR "QAStatus" IS NULL)')
+        self.assertSelects(where, 3)
+
+    def test_filter(self):
+        where = compile_where(
+            self.feature_class, filter={'SummaryCount': 1},
+            exclude={'QAStatus': 1})
+        self.assertEqual(
+            where, '"SummaryCount" = 1 AND '
+            '(NOT ("QAStatus" = 1) OR "QAStatus" IS NULL)')
+        self.assertSelects(where, 3)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, compile_where, self.feature_class,
+                          {'QAStatus': D('Unknown')})
+        self.assertRaises(ValueError, compile_where, self.feature_class,
+                          {'Width__gt': 36})
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = LocalWorkspace(':memory:')
+        self.workspace.add_table('Feature', ['Width'], 'OBJECTID')
+        self.workspace.insert_rows(
+            'Feature', ['Width'], [(w,) for w in range(2500)])
+
+        class Feature(object):
+            path = 'Feature'
+            fields = {
+                'OBJECTID': OIDField('OBJECTID'),
+                'Width': NumericField('Width'),
+            }
+
+        Feature.workspace = self.workspace
+        self.feature_class = Feature
+
+    def run_pipeline(self, process):
+        with self.workspace.edit():
+            return pipeline(self.feature_class, process,
+                            field_names=['OBJECTID', 'Width'], queue_size=1)
+
+    def test_pipeline(self):
+        def double_odd(batch):
+            for feature in batch:
+                if feature.Width % 2:
+                    feature.Width *= 2
+            return batch
+
+        self.assertEqual(self.run_pipeline(double_odd), (2500, 1250))
+        widths = [row[0] for row in self.workspace.connection.execute(
+            'SELECT "Width" FROM "Feature" ORDER BY "OBJECTID"')]
+        self.assertEqual(
+            widths, [w * 2 if w % 2 else w for w in range(2500)])
+
+    def test_error(self):
+        def fail(batch):
+            raise ValueError('QA failed')
+
+        self.assertRaises(ValueError, self.run_pipeline, fail)
+
+    def test_geodatabase(self):
+        # Geodatabase cursors are never opened in background threads.
+        self.feature_class.workspace = object()
+        self.assertRaisesRegexp(ValueError, 'local workspace', pipeline,
+                                self.feature_class, lambda batch: batch)
+
+
+class TestChunked(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = LocalWorkspace(':memory:')
+        self.workspace.add_table('Feature', ['Width'], 'OBJECTID')
+        self.workspace.insert_rows(
+            'Feature', ['Width'], [(w,) for w in range(2500)])
+
+        class Feature(object):
+            path = 'Feature'
+            fields = {
+                'OBJECTID': OIDField('OBJECTID'),
+                'Width': NumericField('Width'),
+            }
+
+        Feature.workspace = self.workspace
+        self.feature_class = Feature
+        self.checkpoint = Checkpoint('')
+
+    def chunks(self):
+        return chunked(self.feature_class, '"Width" < 2200', 1000,
+                       self.checkpoint, 'test')
+
+    def test_chunks(self):
+        self.assertEqual(list(self.chunks()), [
+            '("Width" < 2200) AND "OBJECTID" > %i AND "OBJECTID" <= %i' % (
+                low, low + 1000) for low in (0, 1000, 2000)])
+        self.assertEqual(self.checkpoint.data, {})
+
+    def test_resume(self):
+        chunks = []
+        try:
+            for chunk_where in self.chunks():
+                chunks.append(chunk_where)
+                if len(chunks) == 2:
+                    raise ValueError('Edit failed')
+        except ValueError:
+            pass
+        self.assertEqual(self.checkpoint.last_oid('test', 'Feature'), 1000)
+        self.assertEqual(list(self.chunks()), chunks[1:] + [
+            '("Width" < 2200) AND "OBJECTID" > 2000 AND "OBJECTID" <= 3000'])
+        self.assertIsNone(self.checkpoint.last_oid('test', 'Feature'))
+
+    def test_sparse(self):
+        # Ranges without selected rows are skipped.
+        where = '"Width" < 100 OR "Width" >= 2400'
+        self.assertEqual(list(chunked(self.feature_class, where, 1000)), [
+            '(%s) AND "OBJECTID" > %i AND "OBJECTID" <= %i' % (
+                where, low, low + 1000) for low in (0, 2400)])
+
+
+class TestScoringDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = local_sidewalks(
+            ':memory:', 50, edit_date_field='EditDate')
+        self.workspace.add_feature_class(SidewalkSegment)
+        for feature_class in [Sidewalk, SidewalkSegment]:
+            self.workspace.register(feature_class)
+
+    def tearDown(self):
+        self.workspace.unregister()
+
+    def edit(self, oids):
+        # Editing a row through an update cursor sets its edit date.
+        with self.workspace.edit():
+            with self.workspace.update_cursor(
+                    'Sidewalk', ['Width'],
+                    '"OBJECTID" IN (%s)' % (', '.join(map(str, oids)),)) \
+                    as cursor:
+                for row in cursor:
+                    cursor.updateRow([48])
+
+    def test_tracker(self):
+        self.edit([1, 2])
+        tracker = EditTracker(Sidewalk, 'EditDate')
+        self.assertEqual(tracker.poll(), [])
+        self.edit([2, 3])
+        self.assertEqual(tracker.poll(), [2, 3])
+        self.assertEqual(tracker.poll(), [])
+
+    def test_worker(self):
+        worker = ScoringWorker(
+            'EditDate', feature_classes=[Sidewalk, SidewalkSegment])
+        self.assertEqual(worker.run_once()['Sidewalk'], [0, 0])
+        self.edit([1, 2, 3])
+        self.assertEqual(worker.run_once()['Sidewalk'][0], 3)
+
+        # Rows updated by the worker come back once, unchanged.
+        (edited, updated) = worker.run_once()['Sidewalk']
+        self.assertEqual(updated, 0)
+        self.assertEqual(worker.run_once()['Sidewalk'], [0, 0])
+
+    def test_moved_sidewalks(self):
+        worker = ScoringWorker(
+            'EditDate', feature_classes=[Sidewalk, SidewalkSegment])
+        old_segment = worker.sidewalk_segments[1]
+        with self.workspace.edit():
+            self.workspace.connection.execute(
+                'UPDATE "Sidewalk" SET "NearestSegmentOID" = ? '
+                'WHERE "OBJECTID" = 1', (old_segment + 1,))
+        self.assertEqual(worker.segment_oids([1]),
+                         set([old_segment, old_segment + 1]))
+
+        # Deleted sidewalks are found by counting the sidewalks.
+        old_segment = worker.sidewalk_segments[3]
+        with self.workspace.edit():
+            self.workspace.connection.execute(
+                'DELETE FROM "Sidewalk" WHERE "OBJECTID" = 3')
+        self.assertEqual(worker.segment_oids(), set([old_segment]))
+        with self.workspace.edit():
+            self.workspace.connection.execute(
+                'DELETE FROM "Sidewalk" WHERE "OBJECTID" = 4')
+        worker.run_once()
+        self.assertNotIn(4, worker.sidewalk_segments)
+
+    def test_moved_geometry(self):
+        # Sidewalk 1 is near the first of two segments, and no other
+        # sidewalk has a segment. Segments get summary counts once they
+        # are updated.
+        self.workspace.insert_rows('SidewalkSegment', ['SHAPE@WKT'], [
+            ('LINESTRING (0 0, 100 0)',), ('LINESTRING (0 1000, 100 1000)',)])
+        with self.workspace.edit():
+            self.workspace.connection.execute(
+                'UPDATE "Sidewalk" SET "NearestSegmentOID" = NULL')
+        worker = ScoringWorker(
+            'EditDate', feature_classes=[Sidewalk, SidewalkSegment])
+
+        def move(wkt):
+            with self.workspace.edit():
+                with self.workspace.update_cursor(
+                        'Sidewalk', ['SHAPE@WKT'], '"OBJECTID" = 1') \
+                        as cursor:
+                    for row in cursor:
+                        cursor.updateRow([wkt])
+            worker.run_once()
+            connection = self.workspace.connection
+            segment = connection.execute(
+                'SELECT "NearestSegmentOID" FROM "Sidewalk" '
+                'WHERE "OBJECTID" = 1').fetchone()[0]
+            return (segment, [row[0] for row in connection.execute(
+                'SELECT "SummaryCount" FROM "SidewalkSegment" '
+                'ORDER BY "OBJECTID"')])
+
+        self.assertEqual(move('POINT (50 10)'), (1, [0, None]))
+        self.assertEqual(worker.sidewalk_segments[1], 1)
+        # Both the old and the new segment are updated.
+        self.assertEqual(move('POINT (50 990)'), (2, [0, 0]))
+        self.assertEqual(worker.sidewalk_segments[1], 2)
+
+    def test_failed_poll(self):
+        worker = ScoringWorker(
+            'EditDate', feature_classes=[Sidewalk, SidewalkSegment])
+        perform_qa = worker.perform_qa
+
+        def fail(feature_class, oids):
+            worker.perform_qa = perform_qa
+            raise IOError('Connection lost')
+
+        worker.perform_qa = fail
+        self.edit([1, 2, 3])
+        (stdout, stderr) = (sys.stdout, sys.stderr)
+        sys.stdout = sys.stderr = open(os.devnull, 'w')
+        try:
+            worker.run(interval=0, cycles=1)
+        finally:
+            (sys.stdout, sys.stderr) = (stdout, stderr)
+
+        # The edits are processed in the next poll.
+        self.assertEqual(worker.run_once()['Sidewalk'][0], 3)
+
+    def test_segment_lengths(self):
+        self.workspace.insert_rows('SidewalkSegment', ['SHAPE@WKT'], [
+            ('LINESTRING (0 0, 30 40)',), ('LINESTRING (0 0, 0 10)',)])
+        with self.workspace.edit():
+            self.assertEqual(update_segment_lengths(SidewalkSegment), 2)
+            self.assertEqual(update_segment_lengths(SidewalkSegment), 0)
+        with self.workspace.search_cursor(
+                'SidewalkSegment', ['SegmentLength']) as cursor:
+            self.assertEqual([row[0] for row in cursor], [50, 10])
+
+        # Reshaped segments are found by comparing every stored length with
+        # the length of the geometry.
+        with self.workspace.edit():
+            self.workspace.connection.execute(
+                'UPDATE "SidewalkSegment" SET "Shape" = ? '
+                'WHERE "SegmentLength" = 10', ('LINESTRING (0 0, 0 20)',))
+            self.assertEqual(update_segment_lengths(SidewalkSegment), 1)
+        with self.workspace.search_cursor(
+                'SidewalkSegment', ['SegmentLength']) as cursor:
+            self.assertEqual([row[0] for row in cursor], [50, 20])
+
+    def test_missing_fields(self):
+        self.assertEqual(missing_fields([Sidewalk, SidewalkSegment]), [])
+        self.workspace.connection.execute(
+            'ALTER TABLE "SidewalkSegment" DROP COLUMN "SegmentLength"')
+        self.assertEqual(missing_fields([Sidewalk, SidewalkSegment]),
+                         ['SidewalkSegment.SegmentLength'])
+
+
+class TestPipelineRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in ('a', 'c'):
+            self.write(name, name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def write(self, name, text):
+        with open(self.path(name), 'wb') as target_file:
+            target_file.write(text)
+
+    def copy(self, source, destination):
+        return Stage(
+            destination, [sys.executable, '-c', 'import shutil; '
+                          'shutil.copy(%r, %r)' % (self.path(source),
+                                                   self.path(destination))],
+            [FileTarget(self.path(source))],
+            [FileTarget(self.path(destination))])
+
+    def run_stages(self):
+        stages = [self.copy('a', 'b'), self.copy('b', 'd'),
+                  self.copy('c', 'e')]
+        results = PipelineRunner(stages, self.path('state.json')).run()
+        return [status for (status, seconds) in results.values()]
+
+    def test_skip_unchanged(self):
+        self.assertEqual(self.run_stages(), ['miss', 'miss', 'miss'])
+        self.assertEqual(self.run_stages(), ['hit', 'hit', 'hit'])
+        self.write('a', 'changed')
+        self.assertEqual(self.run_stages(), ['miss', 'miss', 'hit'])
+        os.remove(self.path('e'))
+        self.assertEqual(self.run_stages(), ['hit', 'hit', 'miss'])
+
+    def test_failure(self):
+        os.remove(self.path('a'))
+        self.assertEqual(self.run_stages(), ['failed', 'blocked', 'miss'])
+
+    def append(self, name, inputs, outputs):
+        return Stage(
+            name, [sys.executable, '-c', 'open(%r, "ab").write("x")' % (
+                self.path(name),)],
+            [FileTarget(self.path(n)) for n in inputs],
+            [FileTarget(self.path(n)) for n in outputs])
+
+    def test_own_writes(self):
+        # A stage that writes its own input isn't rerun for that write.
+        stages = [self.append('a', ['a'], ['a'])]
+        runner = PipelineRunner(stages, self.path('state.json'))
+        self.assertEqual(runner.run()['a'][0], 'miss')
+        runner = PipelineRunner(stages, self.path('state.json'))
+        self.assertEqual(runner.run()['a'][0], 'hit')
+
+    def test_edit_during_run(self):
+        # An edit to an input that lands after the stage read it, and isn't
+        # written by any stage, is processed in the next run.
+        stages = [self.append('a', ['a', 'c'], ['a']),
+                  self.append('c', ['a'], [])]
+        runner = PipelineRunner(stages, self.path('state.json'), workers=1)
+        self.assertEqual(
+            [r[0] for r in runner.run().values()], ['miss', 'miss'])
+        runner = PipelineRunner(stages, self.path('state.json'), workers=1)
+        self.assertEqual(runner.run()['a'][0], 'miss')
+
+
+class TestSummaryCache(unittest.TestCase):
+
+    def setUp(self):
+        (handle, self.path) = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        os.remove(self.path)
+        self.workspace = LocalWorkspace(':memory:', edit_date_field='EditDate')
+        self.workspace.add_table(
+            'Feature', ['Width', 'EditDate'], 'OBJECTID')
+        self.workspace.insert_rows(
+            'Feature', ['Width'], [(w,) for w in range(10)])
+
+        class Feature(object):
+            path = 'Feature'
+            fields = {
+                'OBJECTID': OIDField('OBJECTID'),
+                'Width': NumericField('Width'),
+            }
+
+        Feature.workspace = self.workspace
+        self.feature_class = Feature
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def version(self):
+        return data_version(self.feature_class, 'EditDate', ['ScoreWidth'])
+
+    def test_data_version(self):
+        version = self.version()
+        self.assertEqual(self.version(), version)
+        with self.workspace.edit():
+            with self.workspace.update_cursor(
+                    'Feature', ['Width'], '"OBJECTID" = 1') as cursor:
+                for row in cursor:
+                    cursor.updateRow([48])
+        self.assertNotEqual(self.version(), version)
+        self.assertNotEqual(data_version(
+            self.feature_class, 'EditDate', ['ScoreSlope']), version)
+
+    def test_cache(self):
+        tables = {'ScoreWidth': [['Width', 'Score'], ['48 inches', '100']]}
+        cache = SummaryCache(self.path)
+        self.assertIsNone(cache.get('Sidewalk', 'v1'))
+        cache.set('Sidewalk', 'v1', tables)
+        cache.save()
+
+        cache = SummaryCache(self.path)
+        self.assertEqual(cache.get('Sidewalk', 'v1'), tables)
+        self.assertIsNone(cache.get('Sidewalk', 'v2'))
+
+
+class TestZoneHierarchy(unittest.TestCase):
+
+    def test_means(self):
+        totals = ZoneTotals(2)
+        totals.add([100, None], 1, 30.0)
+        totals.add([50, 80], 1, 10.0)
+        self.assertEqual(totals.means(linear=True), [87.5, 20.0])
+        self.assertEqual(totals.length, 40.0)
+
+        totals = ZoneTotals(2)
+        totals.add([100, None], 1)
+        totals.add([50, None], 1)
+        totals.add([None, None], 0)
+        self.assertEqual(totals.means(), [75.0, None])
+        self.assertEqual(totals.count, 2)
+
+    def test_roll_up(self):
+        hierarchy = ZoneHierarchy(['tract', 'county'], [
+            ('bg1', 't1', 'c1'),
+            ('bg2', 't1', 'c1'),
+            ('bg3', 't2', 'c1'),
+        ])
+        totals = {}
+        for (zone_id, score, length) in [('bg1', 100, 10.0),
+                                         ('bg2', 40, 30.0)]:
+            totals[zone_id] = ZoneTotals(1)
+            totals[zone_id].add([score], 1, length)
+
+        results = hierarchy.roll_up(totals, 1)
+        self.assertEqual(results.keys(), ['tract', 'county'])
+        self.assertEqual(sorted(results['tract'].keys()), ['t1', 't2'])
+        self.assertEqual(results['tract']['t1'].means(True), [55.0])
+        self.assertEqual(results['tract']['t2'].means(True), [None])
+        self.assertEqual(results['tract']['t2'].count, 0)
+        self.assertEqual(results['county']['c1'].means(True), [55.0])
+        self.assertEqual(results['county']['c1'].count, 2)
+        self.assertEqual(results['county']['c1'].length, 40.0)
+
+
+class TestHexbin(unittest.TestCase):
+
+    def test_hex_cells(self):
+        (q, r) = hex_cells([0.0, 10.0, 12.0, 0.0], [0.0, 0.0, 3.0, 14.0], 10.0)
+        self.assertEqual(zip(q, r), [(0, 0), (1, 0), (1, 0), (0, 1)])
+        self.assertEqual(hex_center(0, 1, 10.0), (5 * 3**0.5, 15.0))
+
+    def test_bin_points(self):
+        scores = np.array([[100.0], [50.0], [float('nan')], [20.0]])
+        results = bin_points([0.0, 1.0, 2.0, 100.0], [0.0, 0.0, 0.0, 0.0],
+                             scores, [True, True, False, True], [10.0, 1000.0])
+        self.assertEqual(results.keys(), [10.0, 1000.0])
+        self.assertEqual(len(results[10.0]), 2)
+        self.assertEqual(results[10.0][(0, 0)].count, 2)
+        self.assertEqual(results[10.0][(0, 0)].means(), [75.0])
+        self.assertEqual(results[1000.0][(0, 0)].count, 3)
+        self.assertAlmostEqual(results[1000.0][(0, 0)].means()[0], 170 / 3.0)
+
+    def test_bin_lines(self):
+        lines = [
+            [[(-100.0, 0.0), (100.0, 0.0)]],
+            [[(0.0, 0.0), (0.0, 3.0)], [(0.0, 5.0), (4.0, 5.0)]],
+        ]
+        scores = np.array([[100.0], [40.0]])
+        results = bin_lines(lines, scores, [True, True], [10.0, 1000.0])
+
+        cells = results[10.0]
+        self.assertAlmostEqual(sum(c.length for c in cells.values()), 207.0)
+        self.assertEqual(cells[(0, 0)].count, 2)
+        self.assertEqual(sum(c.count for c in cells.values()), len(cells) + 1)
+
+        (cell,) = results[1000.0].values()
+        self.assertAlmostEqual(cell.length, 207.0)
+        self.assertEqual(cell.count, 2)
+        self.assertAlmostEqual(
+            cell.means(linear=True)[0], (200 * 100 + 7 * 40) / 207.0)
+
+
+class TestScoreSketch(unittest.TestCase):
+
+    def test_quantile(self):
+        sketch = ScoreSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        for (score, length) in [(100, 60.0), (50, 30.0), (0, 10.0),
+                                (None, 500.0), (87.5, 0.0)]:
+            sketch.add(score, length)
+        self.assertEqual(sketch.quantile(0.1), 0.0)
+        self.assertEqual(sketch.quantile(0.2), 50.0)
+        self.assertEqual(sketch.quantile(0.5), 100.0)
+        sketch.add(33.3)
+        self.assertEqual(sketch.quantile(0.1), 33.5)
+
+    def test_merge(self):
+        (first, second, combined) = (ScoreSketch(), ScoreSketch(),
+                                     ScoreSketch())
+        for score in range(0, 100, 3):
+            (first if score % 2 else second).add(score)
+            combined.add(score)
+        first.merge(second)
+        for fraction in [0.1, 0.5, 0.9]:
+            self.assertEqual(first.quantile(fraction),
+                             combined.quantile(fraction))
+
+    def test_zone_quantiles(self):
+        hierarchy = ZoneHierarchy(['county'], [('bg1', 'c1'), ('bg2', 'c1')])
+        totals = {'bg1': ZoneTotals(2, [1]), 'bg2': ZoneTotals(2, [1])}
+        totals['bg1'].add([10, 100], 1, 10.0)
+        totals['bg2'].add([10, 20], 1, 30.0)
+        county = hierarchy.roll_up(totals, 2, [1])['county']['c1']
+        self.assertEqual(county.quantiles([0.1, 0.5, 0.9]), [20, 20, 100])
+
+        scores = np.array([[100.0], [20.0], [float('nan')]])
+        cells = bin_points([0.0, 1.0, 2.0], [0.0, 0.0, 0.0], scores,
+                           [True, True, False], [10.0], [0])[10.0]
+        self.assertEqual(cells[(0, 0)].quantiles([0.5, 1.0]), [20, 100])
+
+
+class TestScenarios(unittest.TestCase):
+
+    class Crosswalk(object):
+
+        def __init__(self, width, cross_slope, has_width=True):
+            self.Width = width
+            self.CrossSlope = cross_slope
+            self.has_width = has_width
+            self.is_stop_controlled = True
+            self.is_midblock = False
+
+    def setUp(self):
+        nan = float('nan')
+        features = [
+            self.Crosswalk(48, 2),
+            self.Crosswalk(40, 5),
+            self.Crosswalk(None, 3, has_width=False),
+            self.Crosswalk(37, 9),
+        ]
+        scores = {
+            'ScoreWidth': [100, 40, 100, 20],
+            'ScoreCrossSlope': [100, 60, 80, 20],
+            'ScoreCompliance': [100, 50, 90, nan],
+        }
+        self.snapshot = Snapshot(
+            Crosswalk, features, scores, [0, 1, 2, 3], ['a', 'a', 'b', 'b'],
+            weights={'ScoreCompliance': {
+                'ScoreWidth': 0.5, 'ScoreCrossSlope': 0.5}})
+
+    def test_current(self):
+        scores = evaluate(self.snapshot, [Scenario('Current')])
+        self.assertEqual(scores['ScoreCompliance'].ndim, 1)
+        means = zone_means(self.snapshot, scores['ScoreCompliance'])
+        self.assertEqual(list(self.snapshot.zone_ids), ['a', 'b'])
+        self.assertEqual(means[:, 0].tolist(), [75, 90])
+
+    def test_scenarios(self):
+        scenarios = [
+            Scenario('Current'),
+            Scenario('Narrow', {'WIDTH_SCALE': Breaks(
+                [36, 40], [0, 50, 100], right=False)}),
+            Scenario('Slope', weights={'Crosswalk.ScoreCompliance': {
+                'ScoreWidth': 0.2, 'ScoreCrossSlope': 0.8}}),
+        ]
+        scores = evaluate(self.snapshot, scenarios)
+        self.assertEqual(scores['ScoreWidth'].tolist(), [
+            [100, 100, 100], [40, 100, 40], [100, 100, 100], [20, 50, 20]])
+        compliance = scores['ScoreCompliance']
+        self.assertEqual(compliance[:, 0].tolist()[:3], [100, 50, 90])
+        self.assertEqual(compliance[:, 1].tolist()[:3], [100, 80, 90])
+        self.assertAlmostEqual(compliance[1, 2], 56)
+        self.assertTrue(np.isnan(compliance[3]).all())
+        self.assertEqual(zone_means(self.snapshot, compliance).shape, (2, 3))
+
+    def test_weight_grid(self):
+        grid = [Scenario(str(w), weights={'Crosswalk.ScoreCompliance': {
+            'ScoreWidth': w, 'ScoreCrossSlope': 1 - w}})
+            for w in np.linspace(0, 1, 101)]
+        compliance = evaluate(self.snapshot, grid)['ScoreCompliance']
+        self.assertEqual(compliance.shape, (4, 101))
+        self.assertEqual(compliance[1, 0], 60)
+        self.assertEqual(compliance[1, 100], 40)
+
+    def test_read_snapshot(self):
+        workspace = local_features(':memory:', [Crosswalk], 20)
+        with workspace.registered(Crosswalk):
+            snapshot = read_snapshot(
+                Crosswalk, [(1, 'a'), (2, 'a'), (3, 'b'), (999, 'b')])
+            # Regular features calculate their scores when they are read.
+            expected = [f.ScoreCompliance for f in Crosswalk.objects.all()]
+        self.assertEqual(sorted(snapshot.scores),
+                         sorted(score_field_names(Crosswalk)))
+        self.assertEqual(snapshot.feature_index.tolist(), [0, 1, 2])
+        self.assertEqual(list(snapshot.zone_ids), ['a', 'b'])
+        np.testing.assert_array_equal(
+            snapshot.scores['ScoreCompliance'],
+            [np.nan if s is None else s for s in expected])
+
+
+class TestPrioritize(unittest.TestCase):
+
+    def test_worst_features(self):
+        worst = WorstFeatures(3)
+        for (oid, compliance, condition, length) in [
+                (1, 90, 80, 100.0),
+                (2, 40, 80, 100.0),
+                (3, 40, 60, 100.0),
+                (4, 40, 60, 250.0),
+                (5, 95, None, 10.0),
+                (6, 40, None, 500.0),
+                (3, 40, 60, 100.0)]:
+            worst.add(oid, compliance, condition, length)
+        self.assertEqual([row[1] for row in worst.ranked()], [4, 3, 2])
+        self.assertEqual(worst.ranked()[0], [1, 4, 40, 60, 250.0])
+
+        worst.add(7, 10)
+        self.assertEqual([row[1] for row in worst.ranked()], [7, 4, 3])
+
+    def test_prioritizer(self):
+        hierarchy = ZoneHierarchy(['Municipality'], [
+            ('bg1', 'Urbana'), ('bg2', 'Urbana'), ('bg3', 'Champaign')])
+        prioritizer = Prioritizer(2, hierarchy)
+        prioritizer.add(['bg1', 'bg2'], 1, 30, 50, 200.0)
+        prioritizer.add(['bg2'], 2, 60, 50, 100.0)
+        prioritizer.add(['bg2'], 3, 20, 50, 100.0)
+        prioritizer.add(['bg3'], 4, 80, 50, 100.0)
+        prioritizer.add(['bg3'], 5, None, None, 100.0)
+        ranked = prioritizer.ranked()
+        self.assertEqual(ranked.keys(), ['Zone', 'Municipality'])
+        self.assertEqual(
+            [row[1] for row in ranked['Zone']['bg2']], [3, 1])
+        self.assertEqual(
+            [row[1] for row in ranked['Municipality']['Urbana']], [3, 1])
+        self.assertEqual(
+            [row[1] for row in ranked['Municipality']['Champaign']], [4])
+
+
+class TestGroupSummary(unittest.TestCase):
+
+    class Level(object):
+
+        def __init__(self, value, label):
+            self.value = value
+            self.label = label
+            self.meta = {'exclude': value is None}
+
+        def __hash__(self):
+            return hash((self.value, self.label))
+
+    class Field(object):
+
+        def __init__(self, name, levels):
+            self.name = name
+            self.levels = levels
+
+        def get_levels(self):
+            return self.levels
+
+        def summarize(self, feature):
+            return self.levels[getattr(feature, self.name)]
+
+    class Feature(object):
+
+        def __init__(self, **values):
+            self.__dict__.update(values)
+
+        def eval(self, expression):
+            return eval(expression, {}, {'self': self})
+
+    class QuerySet(list):
+        pass
+
+    def test_summarize_groups(self):
+        levels = [self.Level(100, 'Good'), self.Level(0, 'Poor'),
+                  self.Level(None, 'Not Assessed')]
+        query_set = self.QuerySet([
+            self.Feature(Town='Urbana', Score=0, Miles=1.5, Yes=True),
+            self.Feature(Town='Urbana', Score=1, Miles=0.5, Yes=False),
+            self.Feature(Town='Savoy', Score=1, Miles=2.0, Yes=True),
+            self.Feature(Town=None, Score=2, Miles=1.0, Yes=True),
+        ])
+        query_set.feature_class = type('FeatureClass', (object,), {
+            'fields': {'Score': self.Field('Score', levels)}})
+        groups = summarize_groups(
+            query_set, ['Score'], 'Town', length='self.Miles',
+            yes=lambda f: int(f.Yes))
+        self.assertEqual(groups.keys(), [NO_GROUP, 'Savoy', 'Urbana'])
+        urbana = groups['Urbana']['Score']
+        self.assertEqual([l['label'] for l in urbana],
+                         ['Good', 'Poor', 'Not Assessed'])
+        self.assertEqual([l['count'] for l in urbana], [1, 1, 0])
+        self.assertEqual([l['length'] for l in urbana], [1.5, 0.5, 0])
+        self.assertEqual([l['yes'] for l in urbana], [1, 0, 0])
+        self.assertTrue(urbana[2]['exclude'])
+        self.assertEqual([l['count'] for l in groups['Savoy']['Score']],
+                         [0, 1, 0])
+
+        # Groups can also be functions of the feature.
+        towns = {0: 'Urbana', 1: 'Savoy'}
+        groups = summarize_groups(
+            query_set, ['Score'], lambda f: towns.get(f.Score))
+        self.assertEqual(groups.keys(), [NO_GROUP, 'Savoy', 'Urbana'])
+        self.assertEqual([l['count'] for l in groups['Savoy']['Score']],
+                         [0, 2, 0])
+
+    def test_group_tally(self):
+        tally = GroupTally()
+        tally.add('Urbana', True, 100.0)
+        tally.add('Urbana', False, 50.0)
+        tally.add('Urbana', True, None)
+        tally.add('Champaign', False, 20.0)
+        self.assertEqual(tally.groups(), ['Champaign', 'Urbana'])
+        self.assertEqual(tally.count('Urbana'), 3)
+        self.assertEqual(tally.count('Urbana', True), 2)
+        self.assertEqual(tally.length('Urbana'), 150.0)
+        self.assertEqual(tally.length('Champaign', True), 0.0)
+        self.assertEqual(tally.count('Savoy'), 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,37 +2,59 @@
 Sidewalk Inventory and Assessment progress tracking.
 """
 
+import argparse
 import datetime
+import os
 import re
 from prettytable import PrettyTable
+from batch import search_cursor, column_name, oid_field_name
 from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
     SidewalkSegment
 from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH, \
-    SEGMENT_CSV, QASTATUS_CSV
+    SEGMENT_CSV, QASTATUS_CSV, RUN_LOG_DIR
+from group_summary import GroupTally, NO_GROUP, group_name, nearest_segments
+from instrument import RunLog
 
+parser = argparse.ArgumentParser(
+    'Track the progress of the Sidewalk Inventory and Assessment.')
+parser.add_argument('-g', '--group-by', dest='group_by',
+                    help='also break down progress by each value of this '
+                    'sidewalk segment field, such as Municipality; other '
+                    'features without the field take the value of their '
+                    'nearest segment')
+args = parser.parse_args()
+
+if args.group_by and args.group_by not in SidewalkSegment.fields:
+    parser.error('%s is not a sidewalk segment field' % (args.group_by,))
+
+run_log = RunLog('track_progress')
 date_string = datetime.date.today().strftime('%m/%d/%Y')
 
-Sidewalk.register(SW_PATH)
-CurbRamp.register(CR_PATH)
-Crosswalk.register(CW_PATH)
-PedestrianSignal.register(PS_PATH)
-SidewalkSegment.register(SS_PATH)
+with run_log.phase('register'):
+    Sidewalk.register(SW_PATH)
+    CurbRamp.register(CR_PATH)
+    Crosswalk.register(CW_PATH)
+    PedestrianSignal.register(PS_PATH)
+    SidewalkSegment.register(SS_PATH)
+    qastatus_cv = sorted(Sidewalk.coded_values('QAStatus').items())
 
 # Calculate the percentage of segment length that is "complete."
 length_sum = [('Shape.STLength()', 'SUM')]
 sum_key = 'SUM_Shape_STLength__'
-all_seg = SidewalkSegment.objects.all()
-ft_total = all_seg.aggregate(length_sum)[sum_key]
-ft_complete = all_seg.filter(summary_count=1).aggregate(length_sum)[sum_key]
-pct_string = '%0.02f' % (100 * ft_complete / ft_total)
-print '%s percent of sidewalk segments have been collected' % (pct_string,)
+with run_log.phase('segment_progress', 'Sidewalk Segments') as phase:
+    all_seg = SidewalkSegment.objects.all()
+    with phase.cursor():
+        ft_total = all_seg.aggregate(length_sum)[sum_key]
+        ft_complete = all_seg.filter(summary_count=1).aggregate(
+            length_sum)[sum_key]
+    pct_string = '%0.02f' % (100 * ft_complete / ft_total)
+    print '%s percent of sidewalk segments have been collected' % (
+        pct_string,)
 
-with open(SEGMENT_CSV, 'a') as progress:
-    progress.write('%s,%s\n' % (date_string, pct_string))
+    with open(SEGMENT_CSV, 'a') as progress:
+        progress.write('%s,%s\n' % (date_string, pct_string))
 
 # Calculate the QA Status breakdown for each feature type.
-qastatus_domain = Sidewalk.workspace.get_domain('QAStatus')
-qastatus_cv = sorted(qastatus_domain.codedValues.items())
 qastatus_keys = [cv[0] for cv in qastatus_cv]
 qastatus_values = [cv[1] for cv in qastatus_cv]
 qastatus_headers = [re.sub(r'[^A-Z]', '', s) for s in qastatus_values]
@@ -40,14 +62,99 @@ qastatus_table = PrettyTable(['Feature'] + qastatus_headers + ['Count'])
 qastatus_row = [date_string]
 
 for fc in [Sidewalk, CurbRamp, Crosswalk, PedestrianSignal]:
-    counts = [fc.objects.filter(QAStatus=status).count() for status
-              in qastatus_keys]
-    total = fc.objects.all().count()
-    pcts = ['%0.1f%%' % (100*float(c)/float(total),) for c in counts]
-    qastatus_table.add_row([fc.name] + pcts + [total])
-    qastatus_row.extend(counts + [total])
+    with run_log.phase('qa_status', fc.name) as phase:
+        with phase.cursor():
+            counts = [fc.objects.filter(QAStatus=status).count() for status
+                      in qastatus_keys]
+            total = fc.objects.all().count()
+        phase.rows_read = total
+        pcts = ['%0.1f%%' % (100*float(c)/float(total),) for c in counts]
+        qastatus_table.add_row([fc.name] + pcts + [total])
+        qastatus_row.extend(counts + [total])
 
 print qastatus_table
 
 with open(QASTATUS_CSV, 'a') as progress:
     progress.write('%s\n' % (','.join([str(v) for v in qastatus_row]),))
+
+if args.group_by:
+    # Every group is counted in one pass over each feature class. Features
+    # without the group field take the group of their nearest segment, from
+    # their nearest segment field or else from a near table.
+    segment_groups = {}
+    segment_tally = GroupTally()
+    columns = [column_name(SidewalkSegment, oid_field_name(SidewalkSegment)),
+               column_name(SidewalkSegment, args.group_by),
+               column_name(SidewalkSegment, 'SummaryCount'),
+               'SHAPE@LENGTH']
+    with run_log.phase('group_progress', 'Sidewalk Segments') as phase, \
+            search_cursor(SidewalkSegment, columns) as cursor:
+        for (oid, group, summary_count, length) in phase.read(cursor):
+            group = segment_groups[oid] = group_name(group)
+            segment_tally.add(group, summary_count == 1, length)
+
+    qastatus_tallies = []
+    for fc in [Sidewalk, CurbRamp, Crosswalk, PedestrianSignal]:
+        via_segment = args.group_by not in fc.fields
+        nearest = None
+        if not via_segment:
+            columns = [column_name(fc, args.group_by)]
+        elif 'NearestSegmentOID' in fc.fields:
+            columns = [column_name(fc, 'NearestSegmentOID')]
+        else:
+            columns = [column_name(fc, oid_field_name(fc))]
+        tally = GroupTally()
+        with run_log.phase('group_qa_status', fc.name) as phase:
+            if via_segment and 'NearestSegmentOID' not in fc.fields:
+                with phase.cursor():
+                    nearest = nearest_segments(fc, SidewalkSegment)
+            with search_cursor(fc, columns + ['QAStatus']) as cursor:
+                for (group, status) in phase.read(cursor):
+                    if nearest is not None:
+                        group = nearest.get(group)
+                    if via_segment:
+                        group = segment_groups.get(group, NO_GROUP)
+                    tally.add(group_name(group), status)
+        qastatus_tallies.append((fc, tally))
+
+    groups = set(segment_tally.groups())
+    for (fc, tally) in qastatus_tallies:
+        groups.update(tally.groups())
+
+    (base, ext) = os.path.splitext(SEGMENT_CSV)
+    segment_group_csv = '%s_%s%s' % (base, args.group_by, ext)
+    (base, ext) = os.path.splitext(QASTATUS_CSV)
+    qastatus_group_csv = '%s_%s%s' % (base, args.group_by, ext)
+    segment_rows = []
+    qastatus_rows = []
+
+    for group in sorted(groups):
+        ft_total = segment_tally.length(group)
+        pct_string = '%0.02f' % (
+            100 * segment_tally.length(group, True) / ft_total
+            if ft_total else 0.0,)
+        print '%s: %s percent of sidewalk segments have been collected' % (
+            group, pct_string)
+        segment_rows.append([date_string, group, pct_string])
+
+        group_table = PrettyTable(['Feature'] + qastatus_headers + ['Count'])
+        qastatus_row = [date_string, group]
+        for (fc, tally) in qastatus_tallies:
+            counts = [tally.count(group, status) for status in qastatus_keys]
+            total = tally.count(group)
+            pcts = ['%0.1f%%' % (100*float(c)/float(total) if total else 0.0,)
+                    for c in counts]
+            group_table.add_row([fc.name] + pcts + [total])
+            qastatus_row.extend(counts + [total])
+        print group_table
+        qastatus_rows.append(qastatus_row)
+
+    for (path, rows) in [(segment_group_csv, segment_rows),
+                         (qastatus_group_csv, qastatus_rows)]:
+        with open(path, 'a') as progress:
+            for row in rows:
+                progress.write('%s\n' % (
+                    ','.join([unicode(v).encode('utf-8') for v in row]),))
+
+run_log.report()
+run_log.save(RUN_LOG_DIR)
@@ -2,37 +2,197 @@
 Update scores for Sidewalk Inventory and Assessment features.
 """
 
+import argparse
 from datamodel import Sidewalk, CurbRamp, Crosswalk, PedestrianSignal, \
-    SidewalkSegment, D
-from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH
+    SidewalkSegment, RAMP_TYPE
+from config import SW_PATH, CR_PATH, CW_PATH, PS_PATH, SS_PATH, \
+    RUN_LOG_DIR, LOCAL_WORKSPACE_PATH, EDIT_CHUNK_SIZE, EDIT_CHECKPOINT_PATH
 from utils import display_progress
+from batch import read_rows, write_scores, stored_field_names, \
+    update_segment_fields, update_segment_lengths, calculate_scores, \
+    pipeline, where_oid_in, chunked, count_query_set, missing_fields
+from checkpoint import Checkpoint
+from instrument import RunLog
+from local_workspace import LocalWorkspace
+from profiling import Profiler, profiled
+from query import compile_where, explain, query_set
+
+# Parse command line arguments.
+parser = argparse.ArgumentParser('Update sidewalk inventory scores.')
+parser.add_argument('--profile', action='store_true', dest='profile',
+                    help='time scoring methods and score fields and profile '
+                    'a sample of calls')
+parser.add_argument('--batch', action='store_true', dest='batch',
+                    help='read only the score inputs into row-backed '
+                    'features and write only the changed scores')
+parser.add_argument('--pipeline', action='store_true', dest='pipeline',
+                    help='with --batch and a local workspace, read and '
+                    'write rows in background threads while scores are '
+                    'calculated')
+parser.add_argument('--chunk-size', type=int, default=EDIT_CHUNK_SIZE,
+                    dest='chunk_size',
+                    help='with --batch, commit scores in ranges of this many '
+                    'OIDs and resume after the last committed range')
+parser.add_argument('--restart', action='store_true', dest='restart',
+                    help='ignore the checkpoint of a failed chunked run')
+parser.add_argument('--explain', action='store_true', dest='explain',
+                    help='print the where clause of each batch read and the '
+                    'number of rows it selects')
+args = parser.parse_args()
+
+if LOCAL_WORKSPACE_PATH and not args.batch:
+    parser.error('a local workspace can only be used with --batch')
+if args.pipeline and not args.batch:
+    parser.error('--pipeline can only be used with --batch')
+if args.pipeline and not LOCAL_WORKSPACE_PATH:
+    parser.error('--pipeline can only be used with a local workspace')
+
+CHECKPOINT_JOB = 'update_scores'
+
+run_log = RunLog('update_scores')
+checkpoint = Checkpoint(EDIT_CHECKPOINT_PATH)
 
 # Register features.
-Sidewalk.register(SW_PATH)
-CurbRamp.register(CR_PATH)
-Crosswalk.register(CW_PATH)
-PedestrianSignal.register(PS_PATH)
-SidewalkSegment.register(SS_PATH)
+with run_log.phase('register'):
+    if LOCAL_WORKSPACE_PATH:
+        workspace = LocalWorkspace(LOCAL_WORKSPACE_PATH)
+        for feature_class in [Sidewalk, CurbRamp, Crosswalk,
+                              PedestrianSignal, SidewalkSegment]:
+            workspace.register(feature_class)
+    else:
+        Sidewalk.register(SW_PATH)
+        CurbRamp.register(CR_PATH)
+        Crosswalk.register(CW_PATH)
+        PedestrianSignal.register(PS_PATH)
+        SidewalkSegment.register(SS_PATH)
+
+missing = missing_fields([Sidewalk, CurbRamp, Crosswalk, PedestrianSignal,
+                          SidewalkSegment])
+if missing:
+    parser.error('missing fields %s; run migrate.py to add them' % (
+        ', '.join(missing),))
+
+profiler = None
+if args.profile:
+    profiler = Profiler()
+    for feature_class in [Sidewalk, CurbRamp, Crosswalk, PedestrianSignal,
+                          SidewalkSegment]:
+        profiler.install(feature_class)
+
+
+def save_scores(phase, query_set, label, update_fields=False):
+    # Query sets load every feature before the first one is returned, so
+    # features are streamed from the cursor unless the segment fields need
+    # the prefetched sidewalks.
+    total = count_query_set(query_set)
+    if not update_fields:
+        query_set = query_set.iterator()
+    update_count = 0
+    for feature in display_progress(
+            phase.read(profiled(profiler, query_set, label)), label,
+            total=total):
+        if update_fields:
+            feature.update_sidewalk_fields()
+        with phase.cursor():
+            update_count += int(feature.save())
+    phase.rows_written = update_count
+
+
+def write_row_scores(phase, feature_class, where=None):
+    if args.explain:
+        print explain(feature_class, where)
+    if args.restart:
+        checkpoint.clear(CHECKPOINT_JOB, feature_class.__name__)
+
+    # Segments use their stored length, so no geometry is read.
+    field_names = stored_field_names(feature_class)
+
+    # Scores are calculated here while background threads read the next
+    # batch and write the scores of the previous one.
+    def score(batch):
+        return (batch, calculate_scores(feature_class, batch))
+
+    def write(item):
+        (batch, scores) = item
+        return write_scores(feature_class, batch, where_oid_in(
+            feature_class, scores.keys()), scores)
+
+    for chunk_where in chunked(feature_class, where, args.chunk_size,
+                               checkpoint, CHECKPOINT_JOB):
+        with feature_class.workspace.edit():
+            if args.pipeline:
+                (rows_read, rows_written) = pipeline(
+                    feature_class, score, write, chunk_where, field_names)
+                phase.rows_read += rows_read
+                phase.rows_written += rows_written
+                continue
+
+            with phase.cursor():
+                features = read_rows(feature_class, chunk_where, field_names)
+            phase.rows_read += len(features)
+            phase.rows_written += write_scores(
+                feature_class, features, chunk_where)
+
+
+# Compare the stored length of every segment with the length of its
+# geometry before the segments are scored, so that new and reshaped
+# segments are scored by their current length. Only the geometry length is
+# read, and only the changed lengths are written.
+with run_log.phase('segment_lengths', 'Sidewalks') as phase, \
+        SidewalkSegment.workspace.edit():
+    if args.explain:
+        print explain(SidewalkSegment)
+    phase.rows_written = update_segment_lengths(SidewalkSegment)
 
 # Perform scoring.
 print 'Scoring features...'
-with SidewalkSegment.workspace.edit():
-    sidewalk_segments = SidewalkSegment.objects.prefetch_related(
-        'sidewalk_set')
-    for feature in display_progress(sidewalk_segments, 'Sidewalks'):
-        feature.update_sidewalk_fields()
-        feature.save()
-
-with CurbRamp.workspace.edit():
-    curb_ramps = CurbRamp.objects.exclude(RampType=D('None'))
-    for cr in display_progress(curb_ramps, 'Curb Ramps'):
-        cr.save()
-
-with Crosswalk.workspace.edit():
-    for cw in display_progress(Crosswalk.objects.all(), 'Crosswalks'):
-        cw.save()
-
-with PedestrianSignal.workspace.edit():
-    for ps in display_progress(
-            PedestrianSignal.objects.all(), 'Pedestrian Signals'):
-        ps.save()
+if args.batch:
+    with run_log.phase('segment_fields', 'Sidewalks') as phase, \
+            SidewalkSegment.workspace.edit():
+        phase.rows_written = update_segment_fields(SidewalkSegment, Sidewalk)
+
+    # Scores are committed in chunks of OIDs, each in its own edit
+    # session.
+    with run_log.phase('scoring', 'Sidewalks') as phase:
+        write_row_scores(phase, SidewalkSegment)
+
+    with run_log.phase('scoring', 'Curb Ramps') as phase:
+        write_row_scores(phase, CurbRamp, compile_where(
+            CurbRamp, exclude={'RampType': RAMP_TYPE.NONE}))
+
+    for (label, feature_class) in [
+            ('Crosswalks', Crosswalk),
+            ('Pedestrian Signals', PedestrianSignal)]:
+        with run_log.phase('scoring', label) as phase:
+            write_row_scores(phase, feature_class)
+else:
+    # Query sets read the same columns as --batch: geometry is a deferred
+    # field that is never fetched once segment lengths are stored, and the
+    # stored scores are read so that save() only writes changed rows.
+    with run_log.phase('scoring', 'Sidewalks') as phase, \
+            SidewalkSegment.workspace.edit():
+        sidewalk_segments = SidewalkSegment.objects.prefetch_related(
+            'sidewalk_set')
+        save_scores(phase, sidewalk_segments, 'Sidewalks',
+                    update_fields=True)
+
+    with run_log.phase('scoring', 'Curb Ramps') as phase, \
+            CurbRamp.workspace.edit():
+        curb_ramps = query_set(
+            CurbRamp, exclude={'RampType': RAMP_TYPE.NONE})
+        save_scores(phase, curb_ramps, 'Curb Ramps')
+
+    with run_log.phase('scoring', 'Crosswalks') as phase, \
+            Crosswalk.workspace.edit():
+        save_scores(phase, Crosswalk.objects.all(), 'Crosswalks')
+
+    with run_log.phase('scoring', 'Pedestrian Signals') as phase, \
+            PedestrianSignal.workspace.edit():
+        save_scores(phase, PedestrianSignal.objects.all(),
+                    'Pedestrian Signals')
+
+run_log.report()
+run_log.save(RUN_LOG_DIR)
+
+if profiler is not None:
+    profiler.report()
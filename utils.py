@@ -3,26 +3,65 @@ Utilities for the Sidewalk Inventory and Assessment.
 """
 
 import sys
+import time
 from math import floor
 
 
-def display_progress(iterable, label, label_length=20, bar_length=50,
-                     bar_character='#'):
+def format_duration(seconds):
+    """
+    Format a number of seconds as H:MM:SS.
+    """
+
+    seconds = int(seconds)
+    return '%i:%02i:%02i' % (seconds // 3600, seconds % 3600 // 60,
+                             seconds % 60)
+
+
+def display_progress(iterable, label, total=None, label_length=20,
+                     bar_length=50, bar_character='#', interval=0.5):
     """
     Display a progress bar while iterating over the iterable.
+
+    The total number of items is only taken from the iterable if it is a
+    list or tuple; lazy iterables such as query set iterators are never
+    forced to load up front, so pass a total counted by the database (such
+    as batch.count_query_set()) for those.
+    Without a total, the number of items processed and the throughput are
+    displayed instead of a bar. The display is updated at most once per
+    interval seconds.
     """
 
-    pct = None
-    total = len(iterable)
+    if total is None and isinstance(iterable, (list, tuple)):
+        total = len(iterable)
+
+    start = time.time()
+    last_write = None
+    i = 0
     for i, item in enumerate(iterable, start=1):
         yield item
-        new_pct = int(floor(100*float(i)/total))
-        if new_pct != pct:
-            pct = new_pct
-            chars = int(floor(bar_length*float(pct)/100))
-            bar_text = '\r{label: <{llen}} [{bar: <{blen}}] {pct}%'.format(
-                label=label, llen=label_length, bar=bar_character * chars,
-                blen=bar_length, pct=pct)
-            sys.stdout.write(bar_text)
-            sys.stdout.flush()
+        now = time.time()
+        if last_write is None or now - last_write >= interval:
+            last_write = now
+            _write_progress(label, i, total, now - start, label_length,
+                            bar_length, bar_character)
+    _write_progress(label, i, total, time.time() - start, label_length,
+                    bar_length, bar_character)
     sys.stdout.write('\n')
+
+
+def _write_progress(label, count, total, elapsed, label_length, bar_length,
+                    bar_character):
+    rate = count / elapsed if elapsed > 0 else 0
+    if total:
+        pct = min(100, int(floor(100*float(count)/total)))
+        chars = int(floor(bar_length*float(pct)/100))
+        eta = (total - count) / rate if rate > 0 else 0
+        text = '[{bar: <{blen}}] {pct}% {rate:,.0f}/s ETA {eta}'.format(
+            bar=bar_character * chars, blen=bar_length, pct=pct, rate=rate,
+            eta=format_duration(max(0, eta)))
+    else:
+        text = '{count:,d} rows {rate:,.0f}/s {elapsed}'.format(
+            count=count, rate=rate, elapsed=format_duration(elapsed))
+    sys.stdout.write('\r{label: <{llen}} {text}'.format(
+        label=label, llen=label_length, text=text))
+    sys.stdout.flush()
@@ -0,0 +1,135 @@
+"""
+Roll-up of Sidewalk Inventory and Assessment scores through a zone
+hierarchy.
+
+Features are assigned once to the finest zones, such as block groups. The
+totals of each finest zone are then added to the zones that contain it at
+every level of the hierarchy, such as tracts, municipalities and the county,
+using a hierarchy table that lists the zone of each finest zone at each
+level. Scores are kept as sums until the end, so every level gets exact
+length-weighted means for linear features and means for point features
+without another overlay. Quantile sketches of selected scores are merged
+the same way.
+"""
+
+from collections import OrderedDict
+from sketch import ScoreSketch
+
+try:
+    import arcpy
+except ImportError:
+    # Hierarchies can only be created from rows.
+    arcpy = None
+
+
+class ZoneTotals(object):
+    """
+    Running totals of the scores of one feature class in one zone, with a
+    quantile sketch of each sketched score, given by its index.
+    """
+
+    __slots__ = ('count', 'length', 'sums', 'weights', 'sketched',
+                 'sketches')
+
+    def __init__(self, size, sketched=()):
+        self.count = 0
+        self.length = 0.0
+        self.sums = [0.0] * size
+        self.weights = [0.0] * size
+        self.sketched = tuple(sketched)
+        self.sketches = [ScoreSketch() for i in self.sketched]
+
+    def add(self, scores, counted, length=None):
+        """
+        Add a feature, or the part of a linear feature with the given length
+        in the zone. Null scores are skipped.
+        """
+
+        weight = 1.0 if length is None else length
+        for (i, score) in enumerate(scores):
+            if score is not None:
+                self.sums[i] += score * weight
+                self.weights[i] += weight
+        for (i, sketch) in zip(self.sketched, self.sketches):
+            sketch.add(scores[i], weight)
+        self.count += counted
+        self.length += length or 0.0
+
+    def merge(self, other):
+        self.count += other.count
+        self.length += other.length
+        for i in xrange(len(self.sums)):
+            self.sums[i] += other.sums[i]
+            self.weights[i] += other.weights[i]
+        for (sketch, other_sketch) in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+
+    def means(self, linear=False):
+        """
+        Return the mean of each score, or None if no feature has the score.
+        Scores of linear features are divided by the total length in the
+        zone, as with the Sum merge rule in the spatial join.
+        """
+
+        if linear:
+            return [None if not w or not self.length else s / self.length
+                    for (s, w) in zip(self.sums, self.weights)]
+        return [None if not w else s / w
+                for (s, w) in zip(self.sums, self.weights)]
+
+    def quantiles(self, fractions):
+        """
+        Return the given quantiles of each sketched score, in order.
+        """
+
+        return [sketch.quantile(fraction) for sketch in self.sketches
+                for fraction in fractions]
+
+
+class ZoneHierarchy(object):
+    """
+    The zone at each level that contains each finest zone.
+    """
+
+    def __init__(self, levels, rows):
+        """
+        Levels are names, and each row is the ID of a finest zone followed
+        by the ID of its zone at each level.
+        """
+
+        self.levels = list(levels)
+        self.parents = dict((row[0], row[1:]) for row in rows)
+
+    def roll_up(self, totals, size, sketched=()):
+        """
+        Add up the totals of the finest zones, keyed by zone ID, for every
+        level. Return the totals keyed by level and zone ID, including zones
+        without any features. Sketched scores are given by their index.
+        """
+
+        results = OrderedDict(
+            (level, OrderedDict()) for level in self.levels)
+        for (zone_id, parents) in sorted(self.parents.items()):
+            zone_totals = totals.get(zone_id)
+            for (level, parent_id) in zip(self.levels, parents):
+                if parent_id is None:
+                    continue
+                level_totals = results[level].get(parent_id)
+                if level_totals is None:
+                    level_totals = results[level][parent_id] = ZoneTotals(
+                        size, sketched)
+                if zone_totals is not None:
+                    level_totals.merge(zone_totals)
+        return results
+
+
+def read_hierarchy(path, zone_id_field, levels):
+    """
+    Read the zone at each level that contains each finest zone from a zone
+    hierarchy table. Levels are (name, hierarchy table field, ...) tuples,
+    as in ZONE_LEVELS.
+    """
+
+    field_names = [zone_id_field] + [level[1] for level in levels]
+    with arcpy.da.SearchCursor(path, field_names) as cursor:
+        return ZoneHierarchy([level[0] for level in levels], list(cursor))